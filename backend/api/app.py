@@ -27,6 +27,8 @@ from backend.utils.spotify_integration import SpotifyManager
 from backend.models.recommendation_engine import RecommendationEngine
 from backend.models.user_manager import UserManager
 from backend.models.emotion_analyzer import EmotionAnalyzer
+from backend.models.rating_ingestor import RatingIngestor
+from backend.models.recommendation_cache import RecommendationCache
 
 # 配置日志
 logging.basicConfig(
@@ -86,6 +88,9 @@ SVD_N_EPOCHS = int(os.environ.get('SVD_N_EPOCHS', 20))  # SVD模型训练轮数
 SVD_REG_ALL = float(os.environ.get('SVD_REG_ALL', 0.05))  # SVD模型正则化参数
 CONTENT_WEIGHT = float(os.environ.get('CONTENT_WEIGHT', 0.3))  # 混合推荐中内容推荐的权重
 SAMPLE_SIZE = int(os.environ.get('SAMPLE_SIZE', 0)) if os.environ.get('SAMPLE_SIZE') else None  # 数据采样大小，None表示使用全部数据
+RATING_SYNC_INTERVAL = float(os.environ.get('RATING_SYNC_INTERVAL', 5))  # SQLite评分同步到推荐引擎的轮询间隔(秒)
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 10000))  # 推荐结果缓存的最大条目数
+RECOMMENDATION_CACHE_TTL = float(os.environ.get('RECOMMENDATION_CACHE_TTL', 600))  # 推荐结果缓存的过期时间(秒)
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', '')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', '')
 
@@ -234,6 +239,30 @@ logger.info("Spotify管理器初始化完成")
 # 数据库连接路径统一使用相对路径
 DB_PATH = '../../music_recommender.db'
 
+# 按用户缓存最终推荐结果，用户评分同步到推荐引擎或模型版本变化时失效
+recommendation_cache = RecommendationCache(
+    max_entries=RECOMMENDATION_CACHE_SIZE,
+    ttl=RECOMMENDATION_CACHE_TTL,
+    version_fn=lambda: recommender.model_version
+)
+recommender.add_rating_listener(recommendation_cache.invalidate_users)
+
+# 启动SQLite评分增量同步，新评分无需重启即可影响推荐
+logger.info("启动评分增量同步...")
+rating_ingestor = RatingIngestor(DB_PATH, recommender, interval=RATING_SYNC_INTERVAL)
+rating_ingestor.start()
+
+def _sync_user_ratings(user_id):
+    """把刚提交的评分变更立即同步到推荐引擎，再使该用户的推荐缓存失效
+    
+    先同步再失效，之后的请求才会基于新评分重新计算，而不是把旧矩阵算出的结果再次缓存
+    """
+    try:
+        rating_ingestor.poll_once()
+    except Exception as e:
+        logger.error(f"同步用户 {user_id} 的评分时出错: {str(e)}")
+    recommendation_cache.invalidate_users([user_id])
+
 @app.route('/')
 def home():
     """提供前端页面"""
@@ -483,35 +512,50 @@ def rate_song_api():
     
     conn.commit()
     conn.close()
+    _sync_user_ratings(user_id)
     
     return jsonify({'message': '评分成功'})
 
 @app.route('/api/recommendations/<user_id>')
 def user_recommendations(user_id):
-    """获取用户推荐歌曲，并用Spotify数据丰富结果"""
-    logger.info(f"为用户 {user_id} 生成推荐")
+    """获取用户推荐歌曲，并用Spotify数据丰富结果
+    
+    结果按用户缓存，评分或反馈变化后重新计算
+    """
     try:
-        # 从推荐引擎获取推荐
-        recommendations = recommender.get_hybrid_recommendations(user_id, top_n=10)
-        
-        # 如果没有足够的推荐（如新用户），补充热门歌曲
-        if len(recommendations) < 10:
-            logger.info(f"用户 {user_id} 推荐数量不足，补充热门歌曲")
-            popular_songs = recommender.get_popular_songs(top_n=10-len(recommendations))
-            recommendations.extend(popular_songs)
-        
-        # 用Spotify数据丰富推荐结果
-        enhanced_recommendations = []
-        for rec in recommendations:
-            enhanced_rec = spotify_manager.enrich_recommendation(rec)
-            enhanced_recommendations.append(enhanced_rec)
-        
-        logger.info(f"成功为用户 {user_id} 生成 {len(enhanced_recommendations)} 条推荐")
+        enhanced_recommendations = recommendation_cache.get_or_compute(
+            user_id, 'hybrid', lambda: _compute_user_recommendations(user_id))
         return jsonify(enhanced_recommendations)
     except Exception as e:
         logger.error(f"生成推荐时出错: {str(e)}", exc_info=True)
         return jsonify({'error': '生成推荐时出错'}), 500
 
+def _compute_user_recommendations(user_id, top_n=10):
+    """生成用户的混合推荐，不足时补充热门歌曲，并用Spotify数据丰富结果"""
+    logger.info(f"为用户 {user_id} 生成推荐")
+    # 从推荐引擎获取推荐
+    recommendations = recommender.get_hybrid_recommendations(user_id, top_n=top_n)
+    
+    # 如果没有足够的推荐（如新用户），补充热门歌曲
+    if len(recommendations) < top_n:
+        logger.info(f"用户 {user_id} 推荐数量不足，补充热门歌曲")
+        popular_songs = recommender.get_popular_songs(top_n=top_n-len(recommendations))
+        recommendations.extend(popular_songs)
+    
+    # 用Spotify数据丰富推荐结果
+    enhanced_recommendations = []
+    for rec in recommendations:
+        enhanced_rec = spotify_manager.enrich_recommendation(rec)
+        enhanced_recommendations.append(enhanced_rec)
+    
+    logger.info(f"成功为用户 {user_id} 生成 {len(enhanced_recommendations)} 条推荐")
+    return enhanced_recommendations
+
+@app.route('/api/recommendations/cache/stats', methods=['GET'])
+def recommendation_cache_stats():
+    """获取推荐结果缓存的命中率和内存占用"""
+    return jsonify(recommendation_cache.stats())
+
 @app.route('/api/feedback', methods=['POST'])
 def submit_feedback_api():
     """API：提交用户对推荐的反馈"""
@@ -546,6 +590,7 @@ def submit_feedback_api():
     
     conn.commit()
     conn.close()
+    _sync_user_ratings(user_id)
     
     return jsonify({'message': '反馈提交成功'})
 
@@ -1153,6 +1198,9 @@ def delete_user():
         conn.commit()
         conn.close()
         
+        # 删除记录已写入评分变更日志，立即同步，使该用户的评分马上从推荐引擎中移除
+        _sync_user_ratings(user_id)
+        
         logger.info(f"管理员 {admin_id} 删除了用户 {user_id}")
         
         return jsonify({
@@ -1,13 +1,31 @@
 import pandas as pd
 import numpy as np
-import h5py
 import os
+import sys
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import pickle
 from tqdm import tqdm
 import logging
 
+try:
+    from backend.models.topk_similarity import topk_similarity, save_topk_similarity
+    from backend.models.artifact_store import write_recommender_artifacts
+    from backend.models.columnar_store import save_table
+    from backend.models.triplet_stream import (codes_to_frame, histogram_quantiles,
+                                               parse_triplets_sharded, quantize_play_counts)
+    from backend.models.msd_metadata import METADATA_FIELDS, read_msd_metadata
+    from backend.models.id_dictionary import IdDictionary, USER_DICTIONARY, SONG_DICTIONARY
+except ImportError:
+    # 直接运行本脚本时，从backend目录导入
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from models.topk_similarity import topk_similarity, save_topk_similarity
+    from models.artifact_store import write_recommender_artifacts
+    from models.columnar_store import save_table
+    from models.triplet_stream import (codes_to_frame, histogram_quantiles,
+                                       parse_triplets_sharded, quantize_play_counts)
+    from models.msd_metadata import METADATA_FIELDS, read_msd_metadata
+    from models.id_dictionary import IdDictionary, USER_DICTIONARY, SONG_DICTIONARY
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -15,6 +33,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger('data_processing')
 
+# 每首歌曲保留的相似歌曲数
+SIMILARITY_TOP_K = 50
+
+# 播放次数转换为1-5分评分的分位点
+RATING_QUANTILES = [0, 0.2, 0.4, 0.6, 0.8, 1.0]
+
 # 数据路径
 LASTFM_DATA_PATH = 'data/lastfm-dataset-1K/userid-timestamp-artid-artname-traid-traname.tsv'
 USER_PROFILE_PATH = 'data/lastfm-dataset-1K/userid-profile.tsv'
@@ -50,9 +74,9 @@ def load_and_process_lastfm_data(sample_size=100000):
     songs_metadata = df[['track_id', 'track_name', 'artist_id', 'artist_name']].drop_duplicates()
     
     # 保存处理后的数据
-    user_song_plays.to_pickle(f'{PROCESSED_DATA_DIR}/user_song_plays.pkl')
-    songs_metadata.to_pickle(f'{PROCESSED_DATA_DIR}/songs_metadata.pkl')
-    user_profiles.to_pickle(f'{PROCESSED_DATA_DIR}/user_profiles.pkl')
+    save_table(user_song_plays, PROCESSED_DATA_DIR, 'user_song_plays')
+    save_table(songs_metadata, PROCESSED_DATA_DIR, 'songs_metadata')
+    save_table(user_profiles, PROCESSED_DATA_DIR, 'user_profiles')
     
     print(f"数据处理完成，用户数: {user_song_plays['user_id'].nunique()}, 歌曲数: {songs_metadata.shape[0]}")
     
@@ -69,18 +93,18 @@ def create_content_features(songs_metadata):
     tfidf = TfidfVectorizer(stop_words='english')
     tfidf_matrix = tfidf.fit_transform(songs_metadata['text_features'])
     
-    # 计算歌曲间的相似度矩阵
-    sim_matrix = cosine_similarity(tfidf_matrix)
+    # 分块计算每首歌曲的Top-K相似歌曲，不生成N×N矩阵
+    neighbors, scores = topk_similarity(tfidf_matrix, k=SIMILARITY_TOP_K)
     
     # 保存特征
     with open(f'{PROCESSED_DATA_DIR}/tfidf_vectorizer.pkl', 'wb') as f:
         pickle.dump(tfidf, f)
     
-    np.save(f'{PROCESSED_DATA_DIR}/song_similarity_matrix.npy', sim_matrix)
+    save_topk_similarity(PROCESSED_DATA_DIR, 'song_similarity', songs_metadata['track_id'], neighbors, scores)
     
-    return tfidf, sim_matrix
+    return tfidf, (neighbors, scores)
 
-def process_data(data_dir='data', output_dir='processed_data', use_msd=False, sample_size=None):
+def process_data(data_dir='data', output_dir='processed_data', use_msd=False, sample_size=None, workers=1):
     """主数据处理函数
     
     参数:
@@ -88,6 +112,7 @@ def process_data(data_dir='data', output_dir='processed_data', use_msd=False, sa
         output_dir: 处理后数据输出目录
         use_msd: 是否使用百万歌曲数据集(MSD)
         sample_size: 采样大小，如果为None则处理全部数据
+        workers: 分片处理的并行进程数
     """
     logger.info(f"开始处理数据，使用MSD: {use_msd}")
     
@@ -108,7 +133,7 @@ def process_data(data_dir='data', output_dir='processed_data', use_msd=False, sa
             logger.error(f"用户播放记录文件不存在: {triplets_file}")
             return False
         
-        process_msd_dataset(triplets_file, metadata_file, output_dir, sample_size)
+        process_msd_dataset(triplets_file, metadata_file, output_dir, sample_size, workers=workers)
     else:
         # 处理原始数据集（非MSD）- 保留原有的处理逻辑
         logger.info("处理原始数据集（非MSD）")
@@ -119,7 +144,7 @@ def process_data(data_dir='data', output_dir='processed_data', use_msd=False, sa
     logger.info("数据处理完成")
     return True
 
-def process_msd_dataset(triplets_file, metadata_file, output_dir='processed_data', sample_size=None):
+def process_msd_dataset(triplets_file, metadata_file, output_dir='processed_data', sample_size=None, workers=1):
     """处理百万歌曲数据集
     
     参数:
@@ -127,65 +152,53 @@ def process_msd_dataset(triplets_file, metadata_file, output_dir='processed_data
         metadata_file: H5格式的元数据文件
         output_dir: 输出目录
         sample_size: 采样大小
+        workers: 分片处理播放记录的并行进程数
     """
     logger.info("开始处理MSD数据集")
     
     # 1. 处理元数据文件
     logger.info("处理MSD元数据")
     meta_data = process_msd_metadata(metadata_file, sample_size)
-    meta_data.to_pickle(os.path.join(output_dir, "songs_metadata.pkl"))
+    save_table(meta_data, output_dir, 'songs_metadata')
     logger.info(f"元数据处理完成，共 {len(meta_data)} 首歌曲")
     
     # 2. 处理用户播放记录
     logger.info("处理用户播放记录")
-    user_song_plays = process_msd_triplets(triplets_file, meta_data, sample_size)
-    user_song_plays.to_pickle(os.path.join(output_dir, "user_song_plays.pkl"))
+    user_song_plays = process_msd_triplets(triplets_file, meta_data, sample_size, workers=workers)
+    save_table(user_song_plays, output_dir, 'user_song_plays')
     logger.info(f"用户播放记录处理完成，共 {len(user_song_plays)} 条记录")
     
-    # 3. 计算歌曲相似度矩阵
-    logger.info("计算歌曲相似度矩阵")
-    song_sim_matrix = compute_song_similarity(meta_data)
-    np.save(os.path.join(output_dir, "song_similarity_matrix.npy"), song_sim_matrix)
-    logger.info("歌曲相似度矩阵计算完成")
+    # 3. 计算歌曲Top-K相似度
+    logger.info("计算歌曲Top-K相似度")
+    neighbors, scores = compute_song_similarity(meta_data)
+    save_topk_similarity(output_dir, 'song_similarity', meta_data['song_id'], neighbors, scores)
+    logger.info("歌曲相似度计算完成")
     
     # 4. 创建ID映射
     create_id_mappings(meta_data, user_song_plays, output_dir)
     
+    # 5. 写入推荐服务以内存映射方式加载的产物版本
+    write_recommender_artifacts(output_dir, meta_data, user_song_plays)
+    
     return True
 
-def process_msd_metadata(metadata_file, sample_size=None):
+def process_msd_metadata(metadata_file, sample_size=None, chunk_size=100000):
     """处理H5格式的元数据文件
     
+    只读取需要的字段，按行分块切片并整体解码字节串，不再把整个数据集读入内存
+    
     参数:
         metadata_file: H5格式的元数据文件路径
         sample_size: 采样大小，如果为None则处理全部数据
+        chunk_size: 每次读取的行数
     
     返回:
         DataFrame 包含歌曲元数据
     """
     logger.info(f"从文件加载元数据: {metadata_file}")
     
-    with h5py.File(metadata_file, "r") as f:
-        # 根据MSD文件结构获取元数据
-        # 注意：实际的结构可能需要根据文件内容调整
-        a_group_key = list(f.keys())[0]  # 通常是'metadata'或'analysis'
-        group = f[a_group_key]
-        meta_data = group[list(group.keys())[0]][()]
-    
-    # 转换为DataFrame
-    meta_data = pd.DataFrame(meta_data)
-    
-    # 解码字符串类型列
-    for column in meta_data.select_dtypes(['object']):
-        try:
-            meta_data[column] = meta_data[column].str.decode('utf-8')
-        except:
-            logger.warning(f"列 {column} 解码失败，保持原状")
-    
-    # 仅保留需要的列
-    keep_columns = ['song_id', 'title', 'artist_name', 'artist_id', 'year', 'duration']
-    keep_columns = [col for col in keep_columns if col in meta_data.columns]
-    meta_data = meta_data[keep_columns]
+    # 仅读取需要的列: song_id, title, artist_name, artist_id, year, duration
+    meta_data = read_msd_metadata(metadata_file, fields=METADATA_FIELDS, chunk_size=chunk_size)
     
     # 采样
     if sample_size and len(meta_data) > sample_size:
@@ -194,13 +207,14 @@ def process_msd_metadata(metadata_file, sample_size=None):
     
     return meta_data
 
-def process_msd_triplets(triplets_file, meta_data, sample_size=None):
+def process_msd_triplets(triplets_file, meta_data, sample_size=None, workers=1):
     """处理用户播放记录文件
     
     参数:
         triplets_file: 用户-歌曲-播放次数记录文件路径
         meta_data: 包含有效歌曲ID的DataFrame
         sample_size: 采样大小，如果为None则处理全部数据
+        workers: 处理全部数据时按字节范围分片的并行进程数
     
     返回:
         DataFrame 包含用户-歌曲-评分数据
@@ -226,49 +240,32 @@ def process_msd_triplets(triplets_file, meta_data, sample_size=None):
         
         if len(user_song_plays) > sample_size:
             user_song_plays = user_song_plays.sample(sample_size, random_state=42)
+        histogram = np.bincount(user_song_plays['plays'].to_numpy())
     else:
-        # 分块处理完整数据
-        logger.info("分块处理完整用户播放记录")
-        chunks = pd.read_csv(
-            triplets_file, 
-            sep='\t', 
-            names=['user_id', 'song_id', 'plays'],
-            chunksize=1000000  # 每次处理100万行
-        )
-        
-        all_data = []
-        for i, chunk in enumerate(chunks):
-            logger.info(f"处理第 {i+1} 个数据块")
-            filtered_chunk = chunk[chunk['song_id'].isin(valid_song_ids)]
-            all_data.append(filtered_chunk)
-            
-            # 如果已经达到采样大小，就不再继续处理
-            if sample_size and sum(len(df) for df in all_data) >= sample_size:
-                break
-        
-        user_song_plays = pd.concat(all_data)
-        
-        if sample_size and len(user_song_plays) > sample_size:
-            user_song_plays = user_song_plays.sample(sample_size, random_state=42)
-    
-    # 将播放次数转换为评分(1-5)
+        # 按字节范围分片，在进程池中并行解析完整用户播放记录
+        logger.info(f"分片处理完整用户播放记录，并行进程数: {workers}")
+        user_ids, user_codes, song_codes, plays, histogram, song_index = parse_triplets_sharded(
+            triplets_file, meta_data['song_id'], n_workers=workers)
+        user_song_plays = codes_to_frame(user_codes, song_codes, plays, user_ids, song_index)
+        user_song_plays = user_song_plays.rename(columns={'play_count': 'plays'})
+    
+    # 将播放次数转换为评分(1-5)，分位数阈值由(合并后的)播放次数直方图计算
     logger.info("将播放次数转换为评分")
-    user_song_plays['rating'] = pd.qcut(
-        user_song_plays['plays'], 
-        q=[0, 0.2, 0.4, 0.6, 0.8, 1.0], 
-        labels=[1, 2, 3, 4, 5]
-    ).astype(int)
+    edges = histogram_quantiles(histogram, RATING_QUANTILES)
+    user_song_plays['rating'] = quantize_play_counts(user_song_plays['plays'].to_numpy(), edges)
     
     return user_song_plays
 
-def compute_song_similarity(meta_data):
-    """计算歌曲之间的相似度矩阵
+def compute_song_similarity(meta_data, k=SIMILARITY_TOP_K, n_jobs=None):
+    """计算每首歌曲的Top-K相似歌曲
     
     参数:
         meta_data: 包含歌曲元数据的DataFrame
+        k: 每首歌曲保留的相似歌曲数
+        n_jobs: 并行进程数，默认为CPU核数
     
     返回:
-        numpy数组 歌曲相似度矩阵
+        (近邻位置 int32数组, 相似度 float32数组)，形状均为 (歌曲数, k)
     """
     logger.info("计算歌曲相似度")
     
@@ -282,46 +279,32 @@ def compute_song_similarity(meta_data):
     tfidf = TfidfVectorizer(stop_words='english')
     tfidf_matrix = tfidf.fit_transform(meta_data['text_features'])
     
-    # 计算余弦相似度
-    logger.info("计算余弦相似度")
-    sim_matrix = cosine_similarity(tfidf_matrix)
-    
-    return sim_matrix
+    # 分块计算余弦相似度，每首歌曲只保留Top-K
+    logger.info("分块计算Top-K余弦相似度")
+    return topk_similarity(tfidf_matrix, k=k, n_jobs=n_jobs)
 
 def create_id_mappings(meta_data, user_song_plays, output_dir):
     """创建ID映射并保存
     
+    用户和歌曲各保存为一个ID字典(user_ids.npy/user_order.npy、song_ids.npy/song_order.npy)，
+    编码即ID首次出现的顺序；目录中已有字典时只追加新ID，已有编码不变。
+    训练、产物写入和在线服务都加载同一份字典
+    
     参数:
         meta_data: 包含歌曲元数据的DataFrame
         user_song_plays: 包含用户播放记录的DataFrame
         output_dir: 输出目录
+    
+    返回:
+        (用户ID字典, 歌曲ID字典)
     """
     logger.info("创建ID映射")
     
-    # 用户ID映射
-    unique_users = user_song_plays['user_id'].unique()
-    user_mapping = {user_id: idx for idx, user_id in enumerate(unique_users)}
-    
-    # 歌曲ID映射
-    unique_songs = meta_data['song_id'].unique()
-    song_mapping = {song_id: idx for idx, song_id in enumerate(unique_songs)}
-    
-    # 反向映射
-    reverse_user_mapping = {idx: user_id for user_id, idx in user_mapping.items()}
-    reverse_song_mapping = {idx: song_id for song_id, idx in song_mapping.items()}
-    
-    # 保存映射
-    mappings = {
-        'user_mapping': user_mapping,
-        'song_mapping': song_mapping,
-        'reverse_user_mapping': reverse_user_mapping,
-        'reverse_song_mapping': reverse_song_mapping
-    }
-    
-    with open(os.path.join(output_dir, 'id_mappings.pkl'), 'wb') as f:
-        pickle.dump(mappings, f)
+    user_dictionary = IdDictionary.load_and_extend(output_dir, USER_DICTIONARY, user_song_plays['user_id'])
+    song_dictionary = IdDictionary.load_and_extend(output_dir, SONG_DICTIONARY, meta_data['song_id'])
     
-    logger.info(f"ID映射已保存，用户数: {len(user_mapping)}，歌曲数: {len(song_mapping)}")
+    logger.info(f"ID映射已保存，用户数: {len(user_dictionary)}，歌曲数: {len(song_dictionary)}")
+    return user_dictionary, song_dictionary
 
 # 命令行入口
 if __name__ == "__main__":
@@ -332,7 +315,9 @@ if __name__ == "__main__":
     parser.add_argument('--output_dir', type=str, default='processed_data', help='处理后数据输出目录')
     parser.add_argument('--use_msd', action='store_true', help='是否使用百万歌曲数据集')
     parser.add_argument('--sample', type=int, default=None, help='采样大小，为None则处理全部数据')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='处理全部MSD数据时按字节范围分片的并行进程数')
     
     args = parser.parse_args()
     
-    process_data(args.data_dir, args.output_dir, args.use_msd, args.sample) 
\ No newline at end of file
+    process_data(args.data_dir, args.output_dir, args.use_msd, args.sample, workers=args.workers) 
\ No newline at end of file
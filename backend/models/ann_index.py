@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+歌曲向量的近似最近邻索引
+
+对内容模型(content_model.pkl 中的PCA特征)或SVD/NCF/MLP的歌曲嵌入建立
+余弦相似度索引，离线构建后保存在模型目录，在线以内存映射方式加载:
+- IVFFlatIndex: NumPy实现的倒排索引，k-means把歌曲分到若干个簇，查询时只扫描
+  与查询最接近的 nprobe 个簇
+- FaissHNSWIndex: 安装了faiss时可选的HNSW图索引
+- BruteForceIndex: 精确搜索，小曲库或其它后端不可用时的回退方案，同时用于计算Recall@K
+"""
+
+import os
+import json
+import pickle
+import logging
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 按优先级排列的向量来源
+EMBEDDING_SOURCES = ['content', 'svdpp', 'cf', 'als', 'ncf', 'mlp']
+
+
+def load_item_embeddings(model_dir, source):
+    """读取歌曲向量
+
+    Args:
+        model_dir: 模型目录
+        source: 向量来源，'content' 为内容模型，'svdpp'/'cf'/'als' 为因子模型，
+            'ncf'/'mlp' 为导出的神经网络权重
+
+    Returns:
+        (歌曲ID数组, float32向量矩阵)，文件不存在时返回None
+    """
+    if source == 'content':
+        path = os.path.join(model_dir, 'content_model.pkl')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            features = pickle.load(f)['features']
+        song_ids = np.asarray(list(features.keys()), dtype=str)
+        vectors = np.vstack(list(features.values())).astype(np.float32)
+        return song_ids, vectors
+
+    if source in ('svdpp', 'cf', 'als'):
+        path, ids_key, vectors_key = os.path.join(model_dir, f'{source}_factors.npz'), 'item_ids', 'item_factors'
+    elif source in ('ncf', 'mlp'):
+        path, ids_key, vectors_key = os.path.join(model_dir, f'{source}_weights.npz'), 'item_ids', 'item_embedding'
+    else:
+        raise ValueError(f"未知的向量来源: {source}")
+
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return data[ids_key], np.asarray(data[vectors_key], dtype=np.float32)
+
+
+def _normalize_rows(vectors):
+    """把向量按行归一化为单位长度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    """每行取前k个位置，按分数降序"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+class _EmbeddingIndex:
+    """向量索引的公共部分: 歌曲ID映射、按歌曲查询和结果格式"""
+
+    backend = None
+
+    def __init__(self, song_ids, vectors):
+        """初始化索引
+
+        Args:
+            song_ids: 歌曲ID数组
+            vectors: 已归一化的float32向量矩阵
+        """
+        self.song_ids = np.asarray(song_ids)
+        self.vectors = vectors
+        self.song_index = pd.Index(self.song_ids)
+        self.meta = {}
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def __contains__(self, song_id):
+        return song_id in self.song_index
+
+    def search(self, queries, k):
+        """批量搜索
+
+        Args:
+            queries: 查询向量矩阵，形状为 (查询数, 维度)
+            k: 每个查询返回的近邻数
+
+        Returns:
+            (位置数组, 相似度数组)，形状均为 (查询数, k)，不足k个时位置为-1
+        """
+        raise NotImplementedError
+
+    def query(self, vector, top_n=10, exclude_ids=None):
+        """用任意向量查询最相似的歌曲
+
+        Args:
+            vector: 查询向量(不要求归一化)
+            top_n: 返回数量
+            exclude_ids: 需要排除的歌曲ID
+
+        Returns:
+            [(song_id, score), ...]，按相似度降序
+        """
+        excluded = set()
+        if exclude_ids is not None:
+            positions = self.song_index.get_indexer(list(exclude_ids))
+            excluded = set(positions[positions >= 0].tolist())
+
+        positions, scores = self.search(_normalize_rows(np.asarray(vector)[None, :]), top_n + len(excluded))
+        result = [
+            (self.song_ids[pos].item(), float(score))
+            for pos, score in zip(positions[0], scores[0])
+            if pos >= 0 and pos not in excluded
+        ]
+        return result[:top_n]
+
+    def similar(self, song_id, top_n=10):
+        """查询与某首歌曲最相似的歌曲
+
+        Args:
+            song_id: 歌曲ID
+            top_n: 返回数量
+
+        Returns:
+            [(song_id, score), ...]，不包含歌曲本身，歌曲不在索引中时返回空列表
+        """
+        try:
+            position = self.song_index.get_loc(song_id)
+        except KeyError:
+            return []
+        return self.query(np.asarray(self.vectors[position]), top_n, exclude_ids=[song_id])
+
+    def profile(self, song_ids, weights):
+        """按权重平均若干歌曲的向量，作为用户的偏好向量
+
+        Args:
+            song_ids: 歌曲ID序列
+            weights: 对应的权重(如评分)
+
+        Returns:
+            偏好向量，没有任何歌曲在索引中时返回None
+        """
+        positions = self.song_index.get_indexer(list(song_ids))
+        known = positions >= 0
+        if not known.any():
+            return None
+        weights = np.asarray(weights, dtype=np.float32)[known]
+        return weights @ np.asarray(self.vectors[positions[known]])
+
+    def score_items(self, vector, song_ids):
+        """计算查询向量与指定歌曲的余弦相似度
+
+        Args:
+            vector: 查询向量，为None时全部返回NaN
+            song_ids: 歌曲ID序列
+
+        Returns:
+            与输入对齐的分数数组，不在索引中的歌曲为NaN
+        """
+        scores = np.full(len(song_ids), np.nan)
+        if vector is None:
+            return scores
+        positions = self.song_index.get_indexer(list(song_ids))
+        known = np.flatnonzero(positions >= 0)
+        scores[known] = np.asarray(self.vectors[positions[known]]) @ _normalize_rows(vector)
+        return scores
+
+    def _save_common(self, output_dir, name):
+        """保存歌曲ID、向量与元数据"""
+        np.save(os.path.join(output_dir, f'{name}_ann_song_ids.npy'), self.song_ids.astype(str))
+        np.save(os.path.join(output_dir, f'{name}_ann_vectors.npy'), np.ascontiguousarray(self.vectors, dtype=np.float32))
+        meta = dict(self.meta, backend=self.backend)
+        with open(os.path.join(output_dir, f'{name}_ann_meta.json'), 'w') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    def save(self, output_dir, name):
+        """保存索引
+
+        Args:
+            output_dir: 输出目录
+            name: 索引名称(即向量来源)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self._save_common(output_dir, name)
+        logger.info(f"{self.backend}索引已保存至: {output_dir}")
+
+
+class BruteForceIndex(_EmbeddingIndex):
+    """精确搜索，按块计算全部歌曲的相似度"""
+
+    backend = 'brute'
+
+    def __init__(self, song_ids, vectors, block_size=65536):
+        super().__init__(song_ids, vectors)
+        self.block_size = block_size
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, len(self))
+        best_positions = np.full((len(queries), 0), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+
+        # 逐块合并当前最好的k个结果，内存只与块大小有关
+        for start in range(0, len(self), self.block_size):
+            block = np.asarray(self.vectors[start:start + self.block_size])
+            scores = np.hstack([best_scores, queries @ block.T])
+            positions = np.hstack([best_positions, np.broadcast_to(
+                np.arange(start, start + len(block)), (len(queries), len(block)))])
+            top = _top_k(scores, k)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_positions = np.take_along_axis(positions, top, axis=1)
+
+        return best_positions, best_scores
+
+
+class IVFFlatIndex(_EmbeddingIndex):
+    """倒排文件索引(IVF-Flat)
+
+    簇内成员按簇编号排序后连续存放，offsets[c]:offsets[c+1] 为第c个簇的成员位置。
+    """
+
+    backend = 'ivf'
+
+    def __init__(self, song_ids, vectors, centroids, order, offsets, nprobe=8):
+        """初始化倒排索引
+
+        Args:
+            song_ids: 歌曲ID数组
+            vectors: 已归一化的向量矩阵
+            centroids: 簇中心矩阵
+            order: 按簇排列的歌曲位置
+            offsets: 每个簇在order中的起止位置，长度为簇数+1
+            nprobe: 每次查询扫描的簇数
+        """
+        super().__init__(song_ids, vectors)
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @staticmethod
+    def train_centroids(vectors, n_lists, n_iter=20, sample_size=None, seed=42):
+        """球面k-means训练簇中心
+
+        Args:
+            vectors: 已归一化的向量矩阵
+            n_lists: 簇数
+            n_iter: 迭代次数
+            sample_size: 训练采样数，默认每个簇256个样本
+            seed: 随机种子
+
+        Returns:
+            归一化的簇中心矩阵
+        """
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), sample_size or n_lists * 256)
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            one_hot = sp.csr_matrix(
+                (np.ones(len(sample), dtype=np.float32), (assign, np.arange(len(sample)))),
+                shape=(n_lists, len(sample))
+            )
+            sums = np.asarray(one_hot @ sample)
+            # 空簇重新随机选取样本作为中心
+            empty = np.flatnonzero(one_hot.getnnz(axis=1) == 0)
+            if len(empty):
+                sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+            centroids = _normalize_rows(sums)
+
+        return centroids
+
+    @classmethod
+    def build(cls, song_ids, vectors, n_lists=None, nprobe=8, block_size=65536, seed=42):
+        """构建倒排索引
+
+        Args:
+            song_ids: 歌曲ID数组
+            vectors: 已归一化的向量矩阵
+            n_lists: 簇数，默认约为 sqrt(歌曲数)
+            nprobe: 每次查询扫描的簇数
+            block_size: 分配簇时每块的歌曲数
+            seed: 随机种子
+
+        Returns:
+            IVFFlatIndex实例
+        """
+        n_lists = min(len(vectors), n_lists or max(1, int(np.sqrt(len(vectors)))))
+        centroids = cls.train_centroids(vectors, n_lists, seed=seed)
+
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start:start + block_size])
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+        order = np.argsort(assign, kind='stable').astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+        logger.info(f"IVF索引: {len(vectors)}首歌曲, {n_lists}个簇, 最大簇{int(np.diff(offsets).max())}首")
+        return cls(song_ids, vectors, centroids, order, offsets, nprobe=min(nprobe, n_lists))
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float32)
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        probes = _top_k(queries @ self.centroids.T, self.nprobe)
+        for i, query in enumerate(queries):
+            members = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes[i]])
+            if not len(members):
+                continue
+            member_scores = np.asarray(self.vectors[members]) @ query
+            top = _top_k(member_scores[None, :], k)[0]
+            positions[i, :len(top)] = members[top]
+            scores[i, :len(top)] = member_scores[top]
+
+        return positions, scores
+
+    def save(self, output_dir, name):
+        os.makedirs(output_dir, exist_ok=True)
+        self.meta['nprobe'] = self.nprobe
+        self._save_common(output_dir, name)
+        np.save(os.path.join(output_dir, f'{name}_ann_centroids.npy'), self.centroids.astype(np.float32))
+        np.save(os.path.join(output_dir, f'{name}_ann_order.npy'), self.order)
+        np.save(os.path.join(output_dir, f'{name}_ann_offsets.npy'), self.offsets)
+        logger.info(f"IVF索引已保存至: {output_dir}")
+
+
+class FaissHNSWIndex(_EmbeddingIndex):
+    """faiss HNSW索引(内积即余弦相似度)，需要安装faiss"""
+
+    backend = 'faiss'
+
+    def __init__(self, song_ids, vectors, index, ef_search=64):
+        super().__init__(song_ids, vectors)
+        self.index = index
+        self.index.hnsw.efSearch = ef_search
+
+    @classmethod
+    def build(cls, song_ids, vectors, m=32, ef_construction=200, ef_search=64):
+        """构建HNSW索引
+
+        Args:
+            song_ids: 歌曲ID数组
+            vectors: 已归一化的向量矩阵
+            m: 每个节点的连接数
+            ef_construction: 构建时的候选列表大小
+            ef_search: 查询时的候选列表大小
+
+        Returns:
+            FaissHNSWIndex实例
+        """
+        index = faiss.IndexHNSWFlat(vectors.shape[1], m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        return cls(song_ids, vectors, index, ef_search=ef_search)
+
+    def search(self, queries, k):
+        scores, positions = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return positions.astype(np.int64), scores
+
+    def save(self, output_dir, name):
+        os.makedirs(output_dir, exist_ok=True)
+        self.meta['ef_search'] = self.index.hnsw.efSearch
+        self._save_common(output_dir, name)
+        faiss.write_index(self.index, os.path.join(output_dir, f'{name}_ann.faiss'))
+        logger.info(f"faiss索引已保存至: {output_dir}")
+
+
+def build_ann_index(song_ids, vectors, backend='ivf', **kwargs):
+    """构建向量索引
+
+    Args:
+        song_ids: 歌曲ID数组
+        vectors: 向量矩阵(不要求归一化)
+        backend: 'ivf'、'faiss' 或 'brute'，faiss未安装时回退到ivf
+        **kwargs: 传给对应后端build方法的参数
+
+    Returns:
+        索引实例
+    """
+    vectors = _normalize_rows(vectors)
+    if backend == 'faiss' and not FAISS_AVAILABLE:
+        logger.warning("未安装faiss，改用IVF索引")
+        backend = 'ivf'
+
+    if backend == 'faiss':
+        return FaissHNSWIndex.build(song_ids, vectors, **kwargs)
+    if backend == 'ivf':
+        return IVFFlatIndex.build(song_ids, vectors, **kwargs)
+    return BruteForceIndex(song_ids, vectors)
+
+
+def load_ann_index(model_dir, name):
+    """以内存映射方式加载向量索引
+
+    Args:
+        model_dir: 模型目录
+        name: 索引名称(即向量来源)
+
+    Returns:
+        索引实例，文件不存在时返回None
+    """
+    meta_path = os.path.join(model_dir, f'{name}_ann_meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    song_ids = np.load(os.path.join(model_dir, f'{name}_ann_song_ids.npy'))
+    vectors = np.load(os.path.join(model_dir, f'{name}_ann_vectors.npy'), mmap_mode='r')
+    backend = meta.get('backend')
+
+    if backend == 'faiss' and FAISS_AVAILABLE:
+        index = FaissHNSWIndex(song_ids, vectors, faiss.read_index(os.path.join(model_dir, f'{name}_ann.faiss')),
+                               ef_search=meta.get('ef_search', 64))
+    elif backend == 'ivf':
+        index = IVFFlatIndex(
+            song_ids, vectors,
+            np.load(os.path.join(model_dir, f'{name}_ann_centroids.npy')),
+            np.load(os.path.join(model_dir, f'{name}_ann_order.npy'), mmap_mode='r'),
+            np.load(os.path.join(model_dir, f'{name}_ann_offsets.npy')),
+            nprobe=meta.get('nprobe', 8)
+        )
+    else:
+        if backend == 'faiss':
+            logger.warning(f"{name}索引使用faiss构建但当前未安装faiss，改用精确搜索")
+        index = BruteForceIndex(song_ids, vectors)
+
+    index.meta = meta
+    logger.info(f"加载了{name}向量索引: {len(index)}首歌曲, 后端={index.backend}")
+    return index
+
+
+def recall_at_k(index, k=10, n_queries=1000, seed=42):
+    """以精确搜索为基准评估索引的Recall@K
+
+    Args:
+        index: 待评估的索引
+        k: 近邻数
+        n_queries: 随机抽取的查询歌曲数
+        seed: 随机种子
+
+    Returns:
+        平均Recall@K
+    """
+    rng = np.random.default_rng(seed)
+    query_positions = rng.choice(len(index), min(n_queries, len(index)), replace=False)
+    queries = np.asarray(index.vectors[np.sort(query_positions)])
+
+    exact, _ = BruteForceIndex(index.song_ids, index.vectors).search(queries, k)
+    approx, _ = index.search(queries, k)
+
+    hits = sum(len(np.intersect1d(e[e >= 0], a[a >= 0])) for e, a in zip(exact, approx))
+    return hits / max(1, int((exact >= 0).sum()))
@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+版本化的模型产物目录
+
+处理和训练脚本把推荐服务启动所需的数据写成一个产物版本:
+{data_dir}/artifacts/<版本>/ 下的一组 .npy 原始数组和 manifest.json，
+字符串列(歌曲元数据)以 UTF-8 字节 + 偏移量两个数组保存，用户/歌曲ID字典
+按 IdDictionary 的格式保存为定长字符串数组和排序下标，编码与数据目录中
+共享的字典一致。
+版本写完后才原子地更新 CURRENT 指针，服务只会看到完整的版本。
+
+服务启动时用 np.load(mmap_mode='r') 打开数组，评分矩阵、因子矩阵等不再
+反序列化到每个进程的私有内存，多个 gunicorn worker 共享同一份页缓存，
+启动时间与数据量基本无关。
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .id_dictionary import IdDictionary, USER_DICTIONARY, SONG_DICTIONARY
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = 'artifacts'
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+WATERMARK_FILE = 'WATERMARK.json'
+FORMAT_VERSION = 2
+
+# 写入产物时一并收录的离线模型: (文件名模板, 数组组名)
+MODEL_FILES = [
+    ('{name}_factors.npz', ('svdpp', 'cf', 'als')),
+    ('{name}_weights.npz', ('ncf', 'mlp')),
+]
+
+
+class StringArray:
+    """UTF-8字节 + 偏移量保存的只读字符串数组
+
+    第i个字符串为 data[offsets[i]:offsets[i + 1]]，两个数组都可以内存映射，
+    只在访问时解码。
+    """
+
+    def __init__(self, offsets, data):
+        """初始化字符串数组
+
+        Args:
+            offsets: int64偏移量数组，长度为字符串数 + 1
+            data: uint8字节数组
+        """
+        self.offsets = offsets
+        self.data = data
+
+    @staticmethod
+    def encode(values):
+        """把字符串序列编码为 (偏移量, 字节) 数组，缺失值保存为空字符串
+
+        Args:
+            values: 字符串序列
+
+        Returns:
+            (int64偏移量数组, uint8字节数组)
+        """
+        encoded = [b'' if pd.isna(value) else str(value).encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return offsets, data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.data[start:end].tobytes().decode('utf-8')
+
+    def to_numpy(self):
+        """解码全部字符串
+
+        Returns:
+            object类型的字符串数组
+        """
+        buffer = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        values = np.empty(len(self), dtype=object)
+        values[:] = [buffer[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+        return values
+
+
+class ArtifactWriter:
+    """产物版本写入器
+
+    数组先写入临时目录，commit 时重命名为正式版本并更新 CURRENT 指针。
+    """
+
+    def __init__(self, root, version=None):
+        """初始化写入器
+
+        Args:
+            root: 产物根目录，如 processed_data/artifacts
+            version: 版本名，默认使用当前时间
+        """
+        self.root = root
+        base = version or time.strftime('%Y%m%d-%H%M%S')
+        self.version, suffix = base, 1
+        while os.path.exists(os.path.join(root, self.version)):
+            self.version = f'{base}-{suffix}'
+            suffix += 1
+
+        self._tmp_dir = os.path.join(root, f'.{self.version}.tmp')
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self.manifest = {
+            'format': FORMAT_VERSION,
+            'version': self.version,
+            'created_at': time.time(),
+            'arrays': {},
+            'strings': [],
+            'metadata': {},
+        }
+
+    def add_array(self, name, array):
+        """写入一个数值数组
+
+        Args:
+            name: 数组名，如 'ratings.indptr'
+            array: numpy数组
+        """
+        array = np.asarray(array)
+        if array.dtype.kind in 'UO':
+            self.add_strings(name, array.ravel())
+            return
+        np.save(os.path.join(self._tmp_dir, f'{name}.npy'), array)
+        self.manifest['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    def add_strings(self, name, values):
+        """写入一个字符串数组
+
+        Args:
+            name: 数组名
+            values: 字符串序列
+        """
+        offsets, data = StringArray.encode(values)
+        np.save(os.path.join(self._tmp_dir, f'{name}.offsets.npy'), offsets)
+        np.save(os.path.join(self._tmp_dir, f'{name}.data.npy'), data)
+        self.manifest['strings'].append(name)
+
+    def add_dictionary(self, name, dictionary):
+        """写入一个ID字典，保存为 {name}.ids 和 {name}.order 两个数组
+
+        Args:
+            name: 字典名，如 'user_ids'
+            dictionary: IdDictionary实例
+        """
+        for key, array in (('ids', dictionary.ids), ('order', dictionary._order)):
+            array = np.ascontiguousarray(array)
+            np.save(os.path.join(self._tmp_dir, f'{name}.{key}.npy'), array)
+            self.manifest['arrays'][f'{name}.{key}'] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    def add_group(self, prefix, arrays):
+        """以 prefix.key 的名称写入一组数组(如模型的npz内容)
+
+        Args:
+            prefix: 组名
+            arrays: {key: 数组} 字典
+        """
+        for key, value in arrays.items():
+            self.add_array(f'{prefix}.{key}', np.asarray(value))
+
+    def set_metadata(self, key, value):
+        """记录可JSON序列化的元数据"""
+        self.manifest['metadata'][key] = value
+
+    def commit(self, keep=3):
+        """完成版本并切换 CURRENT 指针
+
+        Args:
+            keep: 保留的历史版本数(含新版本)
+
+        Returns:
+            新版本的目录路径
+        """
+        with open(os.path.join(self._tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+
+        version_dir = os.path.join(self.root, self.version)
+        os.replace(self._tmp_dir, version_dir)
+
+        pointer_tmp = os.path.join(self.root, f'.{CURRENT_FILE}.tmp')
+        with open(pointer_tmp, 'w', encoding='utf-8') as f:
+            f.write(self.version)
+        os.replace(pointer_tmp, os.path.join(self.root, CURRENT_FILE))
+
+        _prune_versions(self.root, keep)
+        logger.info(f"产物版本 {self.version} 已写入: {version_dir}")
+        return version_dir
+
+    def abort(self):
+        """放弃未提交的版本"""
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def _prune_versions(root, keep):
+    """删除较旧的版本，CURRENT 指向的版本始终保留"""
+    current = read_current_version(root)
+    versions = list_versions(root)
+    for version in versions[:max(len(versions) - keep, 0)]:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+def list_versions(root):
+    """按创建顺序列出已提交的版本名"""
+    if not os.path.isdir(root):
+        return []
+    versions = [
+        name for name in os.listdir(root)
+        if not name.startswith('.') and os.path.exists(os.path.join(root, name, MANIFEST_FILE))
+    ]
+    return sorted(versions, key=lambda name: (os.path.getmtime(os.path.join(root, name, MANIFEST_FILE)), name))
+
+
+def read_current_version(root):
+    """读取 CURRENT 指针，不存在时返回None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def interactions_watermark(interactions_df):
+    """交互数据的水位线
+
+    有timestamp列时记录最大时间戳，同时记录行数(追加写入的表没有时间戳时按行数划分)。
+
+    Args:
+        interactions_df: 交互DataFrame
+
+    Returns:
+        {'timestamp': 最大时间戳或None, 'rows': 行数}
+    """
+    timestamp = None
+    if 'timestamp' in interactions_df.columns and len(interactions_df):
+        timestamps = pd.to_numeric(interactions_df['timestamp'], errors='coerce')
+        if timestamps.notna().any():
+            timestamp = float(timestamps.max())
+    return {'timestamp': timestamp, 'rows': int(len(interactions_df))}
+
+
+def read_watermark(root, name):
+    """读取某个模型上次训练时的交互数据水位线
+
+    Args:
+        root: 产物根目录
+        name: 模型名称
+
+    Returns:
+        水位线字典，没有记录时返回None
+    """
+    try:
+        with open(os.path.join(root, WATERMARK_FILE), encoding='utf-8') as f:
+            return json.load(f).get(name)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_watermark(root, name, watermark):
+    """记录某个模型训练到的交互数据水位线，整个文件原子替换
+
+    Args:
+        root: 产物根目录
+        name: 模型名称
+        watermark: interactions_watermark 返回的字典
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, WATERMARK_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            watermarks = json.load(f)
+    except (FileNotFoundError, ValueError):
+        watermarks = {}
+    watermarks[name] = dict(watermark, updated_at=time.time())
+
+    tmp_path = os.path.join(root, f'.{WATERMARK_FILE}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class ArtifactStore:
+    """只读的产物版本，数组以内存映射方式打开"""
+
+    def __init__(self, path):
+        """打开一个版本目录
+
+        Args:
+            path: 版本目录路径
+        """
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self._strings = set(self.manifest.get('strings', []))
+        self._cache = {}
+
+    @classmethod
+    def open(cls, root, version=None):
+        """打开指定版本或 CURRENT 指向的版本
+
+        Args:
+            root: 产物根目录
+            version: 版本名，默认读取 CURRENT
+
+        Returns:
+            ArtifactStore实例，没有可用版本时返回None
+        """
+        version = version or read_current_version(root)
+        if not version or not os.path.exists(os.path.join(root, version, MANIFEST_FILE)):
+            return None
+        store = cls(os.path.join(root, version))
+        logger.info(f"打开产物版本 {store.version}: {store.path}")
+        return store
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def metadata(self):
+        return self.manifest.get('metadata', {})
+
+    def __contains__(self, name):
+        return name in self.manifest['arrays'] or name in self._strings
+
+    def names(self, prefix=''):
+        """列出指定前缀的数组名"""
+        names = list(self.manifest['arrays']) + list(self._strings)
+        return sorted(name for name in names if name.startswith(prefix))
+
+    def _load(self, filename):
+        array = self._cache.get(filename)
+        if array is None:
+            array = np.load(os.path.join(self.path, filename), mmap_mode='r')
+            self._cache[filename] = array
+        return array
+
+    def array(self, name):
+        """以内存映射方式读取数值数组
+
+        Args:
+            name: 数组名
+
+        Returns:
+            只读的numpy memmap数组
+        """
+        return self._load(f'{name}.npy')
+
+    def strings(self, name):
+        """读取字符串数组
+
+        Args:
+            name: 数组名
+
+        Returns:
+            StringArray实例
+        """
+        return StringArray(self._load(f'{name}.offsets.npy'), self._load(f'{name}.data.npy'))
+
+    def dictionary(self, name):
+        """读取 add_dictionary 写入的ID字典，两个数组都以内存映射方式打开
+
+        旧格式(format 1)中以字符串数组保存的ID列表会在内存中重建字典。
+
+        Args:
+            name: 字典名
+
+        Returns:
+            IdDictionary实例，不存在时返回None
+        """
+        if f'{name}.ids' in self.manifest['arrays']:
+            return IdDictionary(self.array(f'{name}.ids'), self.array(f'{name}.order'))
+        if name in self._strings:
+            return IdDictionary(self.strings(name).to_numpy().astype(str))
+        return None
+
+    def get(self, name):
+        """读取数组，字符串数组解码为numpy数组"""
+        if name in self._strings:
+            return self.strings(name).to_numpy()
+        return self.array(name)
+
+    def group(self, prefix):
+        """读取 add_group 写入的一组数组
+
+        Args:
+            prefix: 组名
+
+        Returns:
+            {key: 数组} 字典，组不存在时返回None
+        """
+        names = self.names(f'{prefix}.')
+        if not names:
+            return None
+        return {name[len(prefix) + 1:]: self.get(name) for name in names}
+
+
+def write_recommender_artifacts(data_dir, songs_df, interactions_df, version=None, keep=3, metadata=None):
+    """写入推荐服务启动所需的产物版本
+
+    包含歌曲元数据列、用户/歌曲ID字典、CSR与CSC两种布局的评分矩阵，
+    以及 data_dir 中已有的 *_factors.npz / *_weights.npz 模型数组。
+    评分矩阵按 data_dir 中共享的 user / song 字典编码，新出现的ID追加后写回；
+    字典不存在时新建，歌曲字典以歌曲目录的顺序开头。
+
+    Args:
+        data_dir: 数据目录，共享ID字典所在目录，产物写入 data_dir/artifacts
+        songs_df: 歌曲元数据DataFrame，包含song_id列
+        interactions_df: 包含user_id、song_id、rating列(可选timestamp列)的DataFrame
+        version: 版本名
+        keep: 保留的历史版本数
+        metadata: 额外记录的元数据字典(如已包含的SQLite评分变更日志位置)
+
+    Returns:
+        新版本的目录路径
+    """
+    writer = ArtifactWriter(os.path.join(data_dir, ARTIFACTS_DIR), version=version)
+    try:
+        songs_df = songs_df.drop_duplicates(subset='song_id', keep='first')
+        for col in songs_df.columns:
+            values = songs_df[col]
+            if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                writer.add_array(f'songs.{col}', values.to_numpy())
+            else:
+                writer.add_strings(f'songs.{col}', values.to_numpy(dtype=object))
+        writer.set_metadata('songs_columns', list(songs_df.columns))
+
+        # 交互数据与 RatingMatrix.from_dataframe 一致: 重复评分以最后一条为准
+        has_timestamp = 'timestamp' in interactions_df.columns
+        columns = ['user_id', 'song_id', 'rating'] + (['timestamp'] if has_timestamp else [])
+        df = interactions_df[columns].drop_duplicates(subset=['user_id', 'song_id'], keep='last')
+
+        # ID统一按字符串编码(列式存储读出的ID列可能是category类型)
+        interaction_users = df['user_id'].astype(str).to_numpy()
+        interaction_songs = df['song_id'].astype(str).to_numpy()
+        user_ids = IdDictionary.load_and_extend(data_dir, USER_DICTIONARY, interaction_users)
+        song_ids = IdDictionary.load_and_extend(
+            data_dir, SONG_DICTIONARY,
+            np.concatenate([songs_df['song_id'].astype(str).to_numpy(), interaction_songs]))
+        user_codes = user_ids.encode(interaction_users)
+        song_codes = song_ids.encode(interaction_songs)
+        ratings = df['rating'].to_numpy(dtype=np.float32)
+
+        shape = (len(user_ids), len(song_ids))
+        matrix = sp.csr_matrix((ratings, (user_codes, song_codes)), shape=shape, dtype=np.float32)
+        matrix.sort_indices()
+        csc = matrix.tocsc()
+        csc.sort_indices()
+
+        writer.add_dictionary('user_ids', user_ids)
+        writer.add_dictionary('song_ids', song_ids)
+        writer.add_array('ratings.indptr', matrix.indptr.astype(np.int64))
+        writer.add_array('ratings.indices', matrix.indices.astype(np.int32))
+        writer.add_array('ratings.data', matrix.data)
+        writer.add_array('ratings_csc.indptr', csc.indptr.astype(np.int64))
+        writer.add_array('ratings_csc.indices', csc.indices.astype(np.int32))
+        writer.add_array('ratings_csc.data', csc.data)
+        if has_timestamp:
+            # 按CSR顺序排列的评分时间戳，用于热门度时间衰减
+            order = np.lexsort((song_codes, user_codes))
+            timestamps = pd.to_numeric(df['timestamp'], errors='coerce').to_numpy(dtype=np.float64)
+            writer.add_array('ratings.timestamp', timestamps[order])
+        writer.set_metadata('n_users', shape[0])
+        writer.set_metadata('n_songs', shape[1])
+        writer.set_metadata('n_ratings', int(matrix.nnz))
+        writer.set_metadata('watermark', interactions_watermark(interactions_df))
+        for key, value in (metadata or {}).items():
+            writer.set_metadata(key, value)
+
+        for pattern, names in MODEL_FILES:
+            for name in names:
+                path = os.path.join(data_dir, pattern.format(name=name))
+                if os.path.exists(path):
+                    with np.load(path) as data:
+                        writer.add_group(name, {key: data[key] for key in data.files})
+                    logger.info(f"产物收录模型数组: {path}")
+
+        return writer.commit(keep=keep)
+    except Exception:
+        writer.abort()
+        raise
+
+
+def load_songs_frame(store):
+    """从产物读取歌曲元数据DataFrame
+
+    Args:
+        store: ArtifactStore实例
+
+    Returns:
+        歌曲元数据DataFrame
+    """
+    columns = store.metadata.get('songs_columns', [])
+    return pd.DataFrame({col: store.get(f'songs.{col}') for col in columns}, columns=columns)
+
+
+def load_rating_arrays(store):
+    """从产物读取评分矩阵
+
+    CSR/CSC数组直接引用内存映射，不复制到进程私有内存。
+
+    Args:
+        store: ArtifactStore实例
+
+    Returns:
+        (CSR矩阵, CSC矩阵或None, 用户ID字典, 歌曲ID字典)
+    """
+    user_ids = store.dictionary('user_ids')
+    song_ids = store.dictionary('song_ids')
+    shape = (len(user_ids), len(song_ids))
+
+    matrix = sp.csr_matrix(
+        (store.array('ratings.data'), store.array('ratings.indices'), store.array('ratings.indptr')),
+        shape=shape
+    )
+    csc = None
+    if 'ratings_csc.data' in store:
+        csc = sp.csc_matrix(
+            (store.array('ratings_csc.data'), store.array('ratings_csc.indices'), store.array('ratings_csc.indptr')),
+            shape=shape
+        )
+    return matrix, csc, user_ids, song_ids
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+候选召回
+
+推荐分两阶段完成: 召回阶段从近邻索引、协同过滤邻居、艺术家索引和热门榜
+各取一小批候选，去重、过滤后合并为至多几百首歌曲；排序阶段(HybridBlender)
+只对这些候选调用SVD++/NCF/MLP等较重的打分器。单次请求的代价因此由候选数
+决定，与曲库大小无关。过滤规则(已评分排除、不在歌曲目录中等)统一在这里添加。
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateRetriever:
+    """多路候选召回器
+
+    召回来源以 (名称, 配额, 召回函数) 的形式传入，召回函数签名为
+    fn(user_id, n) -> [(song_id, score), ...]，返回None或空列表表示该来源没有候选。
+    过滤函数签名为 fn(user_id, song_ids) -> 布尔数组，True表示保留。
+    """
+
+    def __init__(self, sources, filters=None, max_candidates=300):
+        """初始化召回器
+
+        Args:
+            sources: [(名称, 配额, 召回函数), ...]，按优先级排列
+            filters: 过滤函数列表
+            max_candidates: 合并后的最大候选数
+        """
+        self.sources = sources
+        self.filters = filters or []
+        self.max_candidates = max_candidates
+
+    def retrieve(self, user_id):
+        """召回候选歌曲
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            (候选歌曲ID数组, 召回来源名称数组)，按来源优先级和来源内分数排列，
+            同一歌曲只保留首次出现的来源
+        """
+        song_ids, source_names = [], []
+        for name, quota, fn in self.sources:
+            try:
+                pool = fn(user_id, quota)
+            except Exception as e:
+                logger.error(f"召回{name}候选时出错: {str(e)}")
+                continue
+            if not pool:
+                continue
+            song_ids.extend(song_id for song_id, _ in pool)
+            source_names.extend([name] * len(pool))
+
+        if not song_ids:
+            return np.empty(0, dtype=object), np.empty(0, dtype=object)
+
+        song_ids = pd.Series(song_ids, dtype=object)
+        keep = ~song_ids.duplicated().to_numpy()
+        song_ids = song_ids.to_numpy()[keep]
+        source_names = np.asarray(source_names, dtype=object)[keep]
+
+        for candidate_filter in self.filters:
+            mask = np.asarray(candidate_filter(user_id, song_ids), dtype=bool)
+            song_ids, source_names = song_ids[mask], source_names[mask]
+
+        return song_ids[:self.max_candidates], source_names[:self.max_candidates]
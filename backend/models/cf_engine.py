@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+基于用户的协同过滤引擎(稀疏矩阵实现)
+
+在 RatingMatrix 的CSR/CSC矩阵上计算用户相似度和候选歌曲分数，
+每次请求的代价只与目标用户评过分的歌曲所在列的非零元素数量有关，
+不再逐个遍历全部用户。每次计算开始时取一次评分矩阵快照，
+之后的行、列读取都在同一个快照上进行；同一快照上同一用户的打分结果
+会被缓存，召回和排序阶段共用一次计算。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class UserBasedCF:
+    """基于用户的协同过滤
+
+    相似度定义与原实现一致: 只在两位用户共同评分的歌曲上计算余弦相似度，
+    共同评分少于 min_common 首的用户不参与推荐。
+    """
+
+    def __init__(self, rating_matrix, n_neighbors=20, min_common=3, cache_size=256):
+        """初始化协同过滤引擎
+
+        Args:
+            rating_matrix: RatingMatrix实例
+            n_neighbors: 参与打分的最相似用户数
+            min_common: 最少共同评分歌曲数
+            cache_size: 缓存的打分结果数
+        """
+        self.rating_matrix = rating_matrix
+        self.n_neighbors = n_neighbors
+        self.min_common = min_common
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()  # (快照版本, 用户编码) -> _score 的结果
+        self._lock = threading.Lock()
+
+    def similar_users(self, user_code, snapshot=None):
+        """计算与目标用户最相似的邻居
+
+        Args:
+            user_code: 目标用户的行编码
+            snapshot: 评分矩阵快照，为None时使用当前快照
+
+        Returns:
+            (邻居用户编码数组, 相似度数组)，按相似度降序排列
+        """
+        snapshot = snapshot or self.rating_matrix.snapshot()
+        song_codes, ratings = snapshot.user_row(user_code)
+        if len(song_codes) < self.min_common:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # 只取目标用户评过分的列，所有统计量都限定在共同评分的歌曲上
+        sub = snapshot.columns(song_codes).tocsr()
+        dot = sub @ ratings
+        sum_y2 = np.asarray(sub.multiply(sub).sum(axis=1)).ravel()
+        sub.data[:] = 1.0
+        common = sub.getnnz(axis=1)
+        sum_x2 = sub @ (ratings * ratings)
+
+        valid = (common >= self.min_common) & (sum_x2 > 0) & (sum_y2 > 0)
+        valid[user_code] = False
+        candidates = np.flatnonzero(valid)
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        sims = dot[candidates] / (np.sqrt(sum_x2[candidates]) * np.sqrt(sum_y2[candidates]))
+
+        # 部分排序取前K个邻居，再对这K个按相似度稳定排序
+        if len(candidates) > self.n_neighbors:
+            top = np.argpartition(-sims, self.n_neighbors - 1)[:self.n_neighbors]
+            candidates, sims = candidates[top], sims[top]
+        order = np.lexsort((candidates, -sims))
+        return candidates[order], sims[order].astype(np.float32)
+
+    def _score(self, snapshot, user_code):
+        """计算邻居评分的加权平均
+
+        Args:
+            snapshot: 评分矩阵快照
+            user_code: 目标用户的行编码
+
+        Returns:
+            (候选歌曲编码数组, 分数数组)，候选按编码升序，只包含邻居评过分且用户未评分的歌曲；
+            没有相似用户时返回None
+        """
+        neighbors, sims = self.similar_users(user_code, snapshot)
+        if len(neighbors) == 0:
+            return None
+
+        # 邻居评分的加权和与相似度之和
+        neighbor_rows = snapshot.rows(neighbors)
+        song_scores = neighbor_rows.T @ sims
+        neighbor_rows = neighbor_rows.copy()
+        neighbor_rows.data[:] = 1.0
+        sim_sums = neighbor_rows.T @ np.abs(sims)
+
+        # 跳过用户已评分的歌曲
+        rated, _ = snapshot.user_row(user_code)
+        sim_sums[rated] = 0
+        candidates = np.flatnonzero(sim_sums > 0)
+        return candidates, song_scores[candidates] / sim_sums[candidates]
+
+    def _cached_score(self, snapshot, user_code):
+        """按 (快照版本, 用户编码) 缓存的 _score 结果
+
+        同一请求的召回(recommend)和排序(score_items)阶段读取的是同一个快照，
+        邻居和分数只计算一次；有新评分写入时快照版本变化，旧结果不再命中。
+        """
+        key = (snapshot.version, user_code)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        scored = self._score(snapshot, user_code)
+        with self._lock:
+            self._cache[key] = scored
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scored
+
+    def recommend(self, user_id, top_n=10):
+        """为用户生成协同过滤推荐
+
+        Args:
+            user_id: 用户ID
+            top_n: 推荐数量
+
+        Returns:
+            推荐歌曲ID和分数列表 [(song_id, score), ...]，没有相似用户时返回空列表
+        """
+        snapshot = self.rating_matrix.snapshot()
+        user_code = snapshot.user_code(user_id)
+        if user_code < 0:
+            return []
+
+        scored = self._cached_score(snapshot, user_code)
+        if scored is None or len(scored[0]) == 0:
+            return []
+        candidates, scores = scored
+
+        if len(candidates) > top_n:
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+
+        song_ids = snapshot.song_ids.decode(candidates[order]).tolist()
+        return list(zip(song_ids, scores[order].tolist()))
+
+    def score_items(self, user_id, song_ids):
+        """对指定歌曲计算协同过滤分数
+
+        Args:
+            user_id: 用户ID
+            song_ids: 歌曲ID序列
+
+        Returns:
+            与输入对齐的分数数组，无法打分的歌曲为NaN
+        """
+        scores = np.full(len(song_ids), np.nan)
+        snapshot = self.rating_matrix.snapshot()
+        user_code = snapshot.user_code(user_id)
+        if user_code < 0:
+            return scores
+
+        scored = self._cached_score(snapshot, user_code)
+        if scored is None or len(scored[0]) == 0:
+            return scores
+        candidates, candidate_scores = scored
+
+        codes = snapshot.song_codes(song_ids)
+        positions = np.minimum(np.searchsorted(candidates, codes), len(candidates) - 1)
+        found = (codes >= 0) & (candidates[positions] == codes)
+        scores[found] = candidate_scores[positions[found]]
+        return scores
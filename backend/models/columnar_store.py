@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+处理数据的列式存储
+
+processed_data 中的歌曲元数据和用户交互表以 Parquet(或Feather)格式保存:
+user_id/song_id 等ID列以字典编码的category类型写入，整数评分压缩为int8，
+其余数值列使用最小的整数或float32类型；读取时可以只投影需要的列。
+Parquet/Feather依赖pyarrow，未安装时写入和读取都退回到CSV，
+同名的旧CSV/pickle文件也能继续读取。
+"""
+
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  pandas的Parquet/Feather读写依赖pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 读取时按顺序查找的文件格式
+TABLE_FORMATS = ['parquet', 'feather', 'csv', 'pkl']
+
+# 以字典编码保存的ID列
+CATEGORICAL_COLUMNS = ('user_id', 'song_id', 'track_id', 'artist_id')
+
+# 取值为整数时压缩为int8的评分列
+RATING_COLUMNS = ('rating',)
+
+
+def compact_dtypes(df, categorical_columns=CATEGORICAL_COLUMNS):
+    """把DataFrame转换为紧凑的列类型
+
+    Args:
+        df: 原始DataFrame
+        categorical_columns: 转换为category类型的列名
+
+    Returns:
+        转换后的新DataFrame
+    """
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if col in categorical_columns:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                df[col] = values.astype('category')
+        elif col in RATING_COLUMNS and pd.api.types.is_numeric_dtype(values):
+            numbers = values.to_numpy(dtype=np.float64)
+            integral = np.isfinite(numbers).all() and (numbers == np.round(numbers)).all()
+            if integral and (len(numbers) == 0 or (numbers.min() >= -128 and numbers.max() <= 127)):
+                df[col] = numbers.astype(np.int8)
+            else:
+                df[col] = numbers.astype(np.float32)
+        elif pd.api.types.is_bool_dtype(values):
+            continue
+        elif pd.api.types.is_integer_dtype(values):
+            df[col] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values):
+            df[col] = values.astype(np.float32)
+    return df
+
+
+def table_path(directory, name, fmt):
+    """表文件路径，如 processed_data/songs.parquet"""
+    return os.path.join(directory, f'{name}.{fmt}')
+
+
+def find_table(directory, name):
+    """按 TABLE_FORMATS 的顺序查找已保存的表
+
+    Args:
+        directory: 数据目录
+        name: 表名，如 'songs' 或 'user_song_interactions'
+
+    Returns:
+        文件路径，不存在时返回None
+    """
+    for fmt in TABLE_FORMATS:
+        if fmt in ('parquet', 'feather') and not PYARROW_AVAILABLE:
+            continue
+        path = table_path(directory, name, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def save_table(df, directory, name, fmt='parquet', compact=True):
+    """保存一张表
+
+    Args:
+        df: 要保存的DataFrame
+        directory: 数据目录
+        name: 表名
+        fmt: 'parquet'、'feather' 或 'csv'
+        compact: 是否先转换为紧凑的列类型
+
+    Returns:
+        写入的文件路径
+    """
+    os.makedirs(directory, exist_ok=True)
+    if fmt in ('parquet', 'feather') and not PYARROW_AVAILABLE:
+        logger.warning(f"未安装pyarrow，{name}表以CSV格式保存")
+        fmt = 'csv'
+
+    path = table_path(directory, name, fmt)
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        if compact:
+            df = compact_dtypes(df)
+        df = df.reset_index(drop=True)
+        if fmt == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_feather(path)
+
+    # 删除读取时优先级更高的同名旧文件，避免读取到过期的数据
+    for other in TABLE_FORMATS[:TABLE_FORMATS.index(fmt)]:
+        other_path = table_path(directory, name, other)
+        if os.path.exists(other_path):
+            os.remove(other_path)
+
+    logger.info(f"已保存{name}表: {path} ({len(df)}行)")
+    return path
+
+
+def read_table_file(path, columns=None):
+    """按扩展名读取表文件
+
+    Args:
+        path: 文件路径
+        columns: 需要读取的列，None表示全部列
+
+    Returns:
+        DataFrame
+    """
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    if ext == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    if ext == 'feather':
+        return pd.read_feather(path, columns=columns)
+    if ext == 'pkl':
+        df = pd.read_pickle(path)
+        return df[columns] if columns is not None else df
+    return pd.read_csv(path, usecols=columns)
+
+
+def table_columns(path):
+    """读取表文件的列名，列式格式只读取文件头中的结构信息
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        列名列表
+    """
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    if ext == 'parquet':
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    if ext == 'feather':
+        import pyarrow as pa
+        return list(pa.ipc.open_file(pa.memory_map(path)).schema.names)
+    if ext == 'pkl':
+        return list(pd.read_pickle(path).columns)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def iter_table_chunks(path, columns=None, chunk_rows=1 << 18):
+    """按块读取表文件，峰值内存只与块大小有关
+
+    Parquet按row group分批读取，Feather按record batch读取，CSV按 chunk_rows 行读取；
+    pickle只能整表读取后再切片。每块最多 chunk_rows 行。
+
+    Args:
+        path: 文件路径
+        columns: 需要读取的列，None表示全部列
+        chunk_rows: 每块的最大行数
+
+    Yields:
+        DataFrame
+    """
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    if ext == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    if ext == 'feather':
+        import pyarrow as pa
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = pa.RecordBatch.from_arrays(
+                    [batch.column(batch.schema.get_field_index(col)) for col in columns], names=list(columns))
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(start, chunk_rows).to_pandas()
+        return
+    if ext == 'pkl':
+        df = read_table_file(path, columns=columns)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+
+
+def load_table(directory, name, columns=None):
+    """读取一张表，优先使用列式格式
+
+    Args:
+        directory: 数据目录
+        name: 表名
+        columns: 需要读取的列，None表示全部列
+
+    Returns:
+        DataFrame，表不存在时返回None
+    """
+    path = find_table(directory, name)
+    if path is None:
+        return None
+    df = read_table_file(path, columns=columns)
+    logger.info(f"读取{name}表: {path} ({len(df)}行)")
+    return df
+
+
+class TableWriter:
+    """逐块追加写入一张表
+
+    Parquet格式下每块写为一个row group，峰值内存只与块大小有关；未安装pyarrow时
+    追加写入CSV。各块的列和类型应保持一致。
+    """
+
+    def __init__(self, directory, name, fmt='parquet'):
+        """初始化写入器
+
+        Args:
+            directory: 数据目录
+            name: 表名
+            fmt: 'parquet' 或 'csv'
+        """
+        os.makedirs(directory, exist_ok=True)
+        if fmt == 'parquet' and not PYARROW_AVAILABLE:
+            logger.warning(f"未安装pyarrow，{name}表以CSV格式保存")
+            fmt = 'csv'
+        self.fmt = fmt
+        self.path = table_path(directory, name, fmt)
+        self.n_rows = 0
+        self._writer = None
+
+        for other in TABLE_FORMATS[:TABLE_FORMATS.index(fmt)]:
+            other_path = table_path(directory, name, other)
+            if os.path.exists(other_path):
+                os.remove(other_path)
+
+    def write(self, df):
+        """追加一块数据"""
+        if self.fmt == 'csv':
+            df.to_csv(self.path, index=False, mode='w' if self.n_rows == 0 else 'a', header=self.n_rows == 0)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        self.n_rows += len(df)
+
+    def close(self):
+        """完成写入"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+潜在因子模型打分
+
+从训练脚本保存的Surprise模型(svdpp_model.pkl / cf_model.pkl)中一次性提取
+因子矩阵 pu、qi、bu、bi、yj，转换为连续的float32数组；在线阶段对一个用户
+计算全部歌曲的分数只需要一次矩阵-向量乘法加 argpartition，不再逐首调用
+model.predict。提取结果以 *_factors.npz 缓存在模型旁边，后续启动直接读取。
+"""
+
+import os
+import pickle
+import logging
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+
+def extract_surprise_factors(model):
+    """从Surprise的SVD/SVD++模型中提取因子
+
+    SVD++的用户向量为 pu + |N(u)|^-1/2 * sum(yj)，这里预先对全部用户
+    计算好，在线打分时与SVD的形式完全相同。
+
+    Args:
+        model: 训练好的surprise SVD或SVDpp模型
+
+    Returns:
+        因子字典，包含 user_factors、item_factors、user_bias、item_bias、
+        global_mean、user_ids、item_ids
+    """
+    trainset = model.trainset
+    user_factors = np.asarray(model.pu, dtype=np.float32)
+    item_factors = np.asarray(model.qi, dtype=np.float32)
+
+    # SVD++: 把隐式反馈项折叠进用户向量
+    if getattr(model, 'yj', None) is not None:
+        rows, cols = [], []
+        for inner_uid, user_ratings in trainset.ur.items():
+            for inner_iid, _ in user_ratings:
+                rows.append(inner_uid)
+                cols.append(inner_iid)
+        implicit = sp.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(trainset.n_users, trainset.n_items)
+        )
+        counts = np.asarray(implicit.sum(axis=1)).ravel()
+        counts[counts == 0] = 1
+        implicit = sp.diags(1.0 / np.sqrt(counts)).dot(implicit)
+        user_factors = user_factors + implicit.dot(np.asarray(model.yj, dtype=np.float32)).astype(np.float32)
+
+    biased = getattr(model, 'biased', True)
+    n_users, n_items = trainset.n_users, trainset.n_items
+    user_ids = [trainset.to_raw_uid(i) for i in range(n_users)]
+    item_ids = [trainset.to_raw_iid(i) for i in range(n_items)]
+
+    return {
+        'user_factors': np.ascontiguousarray(user_factors, dtype=np.float32),
+        'item_factors': np.ascontiguousarray(item_factors, dtype=np.float32),
+        'user_bias': np.asarray(model.bu if biased else np.zeros(n_users), dtype=np.float32),
+        'item_bias': np.asarray(model.bi if biased else np.zeros(n_items), dtype=np.float32),
+        'global_mean': np.float32(trainset.global_mean if biased else 0.0),
+        'user_ids': np.asarray(user_ids, dtype=str),
+        'item_ids': np.asarray(item_ids, dtype=str),
+    }
+
+
+def save_factors(path, factors):
+    """保存因子字典为npz文件
+
+    Args:
+        path: 输出文件路径
+        factors: extract_surprise_factors 返回格式的因子字典
+    """
+    np.savez(path, **factors)
+    logger.info(f"因子已保存至: {path}")
+
+
+class FactorScorer:
+    """潜在因子模型打分器
+
+    分数为 global_mean + bu + bi + qi·pu，与模型predict的未截断估计一致。
+    """
+
+    def __init__(self, factors, name='svdpp'):
+        """初始化打分器
+
+        Args:
+            factors: 因子字典
+            name: 模型名称，用于日志
+        """
+        self.name = name
+        self.user_factors = np.ascontiguousarray(factors['user_factors'], dtype=np.float32)
+        self.item_factors = np.ascontiguousarray(factors['item_factors'], dtype=np.float32)
+        self.user_bias = np.asarray(factors['user_bias'], dtype=np.float32)
+        self.item_bias = np.asarray(factors['item_bias'], dtype=np.float32)
+        self.global_mean = float(factors['global_mean'])
+        self.user_index = pd.Index(factors['user_ids'])
+        self.item_index = pd.Index(factors['item_ids'])
+
+    @classmethod
+    def load(cls, model_dir, name):
+        """加载因子模型
+
+        优先读取 {name}_factors.npz，不存在时从 {name}_model.pkl 提取并写入缓存。
+
+        Args:
+            model_dir: 模型目录
+            name: 模型名称，如 'svdpp' 或 'cf'
+
+        Returns:
+            FactorScorer实例，模型文件不存在时返回None
+        """
+        factors_path = os.path.join(model_dir, f'{name}_factors.npz')
+        model_path = os.path.join(model_dir, f'{name}_model.pkl')
+
+        if os.path.exists(factors_path) and (
+                not os.path.exists(model_path) or os.path.getmtime(factors_path) >= os.path.getmtime(model_path)):
+            with np.load(factors_path) as data:
+                factors = {key: data[key] for key in data.files}
+        elif os.path.exists(model_path):
+            with open(model_path, 'rb') as f:
+                model = pickle.load(f)
+            factors = extract_surprise_factors(model)
+            try:
+                save_factors(factors_path, factors)
+            except OSError as e:
+                logger.warning(f"无法写入因子缓存 {factors_path}: {str(e)}")
+        else:
+            return None
+
+        scorer = cls(factors, name=name)
+        logger.info(f"加载了{name}因子模型: {scorer.n_users}个用户, {scorer.n_items}首歌曲, {scorer.n_factors}个因子")
+        return scorer
+
+    @property
+    def n_users(self):
+        return self.user_factors.shape[0]
+
+    @property
+    def n_items(self):
+        return self.item_factors.shape[0]
+
+    @property
+    def n_factors(self):
+        return self.item_factors.shape[1]
+
+    def user_code(self, user_id):
+        """获取模型内的用户编码，不存在时返回-1"""
+        try:
+            return int(self.user_index.get_loc(str(user_id)))
+        except KeyError:
+            return -1
+
+    def score_vector(self, user_vector, user_bias=0.0):
+        """用给定的用户向量对全部歌曲打分
+
+        Args:
+            user_vector: 用户潜在向量
+            user_bias: 用户偏置
+
+        Returns:
+            float32分数数组，长度为歌曲数
+        """
+        scores = self.item_factors @ np.asarray(user_vector, dtype=np.float32)
+        scores += self.item_bias
+        scores += np.float32(self.global_mean + user_bias)
+        return scores
+
+    def score_all(self, user_id):
+        """对全部歌曲打分
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            float32分数数组，用户不在模型中时返回None
+        """
+        code = self.user_code(user_id)
+        if code < 0:
+            return None
+        return self.score_vector(self.user_factors[code], self.user_bias[code])
+
+    def score_items(self, user_id, song_ids):
+        """对指定歌曲打分
+
+        Args:
+            user_id: 用户ID
+            song_ids: 歌曲ID序列
+
+        Returns:
+            与输入对齐的float32分数数组，模型中不存在的用户或歌曲为NaN
+        """
+        scores = np.full(len(song_ids), np.nan, dtype=np.float32)
+        code = self.user_code(user_id)
+        if code < 0:
+            return scores
+
+        item_codes = self.item_index.get_indexer([str(song_id) for song_id in song_ids])
+        known = np.flatnonzero(item_codes >= 0)
+        scores[known] = self.item_factors[item_codes[known]] @ self.user_factors[code]
+        scores[known] += self.item_bias[item_codes[known]] + np.float32(self.global_mean + self.user_bias[code])
+        return scores
+
+    def top_items(self, scores, top_n=10, exclude_ids=None):
+        """从分数数组中取前N首歌曲
+
+        Args:
+            scores: score_all / score_vector 返回的分数数组
+            top_n: 返回数量
+            exclude_ids: 需要排除的歌曲ID(如用户已评分的歌曲)
+
+        Returns:
+            [(song_id, score), ...]，按分数降序
+        """
+        scores = scores.copy()
+        if exclude_ids:
+            excluded = self.item_index.get_indexer([str(song_id) for song_id in exclude_ids])
+            scores[excluded[excluded >= 0]] = -np.inf
+
+        top_n = min(top_n, len(scores))
+        if top_n <= 0:
+            return []
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top])]
+        return list(zip(self.item_index[top].tolist(), scores[top].tolist()))
+
+    def recommend(self, user_id, top_n=10, exclude_ids=None):
+        """为模型中的用户生成推荐
+
+        Args:
+            user_id: 用户ID
+            top_n: 推荐数量
+            exclude_ids: 需要排除的歌曲ID
+
+        Returns:
+            [(song_id, score), ...]，用户不在模型中时返回空列表
+        """
+        scores = self.score_all(user_id)
+        if scores is None:
+            return []
+        return self.top_items(scores, top_n, exclude_ids)
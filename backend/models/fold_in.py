@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+新用户的潜在因子折叠(fold-in)
+
+注册后刚评过几首歌的用户不在离线训练的因子模型中。固定歌曲因子，
+用该用户当前的评分(由 RatingIngestor 从SQLite同步到内存评分矩阵)求解一个
+k 维的小型岭回归即可得到用户向量，不需要重新训练:
+
+- 显式评分(SVD/SVD++): 目标为 r - mu - bi，同时求解用户向量和用户偏置，
+  正则项按评分数缩放，与Surprise逐条SGD的训练目标一致；
+- 隐式ALS: 偏好为1，置信度 c = 1 + alpha * r，与训练时的加权最小二乘相同。
+
+求得的向量按用户缓存(LRU)，用户有新评分时通过推荐引擎的评分回调失效。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def fold_in_explicit(item_factors, item_bias, global_mean, ratings, reg=0.02, biased=True):
+    """对显式评分求解用户向量和偏置
+
+    最小化 sum (r - mu - bi - bu - p·qi)^2 + reg * n * (|p|^2 + bu^2)。
+
+    Args:
+        item_factors: 用户评过分的歌曲的因子矩阵，形状为 (n, k)
+        item_bias: 这些歌曲的偏置
+        global_mean: 全局均值
+        ratings: 评分
+        reg: 正则化系数
+        biased: 模型是否带偏置项，为False时只求用户向量
+
+    Returns:
+        (用户向量, 用户偏置)
+    """
+    q = np.asarray(item_factors, dtype=np.float64)
+    target = np.asarray(ratings, dtype=np.float64) - global_mean - np.asarray(item_bias, dtype=np.float64)
+    if biased:
+        q = np.hstack([q, np.ones((len(q), 1))])
+    gram = q.T @ q
+    gram[np.diag_indices_from(gram)] += reg * len(q)
+    solution = np.linalg.solve(gram, q.T @ target)
+    if biased:
+        return solution[:-1].astype(np.float32), float(solution[-1])
+    return solution.astype(np.float32), 0.0
+
+
+def fold_in_implicit(item_gram, item_factors, ratings, reg=0.01, alpha=40.0):
+    """对隐式反馈求解用户向量
+
+    求解 (YtY + Yu^T (Cu - I) Yu + reg*I) x = Yu^T Cu 1。
+
+    Args:
+        item_gram: 全部歌曲因子的 YtY
+        item_factors: 用户有记录的歌曲的因子矩阵 Yu
+        ratings: 评分或播放次数
+        reg: 正则化系数
+        alpha: 置信度系数
+
+    Returns:
+        (用户向量, 0.0)
+    """
+    y = np.asarray(item_factors, dtype=np.float64)
+    confidence = 1.0 + alpha * np.asarray(ratings, dtype=np.float64)
+    gram = item_gram + (y.T * (confidence - 1.0)) @ y
+    gram[np.diag_indices_from(gram)] += reg
+    return np.linalg.solve(gram, y.T @ confidence).astype(np.float32), 0.0
+
+
+class FoldInScorer:
+    """为模型外的用户折叠向量的因子打分器
+
+    模型内的用户直接使用训练好的向量，其余用户用当前评分折叠出向量并缓存；
+    打分接口与 FactorScorer 相同，可以直接交给排序阶段使用。
+    """
+
+    def __init__(self, scorer, ratings_fn, reg=None, alpha=40.0, max_users=10000):
+        """初始化打分器
+
+        Args:
+            scorer: FactorScorer实例
+            ratings_fn: 读取用户当前评分的函数，返回 {song_id: rating}
+            reg: 正则化系数，默认显式评分为0.02(按评分数缩放)，隐式ALS为0.01
+            alpha: 隐式ALS的置信度系数
+            max_users: 最多缓存的折叠用户数
+        """
+        self.scorer = scorer
+        self.ratings_fn = ratings_fn
+        self.implicit = scorer.name == 'als'
+        self.reg = reg if reg is not None else (0.01 if self.implicit else 0.02)
+        self.alpha = alpha
+        self.max_users = max_users
+        self.biased = bool(np.any(scorer.item_bias) or scorer.global_mean)
+
+        self._item_gram = None
+        self._cache = OrderedDict()  # user_id -> (用户向量, 用户偏置)
+        self._lock = threading.Lock()
+        self._version = 0  # 每次失效加1，计算期间发生失效的结果不写入缓存
+
+    @property
+    def name(self):
+        return self.scorer.name
+
+    def _gram(self):
+        """全部歌曲因子的 YtY，只在隐式模式下首次折叠时计算"""
+        if self._item_gram is None:
+            factors = np.asarray(self.scorer.item_factors, dtype=np.float64)
+            self._item_gram = factors.T @ factors
+        return self._item_gram
+
+    def fold_in(self, user_ratings):
+        """用一组评分折叠出用户向量
+
+        Args:
+            user_ratings: {song_id: rating}
+
+        Returns:
+            (用户向量, 用户偏置)，没有一首歌曲在模型中时返回None
+        """
+        if not user_ratings:
+            return None
+        codes = self.scorer.item_index.get_indexer([str(song_id) for song_id in user_ratings])
+        known = codes >= 0
+        if not known.any():
+            return None
+        codes = codes[known]
+        ratings = np.fromiter(user_ratings.values(), dtype=np.float64, count=len(known))[known]
+
+        item_factors = self.scorer.item_factors[codes]
+        if self.implicit:
+            return fold_in_implicit(self._gram(), item_factors, ratings, self.reg, self.alpha)
+        return fold_in_explicit(item_factors, self.scorer.item_bias[codes], self.scorer.global_mean,
+                                ratings, self.reg, self.biased)
+
+    def user_vector(self, user_id):
+        """获取用户向量
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            (用户向量, 用户偏置)，模型外且没有可用评分的用户返回None
+        """
+        code = self.scorer.user_code(user_id)
+        if code >= 0:
+            return self.scorer.user_factors[code], float(self.scorer.user_bias[code])
+
+        with self._lock:
+            if user_id in self._cache:
+                self._cache.move_to_end(user_id)
+                return self._cache[user_id]
+            version = self._version
+
+        vector = self.fold_in(self.ratings_fn(user_id))
+        if vector is None:
+            return None
+
+        with self._lock:
+            if self._version == version:
+                self._cache[user_id] = vector
+                if len(self._cache) > self.max_users:
+                    self._cache.popitem(last=False)
+        return vector
+
+    def has_user(self, user_id):
+        """是否能为用户给出向量(模型内的用户，或有可折叠评分的新用户)"""
+        return self.user_vector(user_id) is not None
+
+    def invalidate(self, user_ids):
+        """评分变化时清除这些用户的缓存向量，可作为推荐引擎的评分回调
+
+        Args:
+            user_ids: 用户ID列表
+        """
+        with self._lock:
+            self._version += 1
+            for user_id in user_ids:
+                self._cache.pop(user_id, None)
+
+    def score_items(self, user_id, song_ids):
+        """对指定歌曲打分
+
+        Args:
+            user_id: 用户ID
+            song_ids: 歌曲ID序列
+
+        Returns:
+            与输入对齐的float32分数数组，没有用户向量或歌曲不在模型中时为NaN
+        """
+        scores = np.full(len(song_ids), np.nan, dtype=np.float32)
+        vector = self.user_vector(user_id)
+        if vector is None:
+            return scores
+
+        user_vector, user_bias = vector
+        item_codes = self.scorer.item_index.get_indexer([str(song_id) for song_id in song_ids])
+        known = np.flatnonzero(item_codes >= 0)
+        scores[known] = self.scorer.item_factors[item_codes[known]] @ user_vector
+        scores[known] += self.scorer.item_bias[item_codes[known]] + np.float32(self.scorer.global_mean + user_bias)
+        return scores
+
+    def recommend(self, user_id, top_n=10, exclude_ids=None):
+        """为用户生成推荐
+
+        Args:
+            user_id: 用户ID
+            top_n: 推荐数量
+            exclude_ids: 需要排除的歌曲ID
+
+        Returns:
+            [(song_id, score), ...]，没有用户向量时返回空列表
+        """
+        vector = self.user_vector(user_id)
+        if vector is None:
+            return []
+        return self.scorer.top_items(self.scorer.score_vector(*vector), top_n, exclude_ids)
+
+    def cache_info(self):
+        """缓存状态"""
+        with self._lock:
+            return {'users': len(self._cache), 'max_users': self.max_users}
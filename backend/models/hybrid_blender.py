@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+加权混合排序
+
+召回得到的候选集合交给各打分器(协同过滤、SVD++、NCF、MLP、内容)分别打分，
+打分在线程池中并行进行(NumPy矩阵运算会释放GIL)。每个打分器的分数先在候选
+集合上做min-max归一化，再按配置的权重加权求和，最后用一次 argpartition 取前N。
+某个模型不可用或出错时只跳过该打分器，剩余打分器的权重重新归一化。
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class HybridBlender:
+    """加权混合器
+
+    打分器以 (名称, 权重, 打分函数) 的形式传入，打分函数签名为
+    fn(user_id, song_ids) -> 与song_ids对齐的分数数组，无法打分的歌曲为NaN；
+    返回None表示该打分器不可用。
+    """
+
+    def __init__(self, max_workers=5):
+        """初始化混合器
+
+        Args:
+            max_workers: 并行打分的线程数
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hybrid')
+
+    @staticmethod
+    def _normalize(scores):
+        """把分数min-max归一化到[0, 1]"""
+        scores = np.asarray(scores, dtype=np.float64)
+        low, high = scores.min(), scores.max()
+        if high - low < 1e-12:
+            return np.ones_like(scores)
+        return (scores - low) / (high - low)
+
+    def _score(self, name, fn, user_id, song_ids):
+        """调用一个打分器，出错时视为不可用"""
+        try:
+            return fn(user_id, song_ids)
+        except Exception as e:
+            logger.error(f"{name}打分时出错: {str(e)}")
+            return None
+
+    def blend(self, user_id, song_ids, scorers, top_n=10):
+        """对候选歌曲加权混合排序
+
+        Args:
+            user_id: 用户ID
+            song_ids: 候选歌曲ID数组，同分时保持该顺序
+            scorers: [(名称, 权重, 打分函数), ...]
+            top_n: 返回数量
+
+        Returns:
+            [(song_id, 混合分数, 参与打分的打分器名称列表), ...]，按分数降序；
+            没有任何打分器能给出分数时返回空列表
+        """
+        song_ids = np.asarray(song_ids, dtype=object)
+        scorers = [(name, weight, fn) for name, weight, fn in scorers if weight > 0]
+        futures = [
+            (name, weight, self._executor.submit(self._score, name, fn, user_id, song_ids))
+            for name, weight, fn in scorers
+        ]
+
+        names, weights, columns, masks = [], [], [], []
+        for name, weight, future in futures:
+            scores = future.result()
+            if scores is None:
+                continue
+            scores = np.asarray(scores, dtype=np.float64)
+            scored = np.isfinite(scores)
+            if not scored.any():
+                continue
+            column = np.zeros(len(song_ids))
+            column[scored] = self._normalize(scores[scored])
+            names.append(name)
+            weights.append(weight)
+            columns.append(column)
+            masks.append(scored)
+
+        if not names:
+            return []
+
+        # 可用打分器的权重重新归一化
+        weights = np.asarray(weights, dtype=np.float64) / sum(weights)
+        totals = np.column_stack(columns) @ weights
+        contributed = np.column_stack(masks)
+
+        top_n = min(top_n, len(totals))
+        if top_n <= 0:
+            return []
+        top = np.argpartition(-totals, top_n - 1)[:top_n]
+        top = top[np.lexsort((top, -totals[top]))]
+
+        return [
+            (song_ids[i], float(totals[i]), [names[j] for j in np.flatnonzero(contributed[i])])
+            for i in top
+        ]
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=False)
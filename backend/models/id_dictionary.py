@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+用户/歌曲ID与连续整数编码之间的字典
+
+编码按ID首次出现的顺序分配，新ID只追加到末尾，已有编码保持不变。
+ID保存为定长Unicode的NumPy数组，另存一份按字典序排列的下标，批量编码
+用带 sorter 的二分查找(np.searchsorted)完成，解码直接按编码取下标；
+两个数组以 .npy 格式保存，加载时可以内存映射，不需要构建Python字典。
+
+整条流水线共用数据目录(processed_data)中的 user / song 两个字典:
+数据处理脚本创建，训练脚本和产物写入时只追加新ID，评分矩阵、产物版本和
+NCF/MLP模型的编码因此完全一致。
+"""
+
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 数据目录中共享的用户/歌曲字典名
+USER_DICTIONARY = 'user'
+SONG_DICTIONARY = 'song'
+
+
+def _as_str_array(values):
+    """把ID序列转换为Unicode字符串数组"""
+    values = np.asarray(values)
+    if values.dtype.kind != 'U':
+        values = values.astype(str)
+    return values
+
+
+def _widen(values, itemsize):
+    """必要时加宽定长字符串数组，避免插入较长的ID时被截断"""
+    if values.dtype.itemsize < itemsize:
+        return values.astype(f'U{itemsize // 4}')
+    return values
+
+
+class IdDictionary:
+    """追加式的ID字典
+
+    Attributes:
+        ids: 按编码顺序排列的ID数组，ids[code] 即该编码对应的ID
+    """
+
+    def __init__(self, ids=None, order=None):
+        """初始化字典
+
+        Args:
+            ids: 按编码顺序排列的唯一ID，None表示空字典
+            order: ids按字典序排序后的下标(np.argsort(ids))，None时重新计算
+        """
+        self.ids = _as_str_array(ids if ids is not None else np.array([], dtype='U1'))
+        if order is None:
+            order = np.argsort(self.ids, kind='stable')
+        self._order = np.asarray(order, dtype=np.int64)
+
+    @classmethod
+    def from_ids(cls, values):
+        """按首次出现的顺序为一列ID建立字典
+
+        Args:
+            values: ID序列，可以有重复
+
+        Returns:
+            IdDictionary
+        """
+        return cls(pd.unique(_as_str_array(values)))
+
+    @classmethod
+    def factorize(cls, values):
+        """为一列ID建立字典并同时返回每个值的编码，与 from_ids 的编码一致
+
+        Args:
+            values: ID序列，可以有重复
+
+        Returns:
+            (IdDictionary, int64编码数组)
+        """
+        codes, uniques = pd.factorize(_as_str_array(values))
+        return cls(uniques), codes.astype(np.int64)
+
+    @classmethod
+    def load_and_extend(cls, directory, name, values):
+        """加载目录中的共享字典，追加新ID后写回；字典不存在时新建
+
+        Args:
+            directory: 字典所在目录
+            name: 字典名，USER_DICTIONARY 或 SONG_DICTIONARY
+            values: 需要能够编码的ID序列
+
+        Returns:
+            IdDictionary
+        """
+        dictionary = cls.load(directory, name, mmap=False)
+        created = dictionary is None
+        if created:
+            dictionary = cls.from_ids(values)
+            added = len(dictionary)
+        else:
+            added = dictionary.add(values)
+        if created or added:
+            dictionary.save(directory, name)
+        return dictionary
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, value):
+        return bool(self.encode([value])[0] >= 0)
+
+    def encode(self, values, add=False):
+        """批量把ID转换为编码
+
+        Args:
+            values: ID序列
+            add: 是否先把不认识的ID追加到字典中
+
+        Returns:
+            int64编码数组，不在字典中的ID为-1
+        """
+        values = _as_str_array(values)
+        if add:
+            self.add(values)
+        if len(self) == 0 or len(values) == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+
+        codes = self._lookup(values)
+        return np.where(self.ids[codes] == values, codes, -1)
+
+    def _lookup(self, values):
+        """二分查找每个值在字典序中的位置，返回该位置上的编码(未必匹配)"""
+        positions = np.searchsorted(self.ids, values, sorter=self._order)
+        return self._order[np.minimum(positions, len(self) - 1)]
+
+    def extended(self, values):
+        """返回追加了新ID的新字典，原字典保持不变，可以继续被并发读取
+
+        Args:
+            values: ID序列
+
+        Returns:
+            (新字典, 每个ID的int64编码数组)
+        """
+        dictionary = IdDictionary(self.ids, self._order)
+        dictionary.add(values)
+        return dictionary, dictionary.encode(values)
+
+    def decode(self, codes):
+        """批量把编码转换回ID
+
+        Args:
+            codes: 编码序列
+
+        Returns:
+            ID数组
+        """
+        return self.ids[np.asarray(codes, dtype=np.int64)]
+
+    def add(self, values):
+        """追加新ID，已有ID的编码不变
+
+        Args:
+            values: ID序列，可以包含已有ID和重复ID
+
+        Returns:
+            新增的ID数量
+        """
+        values = _as_str_array(values)
+        if len(values) == 0:
+            return 0
+        if len(self):
+            values = values[self.ids[self._lookup(values)] != values]
+        new_ids = pd.unique(values)
+        if len(new_ids) == 0:
+            return 0
+        new_ids = np.asarray(new_ids, dtype=str)
+
+        itemsize = max(self.ids.dtype.itemsize, new_ids.dtype.itemsize)
+        new_codes = np.arange(len(self), len(self) + len(new_ids), dtype=np.int64)
+        new_order = np.argsort(new_ids, kind='stable')
+        insert_at = np.searchsorted(self.ids, new_ids[new_order], sorter=self._order)
+
+        self.ids = np.concatenate([_widen(self.ids, itemsize), _widen(new_ids, itemsize)])
+        self._order = np.insert(self._order, insert_at, new_codes[new_order])
+        return len(new_ids)
+
+    @staticmethod
+    def _paths(directory, name):
+        return (os.path.join(directory, f'{name}_ids.npy'),
+                os.path.join(directory, f'{name}_order.npy'))
+
+    def save(self, directory, name):
+        """保存为 {name}_ids.npy 和 {name}_order.npy
+
+        先写临时文件再替换，读取方不会看到写了一半的文件。
+
+        Args:
+            directory: 输出目录
+            name: 字典名，如 'user' 或 'song'
+        """
+        os.makedirs(directory, exist_ok=True)
+        for path, array in zip(self._paths(directory, name), (self.ids, self._order)):
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, path)
+        logger.info(f"ID字典已保存: {name} ({len(self)}个ID)")
+
+    @classmethod
+    def load(cls, directory, name, mmap=True):
+        """加载已保存的字典
+
+        Args:
+            directory: 目录
+            name: 字典名
+            mmap: 是否以内存映射方式打开
+
+        Returns:
+            IdDictionary，文件不存在时返回None
+        """
+        ids_path, order_path = cls._paths(directory, name)
+        if not (os.path.exists(ids_path) and os.path.exists(order_path)):
+            return None
+        mmap_mode = 'r' if mmap else None
+        return cls(np.load(ids_path, mmap_mode=mmap_mode), np.load(order_path, mmap_mode=mmap_mode))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+隐式反馈ALS(交替最小二乘)训练
+
+直接以播放次数构建稀疏的用户-歌曲矩阵，不再把播放次数压成1-5分交给Surprise。
+采用 Hu/Koren/Volinsky 的置信度加权: 偏好 p_ui = 1(有播放)，置信度
+c_ui = 1 + alpha * r_ui(或 1 + alpha * log(1 + r_ui / epsilon))，目标为
+
+    sum c_ui (p_ui - x_u·y_i)^2 + reg * (|x_u|^2 + |y_i|^2)
+
+固定歌曲因子求用户因子、再固定用户因子求歌曲因子，交替进行。每一侧的
+最小二乘按行分块用共轭梯度(CG)迭代求解: 一个分块内所有行的CG同时进行，
+矩阵-向量乘法由 YtY 的稠密乘法和一次稀疏-稠密乘法完成，只涉及该分块的
+非零元素；分块在线程池中并行(NumPy/SciPy的矩阵运算会释放GIL)。
+结果以 FactorScorer 读取的 *_factors.npz 格式导出，偏置项为0。
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .factor_scorer import save_factors
+
+logger = logging.getLogger(__name__)
+
+
+def plays_matrix(plays_df, user_col='user_id', song_col='song_id', plays_col='plays'):
+    """从播放记录构建用户-歌曲播放次数矩阵
+
+    同一用户对同一歌曲的多条记录累加。
+
+    Args:
+        plays_df: 播放记录DataFrame
+        user_col: 用户ID列名
+        song_col: 歌曲ID列名
+        plays_col: 播放次数列名
+
+    Returns:
+        (float32 CSR矩阵, 行对应的用户ID, 列对应的歌曲ID)
+    """
+    user_codes, user_ids = pd.factorize(plays_df[user_col])
+    song_codes, song_ids = pd.factorize(plays_df[song_col])
+    plays = sp.csr_matrix(
+        (plays_df[plays_col].to_numpy(dtype=np.float32), (user_codes, song_codes)),
+        shape=(len(user_ids), len(song_ids)),
+        dtype=np.float32
+    )
+    plays.sum_duplicates()
+    return plays, np.asarray(user_ids, dtype=str), np.asarray(song_ids, dtype=str)
+
+
+def confidence_weights(plays, alpha=40.0, epsilon=None):
+    """计算置信度中超出1的部分 c_ui - 1
+
+    Args:
+        plays: 播放次数稀疏矩阵
+        alpha: 置信度系数
+        epsilon: 不为None时使用对数缩放 alpha * log(1 + r / epsilon)
+
+    Returns:
+        float32 CSR矩阵，非零位置与 plays 相同
+    """
+    confidence = sp.csr_matrix(plays, dtype=np.float32, copy=True)
+    if epsilon is None:
+        confidence.data *= alpha
+    else:
+        confidence.data = (alpha * np.log1p(confidence.data / epsilon)).astype(np.float32)
+    return confidence
+
+
+def row_blocks(indptr, max_rows=4096, max_nnz=1000000):
+    """按行数和非零元素数把CSR矩阵的行切成若干分块
+
+    Args:
+        indptr: CSR矩阵的indptr
+        max_rows: 每块最多行数
+        max_nnz: 每块最多非零元素数(单行超过时该行单独成块)
+
+    Returns:
+        [(起始行, 结束行), ...]
+    """
+    n_rows = len(indptr) - 1
+    blocks = []
+    start = 0
+    while start < n_rows:
+        limit = np.searchsorted(indptr, indptr[start] + max_nnz, side='right') - 1
+        end = max(start + 1, min(start + max_rows, n_rows, limit))
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+def _row_dot(a, b):
+    """逐行点积"""
+    return np.einsum('ij,ij->i', a, b)
+
+
+def conjugate_gradient_block(confidence, fixed, gram, x, cg_steps=3):
+    """对一个分块内的所有行同时做共轭梯度迭代
+
+    第u行求解 (YtY + reg*I + Yt (C_u - I) Y) x_u = Yt C_u p_u，
+    其中 gram = YtY + reg*I。
+
+    Args:
+        confidence: 分块的 c - 1 稀疏矩阵(CSR)，形状为 (分块行数, 对侧数量)
+        fixed: 对侧的因子矩阵 Y
+        gram: YtY + reg*I
+        x: 分块行的当前因子，作为迭代初值
+        cg_steps: CG迭代次数
+
+    Returns:
+        更新后的分块因子
+    """
+    shape = confidence.shape
+    indptr, indices, data = confidence.indptr, confidence.indices, confidence.data
+    rows = np.repeat(np.arange(shape[0]), np.diff(indptr))
+    neighbors = fixed[indices]
+
+    def matvec(v):
+        # (gram + Yt (C_u - I) Y) v: 稀疏部分只在有播放的位置计算
+        weights = _row_dot(neighbors, v[rows]) * data
+        return v @ gram + sp.csr_matrix((weights, indices, indptr), shape=shape) @ fixed
+
+    x = np.array(x, dtype=np.float32)
+    b = sp.csr_matrix((data + 1, indices, indptr), shape=shape) @ fixed
+    r = b - matvec(x)
+    p = r.copy()
+    rs = _row_dot(r, r)
+
+    for _ in range(cg_steps):
+        ap = matvec(p)
+        denom = _row_dot(p, ap)
+        step = np.divide(rs, denom, out=np.zeros_like(rs), where=denom > 0)
+        x += step[:, None] * p
+        r -= step[:, None] * ap
+        rs_new = _row_dot(r, r)
+        if rs_new.max(initial=0) < 1e-20:
+            break
+        beta = np.divide(rs_new, rs, out=np.zeros_like(rs), where=rs > 0)
+        p = r + beta[:, None] * p
+        rs = rs_new
+    return x
+
+
+class ImplicitALS:
+    """置信度加权的隐式反馈ALS模型"""
+
+    def __init__(self, n_factors=64, regularization=0.01, alpha=40.0, epsilon=None,
+                 iterations=15, cg_steps=3, n_workers=None, block_rows=4096,
+                 block_nnz=1000000, random_state=42):
+        """初始化模型
+
+        Args:
+            n_factors: 潜在因子数
+            regularization: L2正则化系数
+            alpha: 置信度系数
+            epsilon: 不为None时置信度使用对数缩放
+            iterations: 交替迭代轮数
+            cg_steps: 每轮每行的共轭梯度步数
+            n_workers: 线程数，默认为CPU核数
+            block_rows: 每个分块的最多行数
+            block_nnz: 每个分块的最多非零元素数
+            random_state: 因子初始化的随机种子
+        """
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.iterations = iterations
+        self.cg_steps = cg_steps
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.block_rows = block_rows
+        self.block_nnz = block_nnz
+        self.random_state = random_state
+
+        self.user_factors = None
+        self.item_factors = None
+
+    def _solve(self, executor, confidence, fixed, target):
+        """固定一侧因子，分块并行更新另一侧的全部因子(原地写入 target)"""
+        gram = (fixed.T @ fixed).astype(np.float32)
+        gram[np.diag_indices_from(gram)] += self.regularization
+
+        def solve_block(block):
+            start, end = block
+            target[start:end] = conjugate_gradient_block(
+                confidence[start:end], fixed, gram, target[start:end], self.cg_steps)
+
+        blocks = row_blocks(confidence.indptr, self.block_rows, self.block_nnz)
+        list(executor.map(solve_block, blocks))
+
+    def fit(self, plays):
+        """训练模型
+
+        Args:
+            plays: 用户-歌曲播放次数稀疏矩阵，形状为 (用户数, 歌曲数)
+
+        Returns:
+            self
+        """
+        confidence = confidence_weights(plays, self.alpha, self.epsilon)
+        confidence.sort_indices()
+        confidence_t = confidence.T.tocsr()
+        confidence_t.sort_indices()
+        n_users, n_items = confidence.shape
+
+        rng = np.random.default_rng(self.random_state)
+        if self.user_factors is None or self.user_factors.shape != (n_users, self.n_factors):
+            self.user_factors = (rng.standard_normal((n_users, self.n_factors)) * 0.01).astype(np.float32)
+        if self.item_factors is None or self.item_factors.shape != (n_items, self.n_factors):
+            self.item_factors = (rng.standard_normal((n_items, self.n_factors)) * 0.01).astype(np.float32)
+
+        logger.info(f"开始训练隐式ALS: {n_users}个用户, {n_items}首歌曲, {confidence.nnz}条播放记录, "
+                    f"{self.n_factors}个因子, {self.n_workers}个线程")
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix='als') as executor:
+            for iteration in range(self.iterations):
+                iteration_start = time.time()
+                self._solve(executor, confidence, self.item_factors, self.user_factors)
+                self._solve(executor, confidence_t, self.user_factors, self.item_factors)
+                logger.info(f"ALS第{iteration + 1}/{self.iterations}轮完成，用时: {time.time() - iteration_start:.2f}秒")
+
+        logger.info(f"隐式ALS训练完成，用时: {time.time() - start_time:.2f}秒")
+        return self
+
+    def to_factors(self, user_ids, item_ids):
+        """转换为 FactorScorer 使用的因子字典
+
+        Args:
+            user_ids: 行对应的用户ID
+            item_ids: 列对应的歌曲ID
+
+        Returns:
+            因子字典，偏置项和全局均值为0
+        """
+        n_users, n_items = self.user_factors.shape[0], self.item_factors.shape[0]
+        return {
+            'user_factors': np.ascontiguousarray(self.user_factors, dtype=np.float32),
+            'item_factors': np.ascontiguousarray(self.item_factors, dtype=np.float32),
+            'user_bias': np.zeros(n_users, dtype=np.float32),
+            'item_bias': np.zeros(n_items, dtype=np.float32),
+            'global_mean': np.float32(0.0),
+            'user_ids': np.asarray(user_ids, dtype=str),
+            'item_ids': np.asarray(item_ids, dtype=str),
+        }
+
+    def save(self, path, user_ids, item_ids):
+        """以 *_factors.npz 格式保存因子
+
+        Args:
+            path: 输出npz路径，如 processed_data/als_factors.npz
+            user_ids: 行对应的用户ID
+            item_ids: 列对应的歌曲ID
+        """
+        save_factors(path, self.to_factors(user_ids, item_ids))
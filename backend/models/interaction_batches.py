@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+NCF/MLP训练的小批量数据流
+
+交互表通过 columnar_store 按块(Parquet的row group、CSV的若干行)读取一遍，每块的
+用户/歌曲ID用共享的ID字典编码为 int32，目标值为 float32，各自写成一个 .npy 分片，
+整张表不会同时载入内存。每个epoch打乱分片顺序，每个任务取若干分片合并后打乱、
+为每个正样本随机配若干首该用户没有听过的歌曲作为负样本(目标值0)。
+负样本整批向量化抽取: 把 (用户, 歌曲) 编码成一个int64键，用二分查找剔除落在
+正样本里的候选并重新抽取；正样本键取自整张交互表，只在部分交互上训练(如热启动)时
+也不会把用户听过的歌曲当作负样本。各任务在后台线程中提前生成(NumPy运算会释放GIL)，
+训练时取批和准备后续批次互相重叠。
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .columnar_store import iter_table_chunks, table_columns
+
+logger = logging.getLogger(__name__)
+
+# 每个分片的最大交互数
+SHARD_ROWS = 1 << 18
+
+
+def _read_shard(shard):
+    """读取一个分片，分片为 (用户编码, 歌曲编码, 目标值)，各项可以是数组或 .npy 文件路径"""
+    return tuple(np.load(part) if isinstance(part, str) else part for part in shard)
+
+
+def _write_shard(directory, index, users, items, targets):
+    """把一个分片写成三个 .npy 文件，返回文件路径"""
+    paths = []
+    for name, array in (('users', users), ('items', items), ('targets', targets)):
+        path = os.path.join(directory, f'{index:06d}_{name}.npy')
+        np.save(path, array)
+        paths.append(path)
+    return tuple(paths)
+
+
+class _ShardDirectory:
+    """from_table 创建的临时分片目录，训练集和验证集生成器都不再引用时删除"""
+
+    def __init__(self, path):
+        self.path = path
+        weakref.finalize(self, shutil.rmtree, path, True)
+
+
+def pair_keys(user_codes, item_codes, n_items):
+    """排好序的 (用户, 歌曲) 键，用于判断候选负样本是否被用户听过"""
+    return np.unique(np.asarray(user_codes, dtype=np.int64) * n_items + np.asarray(item_codes, dtype=np.int64))
+
+
+class InteractionBatches:
+    """带负采样的交互小批量生成器
+
+    每个批次为 ((用户编码, 歌曲编码), 目标值)，正样本在前、负样本在后，
+    可以直接交给 Keras 的 model.fit 或 tf.data.Dataset.from_generator。
+    """
+
+    def __init__(self, shards, n_items, positive_keys, batch_size=256, negatives=4, negative_target=0.0,
+                 shuffle=True, shuffle_shards=4, n_workers=None, prefetch=None, max_resample=5, seed=42):
+        """初始化生成器，一般通过 from_arrays 或 from_table 构建
+
+        Args:
+            shards: [(用户编码, 歌曲编码, 目标值), ...]，各项为数组或 .npy 文件路径
+            n_items: 歌曲总数，负样本从 [0, n_items) 中抽取
+            positive_keys: 排好序的正样本键(用户编码 * n_items + 歌曲编码)
+            batch_size: 每批的正样本数
+            negatives: 每个正样本配的负样本数，为0时不做负采样
+            negative_target: 负样本的目标值
+            shuffle: 是否每个epoch打乱顺序
+            shuffle_shards: 每个任务合并打乱的分片数，交互表按用户排列时保证批次内有足够多的用户
+            n_workers: 生成批次的后台线程数，默认为CPU核数
+            prefetch: 提前生成的任务数，默认为线程数的2倍
+            max_resample: 负样本与正样本冲突时最多重新抽取的次数
+            seed: 随机种子，epoch相同时生成的数据相同
+        """
+        self.shards = list(shards)
+        self.n_items = int(n_items)
+        self._positive_keys = positive_keys
+        self.batch_size = batch_size
+        self.negatives = negatives
+        self.negative_target = negative_target
+        self.shuffle = shuffle
+        self.shuffle_shards = max(1, shuffle_shards)
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.prefetch = prefetch or 2 * self.n_workers
+        self.max_resample = max_resample
+        self.seed = seed
+        self.n_rows = sum(len(np.load(shard[0], mmap_mode='r')) if isinstance(shard[0], str) else len(shard[0])
+                          for shard in self.shards)
+        # from_table 划出的验证集
+        self.holdout = None
+        self._shard_directory = None
+
+    @classmethod
+    def from_arrays(cls, user_codes, item_codes, targets, n_items, shard_rows=SHARD_ROWS, **kwargs):
+        """从内存中已编码的交互数组构建
+
+        Args:
+            user_codes: 每条交互的用户编码
+            item_codes: 每条交互的歌曲编码
+            targets: 每条交互的目标值(如缩放到0-1的评分)
+            n_items: 歌曲总数
+            shard_rows: 每个分片的交互数
+            **kwargs: 传给构造函数的其它参数
+
+        Returns:
+            InteractionBatches实例
+        """
+        user_codes = np.ascontiguousarray(user_codes, dtype=np.int32)
+        item_codes = np.ascontiguousarray(item_codes, dtype=np.int32)
+        targets = np.ascontiguousarray(targets, dtype=np.float32)
+        shards = [(user_codes[start:start + shard_rows], item_codes[start:start + shard_rows],
+                   targets[start:start + shard_rows]) for start in range(0, len(user_codes), shard_rows)]
+        return cls(shards, n_items, pair_keys(user_codes, item_codes, n_items), **kwargs)
+
+    @classmethod
+    def from_table(cls, path, user_ids, item_ids, rating_scale=5.0, where=None, holdout=0.0,
+                   shard_rows=SHARD_ROWS, cache_dir=None, **kwargs):
+        """按块读取交互表构建，每块编码后写成一个分片
+
+        Args:
+            path: 交互表文件路径(Parquet/Feather/CSV)
+            user_ids: 用户ID字典(IdDictionary)
+            item_ids: 歌曲ID字典(IdDictionary)，歌曲总数取字典大小
+            rating_scale: 评分除以该值作为目标值
+            where: 只在部分交互上训练时的筛选函数 fn(块DataFrame, 块起始行号) -> 布尔数组；
+                负样本仍然排除整张表中的正样本
+            holdout: 随机划为验证集的交互比例，验证集放在返回值的 holdout 属性中
+                (不做负采样、不打乱的InteractionBatches)，为0时为None
+            shard_rows: 每块(分片)的交互数
+            cache_dir: 分片目录，默认为临时目录，生成器被回收时删除
+            **kwargs: 传给构造函数的其它参数
+
+        Returns:
+            InteractionBatches实例
+        """
+        n_items = len(item_ids)
+        shard_directory = None
+        if cache_dir is None:
+            cache_dir = tempfile.mkdtemp(prefix='interaction_batches_')
+            shard_directory = _ShardDirectory(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        available = table_columns(path)
+        columns = ['user_id', 'song_id', 'rating'] + [col for col in ('timestamp',) if col in available]
+        seed = kwargs.get('seed', 42)
+
+        train_shards, holdout_shards, keys = [], [], []
+        start = 0
+        for index, chunk in enumerate(iter_table_chunks(path, columns=columns, chunk_rows=shard_rows)):
+            users = user_ids.encode(chunk['user_id']).astype(np.int32)
+            items = item_ids.encode(chunk['song_id']).astype(np.int32)
+            targets = (chunk['rating'].to_numpy(dtype=np.float32) / rating_scale).astype(np.float32)
+            known = (users >= 0) & (items >= 0)
+            keys.append(np.unique(users[known].astype(np.int64) * n_items + items[known]))
+
+            train = known if where is None else known & np.asarray(where(chunk, start), dtype=bool)
+            if holdout > 0:
+                held = np.random.default_rng((seed, index)).random(len(chunk)) < holdout
+                if (train & held).any():
+                    holdout_shards.append(_write_shard(cache_dir, len(train_shards) + len(holdout_shards),
+                                                       users[train & held], items[train & held],
+                                                       targets[train & held]))
+                train &= ~held
+            if train.any():
+                train_shards.append(_write_shard(cache_dir, len(train_shards) + len(holdout_shards),
+                                                 users[train], items[train], targets[train]))
+            start += len(chunk)
+
+        keys = np.unique(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+        batches = cls(train_shards, n_items, keys, **kwargs)
+        batches._shard_directory = shard_directory
+        if holdout > 0:
+            batches.holdout = cls(holdout_shards, n_items, keys, **dict(kwargs, negatives=0, shuffle=False))
+            batches.holdout._shard_directory = shard_directory
+        logger.info(f"按块读取交互表 {path}: {start}条交互, 训练 {batches.n_rows} 条, "
+                    f"{len(train_shards)}个分片, 正样本 {len(keys)} 个")
+        return batches
+
+    def __len__(self):
+        """每个epoch的批次数"""
+        return (self.n_rows + self.batch_size - 1) // self.batch_size
+
+    @property
+    def samples_per_batch(self):
+        """每批最多的样本数(正样本 + 负样本)"""
+        return self.batch_size * (1 + self.negatives)
+
+    def _is_positive(self, users, items):
+        """判断 (用户, 歌曲) 是否为已有的正样本"""
+        if len(self._positive_keys) == 0:
+            return np.zeros(len(users), dtype=bool)
+        keys = users.astype(np.int64) * self.n_items + items
+        positions = np.searchsorted(self._positive_keys, keys)
+        positions = np.minimum(positions, len(self._positive_keys) - 1)
+        return self._positive_keys[positions] == keys
+
+    def sample_negatives(self, users, rng):
+        """为一组用户各抽取 negatives 首没有听过的歌曲
+
+        重新抽取 max_resample 次后仍然冲突的(用户几乎听过全部歌曲)保留最后一次结果。
+
+        Args:
+            users: 正样本的用户编码
+            rng: numpy随机数生成器
+
+        Returns:
+            (负样本用户编码, 负样本歌曲编码)
+        """
+        neg_users = np.repeat(users, self.negatives)
+        neg_items = rng.integers(0, self.n_items, len(neg_users), dtype=np.int32)
+        for _ in range(self.max_resample):
+            conflict = np.flatnonzero(self._is_positive(neg_users, neg_items))
+            if len(conflict) == 0:
+                break
+            neg_items[conflict] = rng.integers(0, self.n_items, len(conflict), dtype=np.int32)
+        return neg_users, neg_items
+
+    def _tasks(self, epoch):
+        """一个epoch的任务列表，每个任务为若干分片的下标"""
+        order = np.arange(len(self.shards))
+        if self.shuffle:
+            order = np.random.default_rng((self.seed, epoch)).permutation(len(self.shards))
+        return [order[i:i + self.shuffle_shards] for i in range(0, len(order), self.shuffle_shards)]
+
+    def _make_task(self, epoch, task, shard_ids):
+        """读取若干分片，合并打乱并抽取负样本
+
+        Returns:
+            (用户编码, 歌曲编码, 目标值, 负样本用户编码, 负样本歌曲编码)，
+            负样本形状为 (正样本数, negatives)
+        """
+        parts = [_read_shard(self.shards[i]) for i in shard_ids]
+        users, items, targets = (np.concatenate(columns) for columns in zip(*parts))
+        rng = np.random.default_rng((self.seed, epoch, task))
+        if self.shuffle:
+            order = rng.permutation(len(users))
+            users, items, targets = users[order], items[order], targets[order]
+
+        neg_users, neg_items = self.sample_negatives(users, rng)
+        return (users, items, targets,
+                neg_users.reshape(len(users), self.negatives), neg_items.reshape(len(users), self.negatives))
+
+    def _make_batch(self, parts):
+        """把若干任务结果的片段拼成一个批次"""
+        users, items, targets, neg_users, neg_items = (np.concatenate(columns) for columns in zip(*parts))
+        if self.negatives > 0:
+            users = np.concatenate([users, neg_users.ravel()])
+            items = np.concatenate([items, neg_items.ravel()])
+            targets = np.concatenate([targets, np.full(neg_users.size, self.negative_target, dtype=np.float32)])
+        return (users, items), targets
+
+    def epoch(self, epoch=0):
+        """按顺序产出一个epoch的全部批次，后台线程提前读取分片、打乱并抽取负样本
+
+        批次可以跨任务拼接，每个epoch的批次数固定为 len(self)。
+
+        Args:
+            epoch: epoch序号，决定打乱顺序和负样本
+
+        Yields:
+            ((用户编码, 歌曲编码), 目标值)
+        """
+        tasks = self._tasks(epoch)
+        with ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix='batches') as executor:
+            pending = deque()
+            next_task = 0
+            parts, buffered = [], 0
+            while next_task < len(tasks) or pending:
+                while next_task < len(tasks) and len(pending) < self.prefetch:
+                    pending.append(executor.submit(self._make_task, epoch, next_task, tasks[next_task]))
+                    next_task += 1
+
+                result = pending.popleft().result()
+                offset = 0
+                while offset < len(result[0]):
+                    take = min(self.batch_size - buffered, len(result[0]) - offset)
+                    parts.append(tuple(column[offset:offset + take] for column in result))
+                    buffered += take
+                    offset += take
+                    if buffered == self.batch_size:
+                        yield self._make_batch(parts)
+                        parts, buffered = [], 0
+            if parts:
+                yield self._make_batch(parts)
+
+    def __iter__(self):
+        """无限循环产出批次，每个epoch重新打乱，配合 steps_per_epoch=len(self) 使用"""
+        epoch = 0
+        while True:
+            yield from self.epoch(epoch)
+            epoch += 1
+
+    def to_tf_dataset(self):
+        """包装为 tf.data.Dataset，并在TensorFlow一侧再预取一批
+
+        Returns:
+            无限重复的tf.data.Dataset，训练时需指定 steps_per_epoch=len(self)
+        """
+        import tensorflow as tf
+
+        signature = (
+            (tf.TensorSpec(shape=(None,), dtype=tf.int32), tf.TensorSpec(shape=(None,), dtype=tf.int32)),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        )
+        dataset = tf.data.Dataset.from_generator(lambda: iter(self), output_signature=signature)
+        # 与 Input(shape=(1,)) 的输入层对齐
+        dataset = dataset.map(lambda inputs, targets: (
+            (tf.expand_dims(inputs[0], -1), tf.expand_dims(inputs[1], -1)), targets))
+        return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+歌曲近邻索引
+
+离线阶段根据用户共同收听关系(以及可选的TF-IDF文本特征)为每首歌曲计算
+Top-K相似歌曲，保存为紧凑的 int32/float32 数组；在线阶段以内存映射方式
+加载，单次查询只读取K个元素，结果确定且不需要任何pandas过滤。
+"""
+
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .topk_similarity import topk_similarity
+
+logger = logging.getLogger(__name__)
+
+# 近邻索引文件名
+NEIGHBORS_FILE = 'item_neighbors.npy'
+SCORES_FILE = 'item_neighbor_scores.npy'
+SONG_IDS_FILE = 'item_neighbor_song_ids.npy'
+
+
+def _co_listening_features(interactions_df, song_index):
+    """构建按行L2归一化的 歌曲×用户 共同收听矩阵
+
+    Args:
+        interactions_df: 用户-歌曲交互数据
+        song_index: 歌曲ID索引(pd.Index)，决定行顺序
+
+    Returns:
+        CSR稀疏矩阵，形状为 (歌曲数, 用户数)
+    """
+    song_codes = song_index.get_indexer(interactions_df['song_id'])
+    user_codes, user_ids = pd.factorize(interactions_df['user_id'])
+    known = song_codes >= 0
+
+    matrix = sp.csr_matrix(
+        (np.ones(known.sum(), dtype=np.float32), (song_codes[known], user_codes[known])),
+        shape=(len(song_index), len(user_ids))
+    )
+    # 重复记录只计一次
+    matrix.data[:] = 1.0
+
+    norms = np.sqrt(np.asarray(matrix.sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+
+
+def _content_features(songs_df):
+    """构建L2归一化的TF-IDF文本特征
+
+    Args:
+        songs_df: 歌曲元数据
+
+    Returns:
+        CSR稀疏矩阵，形状为 (歌曲数, 词表大小)
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    title_col = 'track_name' if 'track_name' in songs_df.columns else 'title'
+    text = songs_df['artist_name'].fillna('').astype(str) + ' ' + songs_df[title_col].fillna('').astype(str)
+    tfidf = TfidfVectorizer(stop_words='english', dtype=np.float32)
+    return tfidf.fit_transform(text).tocsr()
+
+
+def build_item_neighbors(songs_df, interactions_df=None, k=50, content_weight=0.0, block_size=None, n_jobs=None):
+    """离线计算每首歌曲的Top-K相似歌曲
+
+    相似度为共同收听余弦相似度与TF-IDF文本余弦相似度的加权和。两组归一化特征
+    分别乘以权重的平方根后横向拼接，拼接后的点积即为加权和，再交给
+    topk_similarity 分块并行计算。
+
+    Args:
+        songs_df: 歌曲元数据，决定索引的歌曲集合与顺序
+        interactions_df: 用户-歌曲交互数据，为None时只使用文本特征
+        k: 每首歌曲保留的近邻数
+        content_weight: 文本相似度权重(0-1)，共同收听相似度权重为 1-content_weight
+        block_size: 每个分块的行数，默认使分块约占64MB
+        n_jobs: 并行进程数，默认为CPU核数
+
+    Returns:
+        (歌曲ID数组, 近邻位置 int32数组, 相似度 float32数组)
+    """
+    songs_df = songs_df.drop_duplicates(subset='song_id').reset_index(drop=True)
+    song_ids = songs_df['song_id'].astype(str).to_numpy()
+    song_index = pd.Index(song_ids)
+    n_songs = len(song_ids)
+
+    if interactions_df is None:
+        content_weight = 1.0
+
+    feature_sets = []
+    if content_weight < 1.0:
+        feature_sets.append(np.sqrt(1.0 - content_weight) * _co_listening_features(interactions_df, song_index))
+    if content_weight > 0.0:
+        feature_sets.append(np.sqrt(content_weight) * _content_features(songs_df))
+    features = sp.hstack(feature_sets, format='csr', dtype=np.float32)
+
+    neighbors, scores = topk_similarity(features, k=k, block_size=block_size, n_jobs=n_jobs, normalize=False)
+
+    logger.info(f"歌曲近邻索引计算完成: {n_songs}首歌曲, 每首{k}个近邻")
+    return song_ids, neighbors, scores
+
+
+def save_item_neighbors(output_dir, song_ids, neighbors, scores):
+    """保存歌曲近邻索引
+
+    Args:
+        output_dir: 输出目录
+        song_ids: 歌曲ID数组
+        neighbors: 近邻位置数组
+        scores: 相似度数组
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, SONG_IDS_FILE), np.asarray(song_ids, dtype=str))
+    np.save(os.path.join(output_dir, NEIGHBORS_FILE), np.ascontiguousarray(neighbors, dtype=np.int32))
+    np.save(os.path.join(output_dir, SCORES_FILE), np.ascontiguousarray(scores, dtype=np.float32))
+    logger.info(f"歌曲近邻索引已保存至: {output_dir}")
+
+
+class ItemNeighborIndex:
+    """内存映射的歌曲近邻索引"""
+
+    def __init__(self, song_ids, neighbors, scores):
+        """初始化近邻索引
+
+        Args:
+            song_ids: 歌曲ID数组
+            neighbors: 近邻位置数组，形状为 (歌曲数, K)
+            scores: 相似度数组，形状为 (歌曲数, K)
+        """
+        self.song_ids = song_ids
+        self.neighbors = neighbors
+        self.scores = scores
+        self.song_index = pd.Index(song_ids)
+
+    @classmethod
+    def load(cls, data_dir):
+        """以内存映射方式加载近邻索引
+
+        Args:
+            data_dir: 索引所在目录
+
+        Returns:
+            ItemNeighborIndex实例，文件不存在时返回None
+        """
+        paths = [os.path.join(data_dir, name) for name in (SONG_IDS_FILE, NEIGHBORS_FILE, SCORES_FILE)]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+
+        song_ids = np.load(paths[0])
+        neighbors = np.load(paths[1], mmap_mode='r')
+        scores = np.load(paths[2], mmap_mode='r')
+        logger.info(f"加载了歌曲近邻索引: {neighbors.shape[0]}首歌曲, 每首{neighbors.shape[1]}个近邻")
+        return cls(song_ids, neighbors, scores)
+
+    @property
+    def k(self):
+        """每首歌曲的近邻数"""
+        return self.neighbors.shape[1]
+
+    def __contains__(self, song_id):
+        return song_id in self.song_index
+
+    def lookup(self, song_id, top_n=None):
+        """查询歌曲的相似歌曲
+
+        Args:
+            song_id: 歌曲ID
+            top_n: 返回数量，默认返回全部K个近邻
+
+        Returns:
+            [(song_id, score), ...]，按相似度降序，歌曲不在索引中时返回空列表
+        """
+        try:
+            row = self.song_index.get_loc(song_id)
+        except KeyError:
+            return []
+
+        neighbors = np.asarray(self.neighbors[row, :top_n])
+        scores = np.asarray(self.scores[row, :top_n])
+        valid = neighbors >= 0
+        return list(zip(self.song_ids[neighbors[valid]].tolist(), scores[valid].tolist()))
+
+    def aggregate_history(self, song_ids, ratings):
+        """聚合用户历史歌曲的近邻分数
+
+        结果可以传给 recommend_from_history / score_items 的 aggregate 参数，
+        同一用户的召回和排序只聚合一次。
+
+        Args:
+            song_ids: 用户评过分的歌曲ID序列
+            ratings: 对应的评分序列
+
+        Returns:
+            (候选歌曲位置数组, 分数数组, 历史歌曲位置数组)
+        """
+        rows = self.song_index.get_indexer(list(song_ids))
+        known = rows >= 0
+        rows = rows[known]
+        neighbors = np.asarray(self.neighbors[rows]).ravel()
+        weights = (np.asarray(self.scores[rows]) * np.asarray(ratings, dtype=np.float32)[known][:, None]).ravel()
+        valid = neighbors >= 0
+        codes, candidates = pd.factorize(neighbors[valid])
+        totals = np.bincount(codes, weights=weights[valid], minlength=len(candidates))
+        return candidates, totals, rows
+
+    def recommend_from_history(self, song_ids, ratings, top_n=10, exclude_ids=None, aggregate=None):
+        """根据用户听过的歌曲聚合近邻分数
+
+        每首近邻歌曲的分数为 sum(评分 * 相似度)，只涉及用户听过歌曲的K个近邻。
+
+        Args:
+            song_ids: 用户评过分的歌曲ID序列
+            ratings: 对应的评分序列
+            top_n: 返回数量
+            exclude_ids: 需要排除的歌曲ID，默认排除 song_ids 本身
+            aggregate: 已有的 aggregate_history 结果，为None时重新聚合
+
+        Returns:
+            [(song_id, score), ...]，按分数降序
+        """
+        candidates, totals, rows = aggregate if aggregate is not None else self.aggregate_history(song_ids, ratings)
+        if not len(candidates) or top_n <= 0:
+            return []
+
+        excluded = rows if exclude_ids is None else self.song_index.get_indexer(list(exclude_ids))
+        totals = np.where(np.isin(candidates, excluded), -np.inf, totals)
+
+        top_n = min(top_n, len(totals))
+        top = np.argpartition(-totals, top_n - 1)[:top_n]
+        top = top[np.lexsort((candidates[top], -totals[top]))]
+        top = top[np.isfinite(totals[top])]
+        return list(zip(self.song_ids[candidates[top]].tolist(), totals[top].tolist()))
+
+    def score_items(self, song_ids, ratings, candidate_ids, aggregate=None):
+        """对指定歌曲计算近邻聚合分数
+
+        Args:
+            song_ids: 用户评过分的歌曲ID序列
+            ratings: 对应的评分序列
+            candidate_ids: 需要打分的歌曲ID序列
+            aggregate: 已有的 aggregate_history 结果，为None时重新聚合
+
+        Returns:
+            与candidate_ids对齐的分数数组，不在任何历史歌曲近邻中的歌曲为NaN
+        """
+        scores = np.full(len(candidate_ids), np.nan)
+        candidates, totals, _ = aggregate if aggregate is not None else self.aggregate_history(song_ids, ratings)
+        positions = pd.Index(candidates).get_indexer(self.song_index.get_indexer(list(candidate_ids)))
+        found = positions >= 0
+        scores[found] = totals[positions[found]]
+        return scores
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+NCF/MLP模型的NumPy推理
+
+训练脚本保存的 ncf_model.h5 / mlp_model.h5 结构为:
+用户嵌入 + 歌曲嵌入 -> 拼接 -> 若干 Dense(relu)+Dropout -> Dense(1, sigmoid)。
+export_keras_model 把各层权重导出为 {name}_weights.npz，在线服务只需NumPy
+即可完成前向计算，不必在Flask进程中导入TensorFlow。
+
+第一层全连接作用在 [用户向量, 歌曲向量] 的拼接上，可以拆成
+user_vec @ W_user + item_vec @ W_item 两部分: 用户部分每次请求只算一次，
+歌曲部分与用户无关，加载时预先计算，对全部歌曲打分时按批做剩余几层矩阵乘法。
+"""
+
+import os
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .id_dictionary import IdDictionary
+
+logger = logging.getLogger(__name__)
+
+
+def _config_ids(model_config, kind, model_dir):
+    """取模型配置对应的ID数组
+
+    新配置记录ID字典名(user_dictionary/item_dictionary)，字典是数据目录中共享的
+    user / song 字典；旧配置直接以列表保存LabelEncoder的classes_(user_encoder/item_encoder)。
+    """
+    if f'{kind}_encoder' in model_config:
+        return np.asarray(model_config[f'{kind}_encoder'], dtype=str)
+    dictionary = IdDictionary.load(model_dir, model_config[f'{kind}_dictionary'], mmap=False)
+    if dictionary is None:
+        raise FileNotFoundError(f"找不到ID字典: {model_config[f'{kind}_dictionary']}")
+    return dictionary.ids
+
+
+def export_keras_model(model, model_config, path, model_dir=None):
+    """导出Keras NCF/MLP模型的权重
+
+    Args:
+        model: 训练好的Keras模型(层名与训练脚本一致)
+        model_config: 训练脚本保存的 *_model_config.json 内容
+        path: 输出npz路径
+        model_dir: 共享ID字典所在的数据目录，默认与输出路径相同
+    """
+    model_dir = model_dir or os.path.dirname(path)
+    weights = {
+        'user_embedding': model.get_layer('user_embedding').get_weights()[0],
+        'item_embedding': model.get_layer('item_embedding').get_weights()[0],
+    }
+    layer_names = [f'layer{i}' for i in range(len(model_config['layers']))] + ['output']
+    for i, layer_name in enumerate(layer_names):
+        kernel, bias = model.get_layer(layer_name).get_weights()
+        weights[f'kernel_{i}'] = kernel
+        weights[f'bias_{i}'] = bias
+
+    weights = {key: np.asarray(value, dtype=np.float32) for key, value in weights.items()}
+    # 字典只追加，训练之后新增的ID不在嵌入层中，按嵌入行数截取
+    weights['user_ids'] = _config_ids(model_config, 'user', model_dir)[:len(weights['user_embedding'])]
+    weights['item_ids'] = _config_ids(model_config, 'item', model_dir)[:len(weights['item_embedding'])]
+    np.savez(path, **weights)
+    logger.info(f"模型权重已导出至: {path}")
+
+
+class NeuralScorer:
+    """NCF/MLP模型打分器
+
+    输出为 sigmoid * rating_scale，与训练时把评分除以5的缩放一致。
+    """
+
+    def __init__(self, weights, name='ncf', rating_scale=5.0, batch_size=8192,
+                 precompute_limit=256 * 1024 * 1024):
+        """初始化打分器
+
+        Args:
+            weights: export_keras_model 导出格式的权重字典
+            name: 模型名称，用于日志和推荐理由
+            rating_scale: 评分缩放系数
+            batch_size: 对全部歌曲打分时每批的歌曲数
+            precompute_limit: 预计算歌曲侧第一层输出允许占用的最大字节数
+        """
+        self.name = name
+        self.rating_scale = rating_scale
+        self.batch_size = batch_size
+
+        self.user_embedding = np.asarray(weights['user_embedding'], dtype=np.float32)
+        self.item_embedding = np.asarray(weights['item_embedding'], dtype=np.float32)
+        self.user_index = pd.Index(weights['user_ids'])
+        self.item_index = pd.Index(weights['item_ids'])
+
+        n_layers = sum(1 for key in weights if key.startswith('kernel_'))
+        self.kernels = [np.asarray(weights[f'kernel_{i}'], dtype=np.float32) for i in range(n_layers)]
+        self.biases = [np.asarray(weights[f'bias_{i}'], dtype=np.float32) for i in range(n_layers)]
+
+        # 拆分第一层: 拼接顺序为 [用户向量, 歌曲向量]
+        user_dim = self.user_embedding.shape[1]
+        self._user_kernel = np.ascontiguousarray(self.kernels[0][:user_dim])
+        self._item_kernel = np.ascontiguousarray(self.kernels[0][user_dim:])
+
+        self._item_hidden = None
+        if self.n_items * self._item_kernel.shape[1] * 4 <= precompute_limit:
+            self._item_hidden = self.item_embedding @ self._item_kernel
+
+    @classmethod
+    def load(cls, model_dir, name, **kwargs):
+        """加载导出的模型权重
+
+        Args:
+            model_dir: 模型目录
+            name: 模型名称，如 'ncf' 或 'mlp'
+            **kwargs: 传给构造函数的其他参数
+
+        Returns:
+            NeuralScorer实例，权重文件不存在时返回None
+        """
+        weights_path = os.path.join(model_dir, f'{name}_weights.npz')
+        if not os.path.exists(weights_path):
+            if os.path.exists(os.path.join(model_dir, f'{name}_model.h5')):
+                logger.warning(f"找到{name}_model.h5但没有导出的权重，"
+                               f"请运行 backend/scripts/export_neural_weights.py --model {name}")
+            return None
+
+        with np.load(weights_path) as data:
+            weights = {key: data[key] for key in data.files}
+
+        scorer = cls(weights, name=name, **kwargs)
+        logger.info(f"加载了{name}模型权重: {scorer.n_users}个用户, {scorer.n_items}首歌曲, {len(scorer.kernels)}层全连接")
+        return scorer
+
+    @property
+    def n_users(self):
+        return self.user_embedding.shape[0]
+
+    @property
+    def n_items(self):
+        return self.item_embedding.shape[0]
+
+    def user_code(self, user_id):
+        """获取模型内的用户编码，不存在时返回-1"""
+        try:
+            return int(self.user_index.get_loc(str(user_id)))
+        except KeyError:
+            return -1
+
+    def _forward(self, user_hidden, item_codes):
+        """对一批歌曲做前向计算
+
+        Args:
+            user_hidden: 用户侧第一层输出(已加偏置)
+            item_codes: 歌曲编码数组
+
+        Returns:
+            float32分数数组
+        """
+        if self._item_hidden is not None:
+            hidden = self._item_hidden[item_codes] + user_hidden
+        else:
+            hidden = self.item_embedding[item_codes] @ self._item_kernel + user_hidden
+        np.maximum(hidden, 0, out=hidden)
+
+        for kernel, bias in zip(self.kernels[1:-1], self.biases[1:-1]):
+            hidden = hidden @ kernel + bias
+            np.maximum(hidden, 0, out=hidden)
+
+        logits = (hidden @ self.kernels[-1] + self.biases[-1]).ravel()
+        return self.rating_scale / (1.0 + np.exp(-logits))
+
+    def _user_hidden(self, code):
+        """用户侧第一层输出"""
+        return self.user_embedding[code] @ self._user_kernel + self.biases[0]
+
+    def score_all(self, user_id):
+        """对全部歌曲打分
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            float32分数数组，用户不在模型中时返回None
+        """
+        code = self.user_code(user_id)
+        if code < 0:
+            return None
+
+        user_hidden = self._user_hidden(code)
+        scores = np.empty(self.n_items, dtype=np.float32)
+        for start in range(0, self.n_items, self.batch_size):
+            item_codes = np.arange(start, min(start + self.batch_size, self.n_items))
+            scores[start:start + len(item_codes)] = self._forward(user_hidden, item_codes)
+        return scores
+
+    def score_items(self, user_id, song_ids):
+        """对指定歌曲打分
+
+        Args:
+            user_id: 用户ID
+            song_ids: 歌曲ID序列
+
+        Returns:
+            与输入对齐的float32分数数组，模型中不存在的用户或歌曲为NaN
+        """
+        song_ids = [str(song_id) for song_id in song_ids]
+        scores = np.full(len(song_ids), np.nan, dtype=np.float32)
+        code = self.user_code(user_id)
+        if code < 0:
+            return scores
+
+        item_codes = self.item_index.get_indexer(song_ids)
+        known = np.flatnonzero(item_codes >= 0)
+        user_hidden = self._user_hidden(code)
+        for start in range(0, len(known), self.batch_size):
+            batch = known[start:start + self.batch_size]
+            scores[batch] = self._forward(user_hidden, item_codes[batch])
+        return scores
+
+    def recommend(self, user_id, top_n=10, exclude_ids=None):
+        """为模型中的用户生成推荐
+
+        Args:
+            user_id: 用户ID
+            top_n: 推荐数量
+            exclude_ids: 需要排除的歌曲ID
+
+        Returns:
+            [(song_id, score), ...]，按分数降序，用户不在模型中时返回空列表
+        """
+        scores = self.score_all(user_id)
+        if scores is None:
+            return []
+
+        if exclude_ids:
+            excluded = self.item_index.get_indexer([str(song_id) for song_id in exclude_ids])
+            scores[excluded[excluded >= 0]] = -np.inf
+
+        top_n = min(top_n, len(scores))
+        if top_n <= 0:
+            return []
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top])]
+        return list(zip(self.item_index[top].tolist(), scores[top].tolist()))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+热门歌曲排行榜
+
+加载时一次性统计每首歌曲的评分次数与评分总和，之后随新评分增量更新，
+Top-N 查询直接读取预排序数组。热门度与原实现一致:
+评分次数 * 平均评分 (即评分总和)，且只考虑评分次数不少于 min_count 的歌曲。
+可选按半衰期对评分做时间衰减。
+"""
+
+import time
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityLeaderboard:
+    """热门歌曲排行榜
+
+    热门度变化后并不立即重排，而是在下一次查询时用一次 argpartition
+    重建预排序的前 cache_size 名。
+    """
+
+    def __init__(self, min_count=3, half_life_days=None, cache_size=1000):
+        """初始化排行榜
+
+        Args:
+            min_count: 进入排行榜的最少评分次数
+            half_life_days: 时间衰减半衰期(天)，为None时不衰减
+            cache_size: 预排序保留的名次数
+        """
+        # 至少要有一次评分，平均评分才有意义
+        self.min_count = max(1, min_count)
+        self.half_life_days = half_life_days
+        self.cache_size = cache_size
+
+        self.song_ids = []
+        self._song_codes = {}
+        # 以下数组按容量分配，只有前 len(song_ids) 个元素有效，新歌曲加入时容量翻倍增长
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0, dtype=np.float64)
+        # 衰减模式下以 reference_time 为基准累计 rating * 2^((t - reference_time) / 半衰期)
+        self.decayed_sums = np.zeros(0, dtype=np.float64)
+        self.reference_time = time.time()
+
+        self._ranking = np.zeros(0, dtype=np.int64)
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_interactions(cls, interactions_df, min_count=3, half_life_days=None, cache_size=1000):
+        """从交互数据批量构建排行榜
+
+        Args:
+            interactions_df: 包含song_id和rating列(可选timestamp列)的DataFrame
+            min_count: 进入排行榜的最少评分次数
+            half_life_days: 时间衰减半衰期(天)
+            cache_size: 预排序保留的名次数
+
+        Returns:
+            PopularityLeaderboard实例
+        """
+        codes, song_ids = pd.factorize(interactions_df['song_id'])
+        timestamps = None
+        if 'timestamp' in interactions_df.columns:
+            timestamps = pd.to_numeric(interactions_df['timestamp'], errors='coerce').to_numpy(dtype=np.float64)
+        return cls.from_arrays(song_ids, codes, interactions_df['rating'].to_numpy(), timestamps,
+                               min_count=min_count, half_life_days=half_life_days, cache_size=cache_size)
+
+    @classmethod
+    def from_arrays(cls, song_ids, codes, ratings, timestamps=None, min_count=3, half_life_days=None, cache_size=1000):
+        """从已编码的评分数组构建排行榜(如产物目录中的CSR列编码)
+
+        没有任何评分的歌曲不进入排行榜，与 from_interactions 的结果一致。
+
+        Args:
+            song_ids: 编码对应的歌曲ID序列
+            codes: 每条评分的歌曲编码数组
+            ratings: 评分数组
+            timestamps: 评分时间戳数组(秒)，可为None
+            min_count: 进入排行榜的最少评分次数
+            half_life_days: 时间衰减半衰期(天)
+            cache_size: 预排序保留的名次数
+
+        Returns:
+            PopularityLeaderboard实例
+        """
+        leaderboard = cls(min_count=min_count, half_life_days=half_life_days, cache_size=cache_size)
+
+        ratings = np.asarray(ratings, dtype=np.float64)
+        codes = np.asarray(codes)
+
+        # 去掉没有评分的歌曲并重新编码
+        rated = np.flatnonzero(np.bincount(codes, minlength=len(song_ids)))
+        if len(rated) < len(song_ids):
+            remap = np.full(len(song_ids), -1, dtype=np.int64)
+            remap[rated] = np.arange(len(rated))
+            codes = remap[codes]
+            song_ids = np.asarray(song_ids, dtype=object)[rated]
+        n_songs = len(song_ids)
+
+        leaderboard.song_ids = list(song_ids)
+        leaderboard._song_codes = {song_id: code for code, song_id in enumerate(leaderboard.song_ids)}
+        leaderboard.counts = np.bincount(codes, minlength=n_songs).astype(np.int64)
+        leaderboard.sums = np.bincount(codes, weights=ratings, minlength=n_songs)
+
+        if half_life_days and timestamps is not None:
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            leaderboard.reference_time = float(np.nanmax(timestamps)) if len(timestamps) else time.time()
+            weights = ratings * leaderboard._decay_factor(timestamps)
+            leaderboard.decayed_sums = np.bincount(codes, weights=weights, minlength=n_songs)
+        else:
+            leaderboard.decayed_sums = leaderboard.sums.copy()
+
+        logger.info(f"构建热门歌曲排行榜: {n_songs}首歌曲, {int((leaderboard.counts >= leaderboard.min_count).sum())}首满足评分次数要求")
+        return leaderboard
+
+    def _decay_factor(self, timestamps):
+        """计算评分时间相对基准时间的衰减系数"""
+        timestamps = np.nan_to_num(np.asarray(timestamps, dtype=np.float64), nan=self.reference_time)
+        half_life = self.half_life_days * 86400.0
+        return np.exp2((timestamps - self.reference_time) / half_life)
+
+    def _grow(self, size):
+        """保证统计数组至少能容纳 size 首歌曲，容量按倍数增长"""
+        capacity = len(self.counts)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        for name in ('counts', 'sums', 'decayed_sums'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _song_code(self, song_id):
+        """获取歌曲编码，新歌曲追加到末尾"""
+        code = self._song_codes.get(song_id)
+        if code is None:
+            code = len(self.song_ids)
+            self._grow(code + 1)
+            self.song_ids.append(song_id)
+            self._song_codes[song_id] = code
+        return code
+
+    def update(self, song_id, rating, timestamp=None, previous_rating=None, previous_timestamp=None):
+        """应用一条新评分
+
+        用户修改已有评分时传入旧评分，次数不变、总和按差值调整。
+
+        Args:
+            song_id: 歌曲ID
+            rating: 新评分
+            timestamp: 新评分的时间戳(秒)
+            previous_rating: 同一用户对该歌曲的旧评分，没有则为None
+            previous_timestamp: 旧评分的时间戳(秒)
+        """
+        with self._lock:
+            code = self._song_code(song_id)
+            if previous_rating is None:
+                self.counts[code] += 1
+            else:
+                self.sums[code] -= previous_rating
+            self.sums[code] += rating
+
+            if self.half_life_days:
+                if previous_rating is not None:
+                    self.decayed_sums[code] -= previous_rating * self._decay_factor([previous_timestamp])[0]
+                self.decayed_sums[code] += rating * self._decay_factor([timestamp])[0]
+            else:
+                self.decayed_sums[code] = self.sums[code]
+
+            self._dirty = True
+
+    def update_many(self, ratings):
+        """批量应用新评分
+
+        Args:
+            ratings: 可迭代的 (song_id, rating, timestamp, previous_rating, previous_timestamp) 元组
+        """
+        for song_id, rating, timestamp, previous_rating, previous_timestamp in ratings:
+            self.update(song_id, rating, timestamp, previous_rating, previous_timestamp)
+
+    def remove(self, song_id, rating, timestamp=None):
+        """撤销一条已有评分(如用户被删除)
+
+        Args:
+            song_id: 歌曲ID
+            rating: 被删除的评分
+            timestamp: 被删除评分的时间戳(秒)
+        """
+        with self._lock:
+            code = self._song_codes.get(song_id)
+            if code is None:
+                return
+            self.counts[code] -= 1
+            self.sums[code] -= rating
+
+            if self.half_life_days:
+                self.decayed_sums[code] -= rating * self._decay_factor([timestamp])[0]
+            else:
+                self.decayed_sums[code] = self.sums[code]
+
+            self._dirty = True
+
+    def remove_many(self, ratings):
+        """批量撤销已有评分
+
+        Args:
+            ratings: 可迭代的 (song_id, rating, timestamp) 元组
+        """
+        for song_id, rating, timestamp in ratings:
+            self.remove(song_id, rating, timestamp)
+
+    def popularity(self):
+        """当前热门度数组，衰减模式下折算到当前时间"""
+        n_songs = len(self.song_ids)
+        if not self.half_life_days:
+            return self.sums[:n_songs]
+        return self.decayed_sums[:n_songs] / self._decay_factor([time.time()])[0]
+
+    def _rebuild(self, size):
+        """重建预排序的前 size 名"""
+        scores = self.popularity()
+        eligible = np.flatnonzero(self.counts[:len(scores)] >= self.min_count)
+        if len(eligible) > size:
+            top = np.argpartition(-scores[eligible], size - 1)[:size]
+            eligible = eligible[top]
+        # 热门度降序，同分按歌曲首次出现顺序
+        order = np.lexsort((eligible, -scores[eligible]))
+        self._ranking = eligible[order]
+        self._dirty = False
+
+    def top(self, top_n=10):
+        """获取前N首热门歌曲
+
+        Args:
+            top_n: 返回数量
+
+        Returns:
+            [(song_id, 热门度, 评分次数, 平均评分), ...]
+        """
+        with self._lock:
+            truncated = len(self._ranking) >= self.cache_size
+            if self._dirty or (truncated and top_n > len(self._ranking)):
+                self._rebuild(max(self.cache_size, top_n))
+            codes = self._ranking[:top_n]
+            scores = self.popularity()[codes]
+            counts = self.counts[codes]
+            sums = self.sums[codes]
+
+        return [
+            (self.song_ids[code], float(score), int(count), float(total / count))
+            for code, score, count, total in zip(codes, scores, counts, sums)
+        ]
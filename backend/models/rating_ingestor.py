@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SQLite评分增量同步
+
+user_ratings 表上的触发器把每次写入和删除记录到 rating_changes 变更日志，
+日志的 id 为 AUTOINCREMENT，不会被复用。同步器按 id 水位线依次读取变更，
+写入的评分分批交给推荐引擎的 apply_ratings，删除的评分交给 remove_ratings，
+内存评分矩阵、热门排行榜以及其它按用户缓存的结果随之更新，不需要重启或全量重载。
+
+产物版本可以在元数据 rating_changes_id 中记录已经包含的变更日志位置，
+同步器从该位置开始读取，不必在启动时重放整张表。日志只追加，同步器启动时和
+每应用一定数量的变更后把它压缩为每个 (user_id, track_id) 只保留最新一条，
+日志大小只与出现过的评分位置数量有关，不随重复评分无限增长。
+"""
+
+import sqlite3
+import logging
+import threading
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CHANGES_TABLE = 'rating_changes'
+ARTIFACT_WATERMARK_KEY = 'rating_changes_id'
+
+
+def ensure_change_log(conn):
+    """创建评分变更日志及其触发器
+
+    日志首次创建时，把 user_ratings 中已有的评分按写入顺序补记为写入变更。
+    INSERT OR REPLACE 替换已有记录时(未开启 recursive_triggers)只产生一条写入变更。
+
+    Args:
+        conn: SQLite连接
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (CHANGES_TABLE,))
+    exists = cursor.fetchone() is not None
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        track_id TEXT NOT NULL,
+        rating INTEGER,
+        timestamp TIMESTAMP
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS user_ratings_log_insert AFTER INSERT ON user_ratings
+    BEGIN
+        INSERT INTO {CHANGES_TABLE} (op, user_id, track_id, rating, timestamp)
+        VALUES ('upsert', NEW.user_id, NEW.track_id, NEW.rating, NEW.timestamp);
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS user_ratings_log_update AFTER UPDATE ON user_ratings
+    BEGIN
+        INSERT INTO {CHANGES_TABLE} (op, user_id, track_id, rating, timestamp)
+        VALUES ('delete', OLD.user_id, OLD.track_id, NULL, NULL);
+        INSERT INTO {CHANGES_TABLE} (op, user_id, track_id, rating, timestamp)
+        VALUES ('upsert', NEW.user_id, NEW.track_id, NEW.rating, NEW.timestamp);
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS user_ratings_log_delete AFTER DELETE ON user_ratings
+    BEGIN
+        INSERT INTO {CHANGES_TABLE} (op, user_id, track_id, rating, timestamp)
+        VALUES ('delete', OLD.user_id, OLD.track_id, NULL, NULL);
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE INDEX IF NOT EXISTS idx_{CHANGES_TABLE}_key ON {CHANGES_TABLE} (user_id, track_id, id)
+    ''')
+
+    if not exists:
+        cursor.execute(f'''
+        INSERT INTO {CHANGES_TABLE} (op, user_id, track_id, rating, timestamp)
+        SELECT 'upsert', user_id, track_id, rating, timestamp FROM user_ratings ORDER BY rowid
+        ''')
+        logger.info(f"创建评分变更日志，补记了 {cursor.rowcount} 条已有评分")
+    conn.commit()
+
+
+def compact_change_log(conn):
+    """压缩评分变更日志，每个 (user_id, track_id) 只保留 id 最大的一条
+
+    同一位置的最新变更(写入或删除)就决定了该位置的最终状态，删除更早的变更后，
+    从任意水位线开始回放得到的评分都不变；AUTOINCREMENT 保证删除的 id 不会被复用。
+
+    Args:
+        conn: SQLite连接
+
+    Returns:
+        删除的变更数量
+    """
+    cursor = conn.cursor()
+    cursor.execute(f'''
+    DELETE FROM {CHANGES_TABLE} WHERE id NOT IN (
+        SELECT MAX(id) FROM {CHANGES_TABLE} GROUP BY user_id, track_id
+    )
+    ''')
+    removed = cursor.rowcount
+    conn.commit()
+    return removed
+
+
+def _epoch_seconds(timestamps):
+    """把SQLite中的时间字符串转换为秒级时间戳，无法解析的为NaN"""
+    timestamps = pd.to_datetime(timestamps, errors='coerce')
+    return (timestamps - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+
+def load_sqlite_ratings(db_path):
+    """读取 user_ratings 中的全部评分及当前变更日志位置
+
+    两者在同一个读事务中读取，生成产物时把返回的位置写入元数据
+    rating_changes_id，同步器即可从该位置继续。
+
+    Args:
+        db_path: SQLite数据库路径
+
+    Returns:
+        (评分DataFrame, 变更日志位置)，DataFrame包含user_id、song_id、rating、timestamp列
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_change_log(conn)
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {CHANGES_TABLE}')
+        change_id = int(cursor.fetchone()[0])
+        cursor.execute('SELECT user_id, track_id, rating, timestamp FROM user_ratings ORDER BY rowid')
+        rows = cursor.fetchall()
+        conn.rollback()
+    finally:
+        conn.close()
+
+    ratings_df = pd.DataFrame(rows, columns=['user_id', 'song_id', 'rating', 'timestamp'])
+    ratings_df['timestamp'] = _epoch_seconds(ratings_df['timestamp'])
+    return ratings_df, change_id
+
+
+class RatingIngestor:
+    """SQLite评分增量同步器
+
+    /api/rate_song、/api/feedback 使用 INSERT OR REPLACE 写入评分，删除用户时删除其评分，
+    这些操作都通过触发器记入变更日志，按日志顺序回放即可得到与数据库一致的评分。
+    """
+
+    def __init__(self, db_path, recommender, batch_size=500, interval=5.0, start_id=None,
+                 compact_threshold=10000):
+        """初始化同步器
+
+        Args:
+            db_path: SQLite数据库路径
+            recommender: MusicRecommender实例
+            batch_size: 每批读取的最大记录数
+            interval: 后台轮询间隔(秒)
+            start_id: 起始水位线，为None时取推荐引擎所加载产物记录的位置，没有记录时为0
+            compact_threshold: 每应用多少条变更压缩一次变更日志，None表示只在启动时压缩
+        """
+        self.db_path = db_path
+        self.recommender = recommender
+        self.batch_size = batch_size
+        self.interval = interval
+        self.compact_threshold = compact_threshold
+
+        conn = sqlite3.connect(db_path)
+        try:
+            ensure_change_log(conn)
+            self._compact(conn)
+        finally:
+            conn.close()
+
+        self.last_id = start_id if start_id is not None else self._initial_watermark()
+        self._applied_since_compact = 0
+        self._poll_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _initial_watermark(self):
+        """推荐引擎所加载产物已包含的变更日志位置"""
+        store = getattr(self.recommender, 'artifact_store', None)
+        if store is not None and store.metadata.get(ARTIFACT_WATERMARK_KEY) is not None:
+            last_id = int(store.metadata[ARTIFACT_WATERMARK_KEY])
+            logger.info(f"产物版本 {store.version} 已包含变更日志 id<={last_id} 的评分，从该位置开始同步")
+            return last_id
+        return 0
+
+    def _compact(self, conn):
+        """压缩变更日志"""
+        removed = compact_change_log(conn)
+        if removed:
+            logger.info(f"压缩评分变更日志，删除了 {removed} 条被覆盖的变更")
+
+    def _fetch_batch(self, conn):
+        """读取水位线之后的一批变更"""
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT id, op, user_id, track_id, rating, timestamp FROM {CHANGES_TABLE}
+        WHERE id > ? ORDER BY id LIMIT ?
+        ''', (self.last_id, self.batch_size))
+        return cursor.fetchall()
+
+    def _apply(self, batch):
+        """按日志顺序应用一批变更，连续的同类变更合并为一次调用"""
+        runs = (batch['op'] != batch['op'].shift()).cumsum()
+        for _, run in batch.groupby(runs, sort=False):
+            if run['op'].iloc[0] == 'delete':
+                self.recommender.remove_ratings(run[['user_id', 'song_id']])
+            else:
+                self.recommender.apply_ratings(run[['user_id', 'song_id', 'rating', 'timestamp']])
+
+    def poll_once(self):
+        """同步一轮，直到没有新变更
+
+        后台线程和需要立即生效的请求(如删除用户)都可以调用，同一时刻只有一个在执行。
+
+        Returns:
+            本轮应用的变更数量
+        """
+        total = 0
+        with self._poll_lock:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                while True:
+                    rows = self._fetch_batch(conn)
+                    if not rows:
+                        break
+
+                    batch = pd.DataFrame(rows, columns=['id', 'op', 'user_id', 'song_id', 'rating', 'timestamp'])
+                    batch['timestamp'] = _epoch_seconds(batch['timestamp'])
+                    self._apply(batch)
+
+                    self.last_id = int(batch['id'].iloc[-1])
+                    total += len(batch)
+                    if len(rows) < self.batch_size:
+                        break
+
+                self._applied_since_compact += total
+                if self.compact_threshold is not None and self._applied_since_compact >= self.compact_threshold:
+                    self._compact(conn)
+                    self._applied_since_compact = 0
+            finally:
+                conn.close()
+
+        if total:
+            logger.info(f"从SQLite同步了 {total} 条评分变更，水位线id={self.last_id}")
+        return total
+
+    def _run(self):
+        """后台轮询循环"""
+        while not self._stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"同步SQLite评分时出错: {str(e)}")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """启动后台同步线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='rating-ingestor', daemon=True)
+        self._thread.start()
+        logger.info(f"评分同步线程已启动，轮询间隔: {self.interval}秒")
+
+    def stop(self):
+        """停止后台同步线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,688 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+用户-歌曲评分稀疏矩阵
+
+将交互数据中的 user_id / song_id 编码为连续整数，并以CSR稀疏矩阵保存评分，
+内存占用只与非零评分数量成正比。旧代码使用的 {user_id: {song_id: rating}}
+字典结构通过 UserRatingsView 以惰性视图的方式提供，仅在访问时按行构建。
+
+增量写入的评分不直接改动基础矩阵，而是放进一个小的覆盖层，读取时与基础矩阵
+叠加；覆盖层超过容量或存在时间过长时才合并进新的基础CSR/CSC。矩阵、覆盖层和
+ID字典组成一个不可变的 RatingSnapshot，写入方构建好新快照后一次替换引用，
+读取方在一次计算中只使用同一个快照，不会看到互相不一致的字典和矩阵。
+
+行、列编码就是数据目录中共享的 user / song ID字典(IdDictionary)的编码，
+新用户和新歌曲写入时在字典副本上追加，已发布快照中的字典不会被修改。
+"""
+
+import time
+import logging
+import threading
+from collections import namedtuple
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .artifact_store import load_rating_arrays
+from .id_dictionary import IdDictionary
+
+logger = logging.getLogger(__name__)
+
+# 覆盖层按键 (用户编码 << 32 | 歌曲编码) 升序保存。value 为当前评分，0表示已删除；
+# base_value/base_pos 为该位置在基础矩阵中的评分和数据下标，基础矩阵中没有时
+# base_value 为0，base_pos 为 -(插入位置 + 1)
+_Overlay = namedtuple('_Overlay', ['keys', 'rows', 'cols', 'values', 'times', 'base_values', 'base_pos'])
+
+
+def _as_dictionary(ids):
+    """把ID序列包装为IdDictionary，已经是字典时直接返回"""
+    if isinstance(ids, IdDictionary):
+        return ids
+    return IdDictionary(np.asarray(ids).astype(str))
+
+
+def _append_ids(dictionary, ids):
+    """把新ID追加到字典末尾
+
+    没有新ID时沿用原字典，否则在副本上追加，原字典仍可被旧快照读取。
+
+    Returns:
+        (字典, 每个ID的编码数组)
+    """
+    codes = dictionary.encode(ids)
+    if (codes >= 0).all():
+        return dictionary, codes
+    return dictionary.extended(ids)
+
+
+def _overlay_keys(rows, cols):
+    """覆盖层的排序键"""
+    return (np.asarray(rows, dtype=np.int64) << 32) | np.asarray(cols, dtype=np.int64)
+
+
+def _empty_overlay():
+    """空覆盖层"""
+    return _Overlay(
+        keys=np.zeros(0, dtype=np.int64),
+        rows=np.zeros(0, dtype=np.int64),
+        cols=np.zeros(0, dtype=np.int64),
+        values=np.zeros(0, dtype=np.float32),
+        times=np.zeros(0, dtype=np.float64),
+        base_values=np.zeros(0, dtype=np.float32),
+        base_pos=np.zeros(0, dtype=np.int64),
+    )
+
+
+def _merge_overlay(overlay, entries):
+    """把一批新条目并入覆盖层，同一位置以新条目为准"""
+    merged = [np.concatenate([old, new]) for old, new in zip(overlay, entries)]
+    keys = merged[0]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = sorted_keys[1:] != sorted_keys[:-1]
+    take = order[last]
+    return _Overlay(*(column[take] for column in merged))
+
+
+def _pad_indptr(indptr, length):
+    """把 indptr 补齐到 length 个元素，新增的行(列)为空"""
+    if len(indptr) >= length:
+        return indptr
+    return np.concatenate([indptr, np.full(length - len(indptr), indptr[-1], dtype=indptr.dtype)])
+
+
+class RatingSnapshot:
+    """评分矩阵在某一时刻的不可变快照
+
+    由基础CSR/CSC矩阵(可以是内存映射)和覆盖层组成，覆盖层以差值矩阵
+    覆盖值 - 基础值 的形式叠加到基础矩阵上。用户和歌曲编码只追加不复用，
+    旧快照中的编码在新快照中含义不变。
+    """
+
+    def __init__(self, base, base_csc, base_times, user_ids, song_ids, overlay=None, version=0):
+        """初始化快照
+
+        Args:
+            base: 基础CSR矩阵，每行内列编码有序
+            base_csc: 与 base 相同内容的CSC矩阵
+            base_times: 与 base.data 对齐的评分时间戳数组，可为None
+            user_ids: 用户ID字典(IdDictionary)，行编码即字典编码
+            song_ids: 歌曲ID字典(IdDictionary)，列编码即字典编码
+            overlay: 覆盖层，None表示为空
+            version: 快照版本，每次发布新快照加1
+        """
+        self.base = base
+        self.base_csc = base_csc
+        self.base_times = base_times
+        self.user_ids = user_ids
+        self.song_ids = song_ids
+        self.overlay = overlay if overlay is not None else _empty_overlay()
+        self.version = version
+
+        shape = (len(user_ids), len(song_ids))
+        self.shape = shape
+        self._csr = sp.csr_matrix((base.data, base.indices, _pad_indptr(base.indptr, shape[0] + 1)), shape=shape)
+        self._csc = sp.csc_matrix((base_csc.data, base_csc.indices, _pad_indptr(base_csc.indptr, shape[1] + 1)),
+                                  shape=shape)
+
+        overlay = self.overlay
+        self._delta = sp.csr_matrix((overlay.values - overlay.base_values, (overlay.rows, overlay.cols)),
+                                    shape=shape, dtype=np.float32)
+        self._delta.eliminate_zeros()
+        self._delta_csc = self._delta.tocsc()
+
+        added = int(np.count_nonzero((overlay.values != 0) & (overlay.base_pos < 0)))
+        removed = int(np.count_nonzero((overlay.values == 0) & (overlay.base_pos >= 0)))
+        self.nnz = base.nnz + added - removed
+
+    @property
+    def overlay_size(self):
+        """覆盖层中的条目数"""
+        return len(self.overlay.keys)
+
+    def user_code(self, user_id):
+        """获取用户编码，不存在时返回-1"""
+        return int(self.user_ids.encode([user_id])[0])
+
+    def song_codes(self, song_ids):
+        """批量获取歌曲编码，不存在的歌曲为-1"""
+        return self.song_ids.encode(list(song_ids))
+
+    def user_row(self, code):
+        """获取某一用户的评分行
+
+        Args:
+            code: 用户行编码
+
+        Returns:
+            (歌曲编码数组, 评分数组)，按歌曲编码升序
+        """
+        start, end = self._csr.indptr[code], self._csr.indptr[code + 1]
+        song_codes, ratings = self._csr.indices[start:end], self._csr.data[start:end]
+        delta_start, delta_end = self._delta.indptr[code], self._delta.indptr[code + 1]
+        if delta_start == delta_end:
+            return song_codes, ratings
+
+        row = (sp.csr_matrix((ratings, song_codes, [0, end - start]), shape=(1, self.shape[1]))
+               + sp.csr_matrix((self._delta.data[delta_start:delta_end], self._delta.indices[delta_start:delta_end],
+                                [0, delta_end - delta_start]), shape=(1, self.shape[1])))
+        row.eliminate_zeros()
+        row.sort_indices()
+        return row.indices, row.data
+
+    def get_user_ratings(self, user_id):
+        """获取某一用户的评分字典，用户不存在时返回空字典"""
+        code = self.user_code(user_id)
+        if code < 0:
+            return {}
+        song_codes, ratings = self.user_row(code)
+        return dict(zip(self.song_ids.decode(song_codes).tolist(), ratings.tolist()))
+
+    def rows(self, codes):
+        """按用户编码取若干行
+
+        Args:
+            codes: 用户编码数组
+
+        Returns:
+            形状为 (len(codes), 歌曲数) 的CSR矩阵
+        """
+        rows = self._csr[codes]
+        if self._delta.nnz:
+            rows = (rows + self._delta[codes]).tocsr()
+            rows.eliminate_zeros()
+        return rows
+
+    def columns(self, codes):
+        """按歌曲编码取若干列
+
+        Args:
+            codes: 歌曲编码数组
+
+        Returns:
+            形状为 (用户数, len(codes)) 的CSC矩阵
+        """
+        columns = self._csc[:, codes]
+        if self._delta.nnz:
+            columns = (columns + self._delta_csc[:, codes]).tocsc()
+            columns.eliminate_zeros()
+        return columns
+
+    def tocsr(self):
+        """合并覆盖层后的完整CSR矩阵"""
+        if not self._delta.nnz:
+            return self._csr
+        matrix = (self._csr + self._delta).tocsr()
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        return matrix
+
+    def tocsc(self):
+        """合并覆盖层后的完整CSC矩阵"""
+        if not self._delta.nnz:
+            return self._csc
+        matrix = (self._csc + self._delta_csc).tocsc()
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        return matrix
+
+    def base_lookup(self, rows, cols):
+        """在基础矩阵中查找若干位置
+
+        Args:
+            rows: 用户编码数组
+            cols: 歌曲编码数组
+
+        Returns:
+            (评分数组, 数据下标数组)，基础矩阵中没有的位置评分为0，
+            下标为 -(插入位置 + 1)
+        """
+        base = self.base
+        values = np.zeros(len(rows), dtype=np.float32)
+        positions = np.empty(len(rows), dtype=np.int64)
+        for i, (row, col) in enumerate(zip(rows, cols)):
+            if row >= base.shape[0]:
+                positions[i] = -(base.nnz + 1)
+                continue
+            start, end = base.indptr[row], base.indptr[row + 1]
+            pos = start + int(np.searchsorted(base.indices[start:end], col))
+            if pos < end and base.indices[pos] == col:
+                positions[i] = pos
+                values[i] = base.data[pos]
+            else:
+                positions[i] = -(pos + 1)
+        return values, positions
+
+    def lookup(self, rows, cols):
+        """查找若干位置的当前评分和时间戳(覆盖层优先)
+
+        Args:
+            rows: 用户编码数组
+            cols: 歌曲编码数组
+
+        Returns:
+            (评分数组, 时间戳数组, 基础矩阵评分数组, 基础矩阵下标数组)，
+            没有评分的位置评分为0、时间戳为NaN
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        base_values, base_pos = self.base_lookup(rows, cols)
+        values = base_values.copy()
+        times = np.full(len(rows), np.nan)
+        in_base = base_pos >= 0
+        if self.base_times is not None and in_base.any():
+            times[in_base] = self.base_times[base_pos[in_base]]
+
+        overlay = self.overlay
+        if len(overlay.keys):
+            keys = _overlay_keys(rows, cols)
+            slots = np.minimum(np.searchsorted(overlay.keys, keys), len(overlay.keys) - 1)
+            found = overlay.keys[slots] == keys
+            values[found] = overlay.values[slots[found]]
+            times[found] = overlay.times[slots[found]]
+        times[values == 0] = np.nan
+        return values, times, base_values, base_pos
+
+    def compact(self):
+        """把覆盖层合并进新的基础矩阵
+
+        更新的评分原位改写，删除的评分去掉，新增的评分按插入位置插入，
+        整个过程是若干次线性的数组操作；随后构建新的CSC。
+
+        Returns:
+            覆盖层为空的新快照
+        """
+        base, overlay = self.base, self.overlay
+        n_rows, n_cols = self.shape
+        data = np.array(base.data, dtype=np.float32)
+        indices = np.array(base.indices)
+        if indices.dtype != np.int32 and n_cols < np.iinfo(np.int32).max:
+            indices = indices.astype(np.int32)
+        times = None
+        if self.base_times is not None or np.isfinite(overlay.times).any():
+            times = (np.array(self.base_times, dtype=np.float64) if self.base_times is not None
+                     else np.full(base.nnz, np.nan))
+
+        existing = overlay.base_pos >= 0
+        nonzero = overlay.values != 0
+        updated = existing & nonzero
+        data[overlay.base_pos[updated]] = overlay.values[updated]
+        if times is not None:
+            times[overlay.base_pos[updated]] = overlay.times[updated]
+
+        counts = np.diff(_pad_indptr(base.indptr, n_rows + 1)).astype(np.int64)
+
+        deleted = np.sort(overlay.base_pos[existing & ~nonzero])
+        if len(deleted):
+            keep = np.ones(base.nnz, dtype=bool)
+            keep[deleted] = False
+            data, indices = data[keep], indices[keep]
+            if times is not None:
+                times = times[keep]
+            np.subtract.at(counts, overlay.rows[existing & ~nonzero], 1)
+
+        inserted = ~existing & nonzero
+        if inserted.any():
+            # 覆盖层按键有序，同一插入位置上的新评分也按列编码有序
+            positions = -overlay.base_pos[inserted] - 1
+            positions -= np.searchsorted(deleted, positions)
+            data = np.insert(data, positions, overlay.values[inserted])
+            indices = np.insert(indices, positions, overlay.cols[inserted].astype(indices.dtype))
+            if times is not None:
+                times = np.insert(times, positions, overlay.times[inserted])
+            np.add.at(counts, overlay.rows[inserted], 1)
+
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        matrix = sp.csr_matrix((data, indices, indptr), shape=self.shape)
+        csc = matrix.tocsc()
+        csc.sort_indices()
+        return RatingSnapshot(matrix, csc, times, self.user_ids, self.song_ids, version=self.version + 1)
+
+
+class RatingMatrix:
+    """用户-歌曲评分矩阵
+
+    行对应用户编码，列对应歌曲编码，值为评分(float32)。读取接口都基于
+    当前快照 snapshot()；需要在一次计算中多次读取时应先取快照再在其上读取。
+    """
+
+    def __init__(self, matrix, user_ids, song_ids, csc=None, timestamps=None,
+                 max_overlay=None, merge_interval=600):
+        """初始化评分矩阵
+
+        Args:
+            matrix: scipy稀疏矩阵，形状为 (用户数, 歌曲数)
+            user_ids: 用户ID字典(IdDictionary)，或行编码对应的原始用户ID序列；字典可以比矩阵多出
+                尚无评分的ID
+            song_ids: 歌曲ID字典(IdDictionary)，或列编码对应的原始歌曲ID序列
+            csc: 预先构建的按列存储副本(如产物目录中的内存映射数组)
+            timestamps: 与CSR数据顺序对齐的评分时间戳数组，可为None
+            max_overlay: 覆盖层合并阈值(条目数)，默认为 max(50000, 评分数的1%)
+            merge_interval: 覆盖层最长保留时间(秒)，超过后在下一次写入时合并，None表示不按时间合并
+        """
+        matrix = sp.csr_matrix(matrix, dtype=np.float32)
+        if not matrix.has_sorted_indices:
+            matrix.sort_indices()
+        if csc is None:
+            csc = matrix.tocsc()
+        self.max_overlay = max_overlay
+        self.merge_interval = merge_interval
+
+        self._snapshot = RatingSnapshot(matrix, csc, timestamps, _as_dictionary(user_ids), _as_dictionary(song_ids))
+        self._overlay_since = None
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def from_dataframe(cls, interactions_df, user_col='user_id', song_col='song_id', rating_col='rating',
+                       timestamp_col='timestamp', user_ids=None, song_ids=None):
+        """从交互DataFrame按列构建评分矩阵
+
+        同一用户对同一歌曲的重复记录以最后一条为准，与逐行写入字典的旧行为一致。
+        传入共享的ID字典时按字典编码，字典中没有的ID在副本上追加，传入的字典不会被修改。
+
+        Args:
+            interactions_df: 包含用户ID、歌曲ID和评分列的DataFrame
+            user_col: 用户ID列名
+            song_col: 歌曲ID列名
+            rating_col: 评分列名
+            timestamp_col: 时间戳列名，该列不存在时不记录评分时间
+            user_ids: 共享的用户ID字典(IdDictionary)，None时按首次出现顺序新建
+            song_ids: 共享的歌曲ID字典(IdDictionary)，None时按首次出现顺序新建
+
+        Returns:
+            RatingMatrix实例
+        """
+        has_timestamp = timestamp_col in interactions_df.columns
+        columns = [user_col, song_col, rating_col] + ([timestamp_col] if has_timestamp else [])
+        df = interactions_df[columns]
+        df = df.drop_duplicates(subset=[user_col, song_col], keep='last')
+
+        if user_ids is None:
+            user_ids, user_codes = IdDictionary.factorize(df[user_col])
+        else:
+            user_ids, user_codes = _append_ids(user_ids, df[user_col])
+        if song_ids is None:
+            song_ids, song_codes = IdDictionary.factorize(df[song_col])
+        else:
+            song_ids, song_codes = _append_ids(song_ids, df[song_col])
+        ratings = df[rating_col].to_numpy(dtype=np.float32)
+
+        matrix = sp.csr_matrix(
+            (ratings, (user_codes.astype(np.int32), song_codes.astype(np.int32))),
+            shape=(len(user_ids), len(song_ids)),
+            dtype=np.float32
+        )
+        matrix.sort_indices()
+
+        timestamps = None
+        if has_timestamp:
+            order = np.lexsort((song_codes, user_codes))
+            timestamps = pd.to_numeric(df[timestamp_col], errors='coerce').to_numpy(dtype=np.float64)[order]
+
+        logger.info(f"构建评分矩阵: {matrix.shape[0]}个用户, {matrix.shape[1]}首歌曲, {matrix.nnz}条评分")
+        return cls(matrix, user_ids, song_ids, timestamps=timestamps)
+
+    @classmethod
+    def from_artifacts(cls, store):
+        """从产物目录构建评分矩阵
+
+        CSR/CSC数组直接引用内存映射，不复制到进程私有内存；增量写入只进入覆盖层，
+        合并时生成新的私有矩阵，映射文件本身保持只读。
+
+        Args:
+            store: ArtifactStore实例
+
+        Returns:
+            RatingMatrix实例
+        """
+        matrix, csc, user_ids, song_ids = load_rating_arrays(store)
+        timestamps = store.array('ratings.timestamp') if 'ratings.timestamp' in store else None
+        logger.info(f"映射评分矩阵: {matrix.shape[0]}个用户, {matrix.shape[1]}首歌曲, {matrix.nnz}条评分")
+        return cls(matrix, user_ids, song_ids, csc=csc, timestamps=timestamps)
+
+    def snapshot(self):
+        """当前快照"""
+        return self._snapshot
+
+    @property
+    def version(self):
+        """当前快照版本，每次写入或合并后变化"""
+        return self._snapshot.version
+
+    @property
+    def matrix(self):
+        """合并覆盖层后的CSR矩阵(覆盖层为空时直接返回基础矩阵)"""
+        return self._snapshot.tocsr()
+
+    @property
+    def user_ids(self):
+        """用户ID字典"""
+        return self._snapshot.user_ids
+
+    @property
+    def song_ids(self):
+        """歌曲ID字典"""
+        return self._snapshot.song_ids
+
+    @property
+    def n_users(self):
+        """用户数量"""
+        return self._snapshot.shape[0]
+
+    @property
+    def n_songs(self):
+        """歌曲数量"""
+        return self._snapshot.shape[1]
+
+    @property
+    def nnz(self):
+        """非零评分数量"""
+        return self._snapshot.nnz
+
+    def tocsc(self):
+        """返回按列存储的评分矩阵"""
+        return self._snapshot.tocsc()
+
+    def user_code(self, user_id):
+        """获取用户编码
+
+        Args:
+            user_id: 原始用户ID
+
+        Returns:
+            用户行编码，不存在时返回-1
+        """
+        return self._snapshot.user_code(user_id)
+
+    def song_codes(self, song_ids):
+        """批量获取歌曲编码
+
+        Args:
+            song_ids: 原始歌曲ID序列
+
+        Returns:
+            int64数组，不存在的歌曲为-1
+        """
+        return self._snapshot.song_codes(song_ids)
+
+    def user_row(self, code):
+        """获取某一用户的评分行
+
+        Args:
+            code: 用户行编码
+
+        Returns:
+            (歌曲编码数组, 评分数组)
+        """
+        return self._snapshot.user_row(code)
+
+    def get_user_ratings(self, user_id):
+        """获取某一用户的评分字典
+
+        Args:
+            user_id: 原始用户ID
+
+        Returns:
+            {song_id: rating} 字典，用户不存在时返回空字典
+        """
+        return self._snapshot.get_user_ratings(user_id)
+
+    def _publish(self, snapshot, force_merge=False):
+        """发布新快照，覆盖层达到阈值或保留时间过长时先合并(调用方持有写锁)"""
+        if snapshot.overlay_size == 0:
+            self._overlay_since = None
+        elif self._overlay_since is None:
+            self._overlay_since = time.monotonic()
+
+        limit = self.max_overlay if self.max_overlay is not None else max(50000, snapshot.base.nnz // 100)
+        expired = (self.merge_interval is not None and self._overlay_since is not None
+                   and time.monotonic() - self._overlay_since >= self.merge_interval)
+        if snapshot.overlay_size and (force_merge or snapshot.overlay_size >= limit or expired):
+            started = time.perf_counter()
+            size = snapshot.overlay_size
+            snapshot = snapshot.compact()
+            self._overlay_since = None
+            logger.info(f"合并评分覆盖层: {size}条, 耗时 {time.perf_counter() - started:.3f}s")
+        self._snapshot = snapshot
+
+    def _write(self, snapshot, user_ids, song_ids, rows, cols, values, times):
+        """把一批条目写入覆盖层并发布(调用方持有写锁)
+
+        Returns:
+            (旧评分数组, 旧时间戳数组)，此前不存在的评分两者均为NaN
+        """
+        previous, previous_times, base_values, base_pos = snapshot.lookup(rows, cols)
+        entries = _Overlay(
+            keys=_overlay_keys(rows, cols),
+            rows=np.asarray(rows, dtype=np.int64),
+            cols=np.asarray(cols, dtype=np.int64),
+            values=np.asarray(values, dtype=np.float32),
+            times=np.asarray(times, dtype=np.float64),
+            base_values=base_values,
+            base_pos=base_pos,
+        )
+        overlay = _merge_overlay(snapshot.overlay, entries)
+        self._publish(RatingSnapshot(snapshot.base, snapshot.base_csc, snapshot.base_times, user_ids, song_ids,
+                                     overlay, version=snapshot.version + 1))
+
+        previous = previous.astype(np.float64)
+        previous[previous == 0] = np.nan
+        return previous, previous_times
+
+    def upsert_many(self, user_ids, song_ids, ratings, timestamps=None):
+        """批量写入新评分
+
+        新用户和新歌曲追加到编码末尾，已有评分被覆盖。新评分只写入覆盖层，
+        基础矩阵在覆盖层达到阈值时才合并重建。
+
+        Args:
+            user_ids: 用户ID序列
+            song_ids: 歌曲ID序列
+            ratings: 评分序列
+            timestamps: 评分时间戳序列(秒)，可为None
+
+        Returns:
+            (去重后的更新DataFrame, 旧评分数组, 旧时间戳数组)，DataFrame包含user_id、song_id、
+            rating、timestamp列，此前不存在的评分对应的旧评分和旧时间戳为NaN
+        """
+        updates = pd.DataFrame({'user_id': user_ids, 'song_id': song_ids, 'rating': ratings})
+        updates['timestamp'] = np.nan
+        if timestamps is not None:
+            updates['timestamp'] = pd.to_numeric(pd.Series(list(timestamps), dtype=object), errors='coerce').to_numpy()
+        updates = updates.drop_duplicates(subset=['user_id', 'song_id'], keep='last').reset_index(drop=True)
+        if updates.empty:
+            return updates, np.zeros(0), np.zeros(0)
+
+        with self._write_lock:
+            snapshot = self._snapshot
+            user_dictionary, rows = _append_ids(snapshot.user_ids, updates['user_id'])
+            song_dictionary, cols = _append_ids(snapshot.song_ids, updates['song_id'])
+
+            previous, previous_times = self._write(
+                snapshot, user_dictionary, song_dictionary, rows, cols,
+                updates['rating'].to_numpy(dtype=np.float32),
+                updates['timestamp'].to_numpy(dtype=np.float64)
+            )
+        return updates, previous, previous_times
+
+    def remove_many(self, user_ids, song_ids):
+        """批量删除评分
+
+        用户和歌曲编码保留(编码只追加不复用)，只是对应位置不再有评分。
+
+        Args:
+            user_ids: 用户ID序列
+            song_ids: 歌曲ID序列
+
+        Returns:
+            实际被删除评分的DataFrame，包含user_id、song_id、rating、timestamp列
+        """
+        pairs = pd.DataFrame({'user_id': list(user_ids), 'song_id': list(song_ids)}, dtype=object)
+        pairs = pairs.drop_duplicates().reset_index(drop=True)
+
+        with self._write_lock:
+            snapshot = self._snapshot
+            rows = snapshot.user_ids.encode(pairs['user_id'])
+            cols = snapshot.song_ids.encode(pairs['song_id'])
+            present = np.flatnonzero((rows >= 0) & (cols >= 0))
+            present = present[snapshot.lookup(rows[present], cols[present])[0] != 0]
+
+            removed = pairs.iloc[present].reset_index(drop=True)
+            if not len(present):
+                return removed.assign(rating=np.zeros(0), timestamp=np.zeros(0))
+
+            previous, previous_times = self._write(
+                snapshot, snapshot.user_ids, snapshot.song_ids, rows[present], cols[present],
+                np.zeros(len(present), dtype=np.float32), np.full(len(present), np.nan)
+            )
+        removed['rating'] = previous
+        removed['timestamp'] = previous_times
+        return removed
+
+    def compact(self):
+        """立即把覆盖层合并进基础矩阵"""
+        with self._write_lock:
+            self._publish(self._snapshot, force_merge=True)
+
+    def as_dict_view(self):
+        """返回兼容旧接口的惰性字典视图"""
+        return UserRatingsView(self)
+
+
+class UserRatingsView(Mapping):
+    """评分矩阵的只读字典视图
+
+    行为等价于旧的 {user_id: {song_id: rating}}，但每个用户的内层字典
+    只在被访问时才从CSR行构建，不会常驻内存。用户编码删除评分后仍然保留，
+    评分已全部删除的用户与旧字典一样视为不存在。
+    """
+
+    def __init__(self, rating_matrix):
+        self._rating_matrix = rating_matrix
+
+    def __getitem__(self, user_id):
+        snapshot = self._rating_matrix.snapshot()
+        code = snapshot.user_code(user_id)
+        if code < 0:
+            raise KeyError(user_id)
+        song_codes, ratings = snapshot.user_row(code)
+        if not len(song_codes):
+            raise KeyError(user_id)
+        return dict(zip(snapshot.song_ids.decode(song_codes).tolist(), ratings.tolist()))
+
+    def __contains__(self, user_id):
+        snapshot = self._rating_matrix.snapshot()
+        code = snapshot.user_code(user_id)
+        return code >= 0 and len(snapshot.user_row(code)[0]) > 0
+
+    def __iter__(self):
+        return iter(self._rating_matrix.user_ids.ids.tolist())
+
+    def __len__(self):
+        return self._rating_matrix.n_users
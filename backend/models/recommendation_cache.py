@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按用户缓存的最终推荐结果
+
+/api/recommendations/<user_id> 每次都要召回、打分并逐首用Spotify补充信息，
+而用户多数时候只是刷新页面。这里以 (用户, 推荐方式) 为键缓存最终的推荐列表，
+容量有上限(LRU淘汰)并带过期时间；用户的评分或反馈变化时只清除该用户的条目，
+模型版本变化时整体失效。命中率和内存占用可以通过 stats() 查看。
+"""
+
+import copy
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _approx_size(value):
+    """以JSON编码长度估算结果占用的字节数"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+
+class RecommendationCache:
+    """带LRU淘汰和过期时间的推荐结果缓存
+
+    评分写入(接口或 RatingIngestor 同步)后调用 invalidate_users；
+    计算期间该用户被失效时，算出的结果不写入缓存，避免把旧数据算出的结果留下。
+    失效计数只为正在计算的用户保留，计算结束后即删除，不随用户数增长。
+    """
+
+    def __init__(self, max_entries=10000, ttl=600, version_fn=None):
+        """初始化缓存
+
+        Args:
+            max_entries: 最多缓存的条目数
+            ttl: 条目过期时间(秒)，为None时不过期
+            version_fn: 返回当前模型版本的函数，版本变化时全部条目失效
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_fn = version_fn
+
+        self._entries = OrderedDict()  # (user_id, method) -> (结果, 过期时间, 估算字节数)
+        self._user_keys = {}           # user_id -> 该用户的全部键
+        self._generations = {}         # user_id -> 计算期间的失效次数，变化时结果不写入
+        self._in_flight = {}           # user_id -> 正在进行的计算数
+        self._epoch = 0                # 整体失效次数
+        self._version = version_fn() if version_fn is not None else None
+        self._lock = threading.Lock()
+
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def _check_version(self):
+        """模型版本变化时清空缓存(调用方持有锁)"""
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            logger.info(f"模型版本由 {self._version} 变为 {version}，清空推荐缓存")
+            self._version = version
+            self._invalidations += len(self._entries)
+            self._clear()
+
+    def _clear(self):
+        """清空全部条目(调用方持有锁)
+
+        epoch 加1后，此前取得的失效计数都不再匹配，失效计数可以一并清空。
+        """
+        self._epoch += 1
+        self._entries.clear()
+        self._user_keys.clear()
+        self._generations.clear()
+        self._bytes = 0
+
+    def _release(self, user_id):
+        """结束一次计算，该用户没有其它计算时删除其失效计数(调用方持有锁)"""
+        count = self._in_flight.get(user_id, 0) - 1
+        if count > 0:
+            self._in_flight[user_id] = count
+        else:
+            self._in_flight.pop(user_id, None)
+            self._generations.pop(user_id, None)
+
+    def _remove(self, key):
+        """删除一个条目(调用方持有锁)"""
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def get(self, user_id, method):
+        """读取缓存的推荐结果
+
+        Args:
+            user_id: 用户ID
+            method: 推荐方式，如 'hybrid'
+
+        Returns:
+            推荐结果的副本，未命中或已过期时返回None
+        """
+        key = (user_id, method)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            value = entry[0]
+        return copy.deepcopy(value)
+
+    def generation(self, user_id):
+        """开始为用户计算结果
+
+        返回用户当前的失效计数，并把该用户记为计算中；之后必须以该返回值调用
+        put (计算失败时调用 release)，用于判断计算期间是否发生了失效。
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            (整体失效次数, 用户失效次数)
+        """
+        with self._lock:
+            self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+            return self._epoch, self._generations.get(user_id, 0)
+
+    def release(self, user_id):
+        """放弃一次通过 generation 开始的计算(如计算出错)"""
+        with self._lock:
+            self._release(user_id)
+
+    def put(self, user_id, method, value, generation=None):
+        """写入推荐结果
+
+        Args:
+            user_id: 用户ID
+            method: 推荐方式
+            value: 推荐结果(保存副本)
+            generation: 开始计算前 generation() 的返回值，已变化时不写入；
+                传入时同时结束这次计算
+
+        Returns:
+            是否写入
+        """
+        value = copy.deepcopy(value)
+        size = _approx_size(value)
+        key = (user_id, method)
+        with self._lock:
+            self._check_version()
+            if generation is not None:
+                current = (self._epoch, self._generations.get(user_id, 0))
+                self._release(user_id)
+                if current != generation:
+                    return False
+            if key in self._entries:
+                self._remove(key)
+
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (value, expires_at, size)
+            self._user_keys.setdefault(user_id, set()).add(key)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+        return True
+
+    def get_or_compute(self, user_id, method, compute):
+        """读取缓存，未命中时计算并写入
+
+        Args:
+            user_id: 用户ID
+            method: 推荐方式
+            compute: 无参数的计算函数，返回推荐结果
+
+        Returns:
+            推荐结果
+        """
+        value = self.get(user_id, method)
+        if value is not None:
+            return value
+        generation = self.generation(user_id)
+        try:
+            value = compute()
+        except Exception:
+            self.release(user_id)
+            raise
+        self.put(user_id, method, value, generation)
+        return value
+
+    def invalidate_users(self, user_ids):
+        """清除这些用户的全部条目，可作为推荐引擎的评分回调
+
+        Args:
+            user_ids: 用户ID列表
+        """
+        with self._lock:
+            for user_id in user_ids:
+                # 只有正在计算的用户需要记录失效次数
+                if user_id in self._in_flight:
+                    self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                for key in list(self._user_keys.get(user_id, ())):
+                    self._remove(key)
+                    self._invalidations += 1
+
+    def invalidate_all(self):
+        """清空缓存，如重新加载模型之后"""
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._clear()
+
+    def stats(self):
+        """缓存统计
+
+        Returns:
+            条目数、估算内存、命中率以及淘汰/过期/失效次数
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'users': len(self._user_keys),
+                'in_flight': len(self._in_flight),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'approx_bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+                'model_version': self._version,
+            }
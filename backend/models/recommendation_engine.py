@@ -2,10 +2,13 @@
 # -*- coding: utf-8 -*-
 
 """
-音乐推荐引擎 - 简化版
+音乐推荐引擎
 
-此模块包含音乐推荐系统的核心功能，但使用简化的推荐逻辑。
-复杂的推荐算法(SVD++, NCF, MLP)将在未来更新中实现。
+此模块包含音乐推荐系统的核心功能。评分保存在CSR稀疏矩阵中并随SQLite新评分增量更新，
+模型推荐分两阶段完成: 召回阶段(CandidateRetriever)从近邻索引、协同过滤邻居、艺术家
+索引和热门榜取出几百首候选；排序阶段(HybridBlender)只对这些候选调用基于用户的协同
+过滤、基于内容的近邻、SVD++因子矩阵(FactorScorer/FoldInScorer)以及NCF/MLP的NumPy
+前向计算(NeuralScorer)，按配置的权重加权。没有评分的用户返回热门歌曲。
 """
 
 import os
@@ -16,22 +19,55 @@ import logging
 import random
 import pickle
 import json
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
 from datetime import datetime
 
+from .rating_matrix import RatingMatrix
+from .id_dictionary import IdDictionary, USER_DICTIONARY, SONG_DICTIONARY
+from .cf_engine import UserBasedCF
+from .item_neighbors import ItemNeighborIndex
+from .song_catalog import SongCatalog
+from .popularity import PopularityLeaderboard
+from .factor_scorer import FactorScorer
+from .fold_in import FoldInScorer
+from .neural_scorer import NeuralScorer
+from .hybrid_blender import HybridBlender
+from .candidate_pipeline import CandidateRetriever
+from .ann_index import EMBEDDING_SOURCES, load_ann_index
+from .artifact_store import ARTIFACTS_DIR, ArtifactStore, load_songs_frame
+from .columnar_store import find_table, load_table, save_table
+
 logger = logging.getLogger(__name__)
 
+# 排序阶段各打分器的显示名称
+SOURCE_LABELS = {
+    'cf': '协同过滤',
+    'svdpp': 'SVD++',
+    'ncf': 'NCF',
+    'mlp': 'MLP',
+    'content': '相似歌曲',
+}
+
+# 没有打分器给出分数时，按召回来源给出推荐理由
+RETRIEVAL_EXPLANATIONS = {
+    'neighbors': '与您喜欢的歌曲相似',
+    'cf': '根据您的音乐品味推荐',
+    'artist': '来自您喜欢的艺术家',
+    'popular': '热门歌曲推荐',
+}
+
 class MusicRecommender:
     """音乐推荐系统类
     
-    简化版的推荐引擎，提供基本的推荐功能。
-    高级算法(SVD++, NCF, MLP)将在未来实现。
+    提供基于用户的协同过滤、热门歌曲和相似歌曲推荐；SVD++、NCF、MLP
+    模型在对应的离线产物存在时加载，否则退回到协同过滤。
     """
     
     def __init__(self, data_dir='processed_data', use_msd=True, force_retrain=False, 
                  model_type='svdpp', svd_n_factors=100, svd_n_epochs=20, svd_reg_all=0.02, 
                  content_weight=0.3, cf_weight=0.3, ncf_weight=0.2, mlp_weight=0.2,
-                 user_based=True, sample_size=None):
+                 user_based=True, sample_size=None, popularity_half_life_days=None):
         """初始化推荐系统
         
         Args:
@@ -48,6 +84,7 @@ class MusicRecommender:
             mlp_weight: 多层感知机权重
             user_based: 是否使用基于用户的协同过滤
             sample_size: 采样大小
+            popularity_half_life_days: 热门度时间衰减半衰期(天)，为None时不衰减
         """
         self.data_dir = data_dir
         self.use_msd = use_msd
@@ -62,47 +99,75 @@ class MusicRecommender:
         self.mlp_weight = mlp_weight
         self.user_based = user_based
         self.sample_size = sample_size
+        self.popularity_half_life_days = popularity_half_life_days
         
         # 创建数据目录
         os.makedirs(self.data_dir, exist_ok=True)
         
         # 数据存储
-        self.user_ratings = {}  # 用户评分
+        self.rating_matrix = None  # 用户-歌曲稀疏评分矩阵
+        self.cf_engine = None      # 基于用户的协同过滤引擎
+        self.popularity = None     # 热门歌曲排行榜
+        self.user_ratings = {}  # 用户评分(评分矩阵的惰性字典视图)
         self.songs_df = None    # 歌曲元数据
+        self.catalog = None     # 按song_id索引的歌曲目录
         self.interactions_df = None  # 用户-歌曲交互数据
+        self.item_neighbors = None   # 离线构建的歌曲近邻索引
+        self.ann_index = None        # 歌曲向量的近似最近邻索引
+        self.svdpp_scorer = None     # SVD++/SVD因子模型打分器
+        self.svdpp_fold_in = None    # 为模型外的新用户折叠向量的因子打分器
+        self.ncf_scorer = None       # NCF模型NumPy打分器
+        self.mlp_scorer = None       # MLP模型NumPy打分器
+        self.hybrid_blender = HybridBlender()  # 排序阶段: 并行打分并加权混合
+        self.retriever = None        # 召回阶段: 多路候选召回
+        self.artifact_store = None   # 内存映射的产物版本
+        
+        # 增量评分更新
+        self._update_lock = threading.Lock()
+        self._rating_listeners = []  # 评分变化时的回调，参数为受影响的用户ID列表
+        
+        # 内容聚合结果按 (用户, 评分矩阵快照版本) 缓存，召回和排序阶段共用
+        self._content_profiles = OrderedDict()
+        self._content_lock = threading.Lock()
+        self.content_cache_size = 1024
         
         # 加载数据
         self._load_data()
+        self._load_item_neighbors()
+        self._load_ann_index()
+        self._load_factor_models()
+        self._build_fold_in()
+        self._load_neural_models()
+        self._build_retriever()
         
         logger.info(f"音乐推荐系统初始化完成: 模型类型={model_type}, 数据目录={data_dir}")
         
     def _load_data(self):
         """加载数据
         
-        加载用户评分数据和歌曲元数据
+        优先以内存映射方式打开 data_dir/artifacts 中的产物版本；
+        没有产物时加载CSV格式的用户评分数据和歌曲元数据
         """
+        if self._load_artifacts():
+            return
+        
         try:
-            # 歌曲元数据文件路径
-            songs_file = os.path.join(self.data_dir, 'songs.csv')
-            interactions_file = os.path.join(self.data_dir, 'user_song_interactions.csv')
-            
-            # 检查文件是否存在，如果不存在则创建样本数据
-            if not os.path.exists(songs_file) or not os.path.exists(interactions_file):
+            # 检查数据表是否存在(Parquet/Feather，或旧的CSV)，如果不存在则创建样本数据
+            if find_table(self.data_dir, 'songs') is None or find_table(self.data_dir, 'user_song_interactions') is None:
                 logger.info("数据文件不存在，创建样本数据...")
                 self._create_sample_data()
         
         # 加载歌曲元数据
-            self.songs_df = pd.read_csv(songs_file)
+            self.songs_df = load_table(self.data_dir, 'songs')
+            self.catalog = SongCatalog(self.songs_df)
             logger.info(f"加载了 {len(self.songs_df)} 首歌曲的元数据")
             
             # 加载用户-歌曲交互数据
-            self.interactions_df = pd.read_csv(interactions_file)
+            self.interactions_df = load_table(self.data_dir, 'user_song_interactions')
             logger.info(f"加载了 {len(self.interactions_df)} 条用户-歌曲交互记录")
             
-            # 构建用户评分字典
-            self.user_ratings = defaultdict(dict)
-            for _, row in self.interactions_df.iterrows():
-                self.user_ratings[row['user_id']][row['song_id']] = row['rating']
+            # 构建用户评分矩阵和热门排行榜
+            self._build_interaction_indexes()
             
             logger.info(f"构建了 {len(self.user_ratings)} 个用户的评分数据")
             
@@ -111,6 +176,42 @@ class MusicRecommender:
             # 发生错误时创建样本数据
             self._create_sample_data()
     
+    def _load_artifacts(self):
+        """从产物版本加载歌曲元数据和评分矩阵
+        
+        评分矩阵的CSR/CSC数组直接引用内存映射，热门排行榜由CSR列编码一次统计得到
+        
+        Returns:
+            是否加载成功
+        """
+        try:
+            store = ArtifactStore.open(os.path.join(self.data_dir, ARTIFACTS_DIR))
+            if store is None or 'ratings.indptr' not in store:
+                return False
+            
+            self.songs_df = load_songs_frame(store)
+            self.catalog = SongCatalog(self.songs_df)
+            
+            rating_matrix = RatingMatrix.from_artifacts(store)
+            timestamps = store.array('ratings.timestamp') if 'ratings.timestamp' in store else None
+            popularity = PopularityLeaderboard.from_arrays(
+                rating_matrix.song_ids.ids,
+                rating_matrix.matrix.indices,
+                rating_matrix.matrix.data,
+                timestamps,
+                half_life_days=self.popularity_half_life_days
+            )
+            self._build_interaction_indexes(rating_matrix, popularity)
+            self.artifact_store = store
+            
+            logger.info(f"从产物版本 {store.version} 加载了 {len(self.songs_df)} 首歌曲和 "
+                        f"{rating_matrix.nnz} 条评分")
+            return True
+        except Exception as e:
+            logger.error(f"加载产物版本时出错: {str(e)}")
+            self.artifact_store = None
+            return False
+    
     def _create_sample_data(self):
         """创建样本数据
         
@@ -132,6 +233,7 @@ class MusicRecommender:
             
             # 创建歌曲数据框
             self.songs_df = pd.DataFrame(sample_songs)
+            self.catalog = SongCatalog(self.songs_df)
             
             # 样本用户-歌曲交互数据
             sample_interactions = []
@@ -153,17 +255,12 @@ class MusicRecommender:
             # 创建交互数据框
             self.interactions_df = pd.DataFrame(sample_interactions)
             
-            # 构建用户评分字典
-            self.user_ratings = defaultdict(dict)
-            for _, row in self.interactions_df.iterrows():
-                self.user_ratings[row['user_id']][row['song_id']] = row['rating']
+            # 构建用户评分矩阵和热门排行榜
+            self._build_interaction_indexes()
             
             # 保存样本数据
-            songs_file = os.path.join(self.data_dir, 'songs.csv')
-            interactions_file = os.path.join(self.data_dir, 'user_song_interactions.csv')
-            
-            self.songs_df.to_csv(songs_file, index=False)
-            self.interactions_df.to_csv(interactions_file, index=False)
+            save_table(self.songs_df, self.data_dir, 'songs')
+            save_table(self.interactions_df, self.data_dir, 'user_song_interactions')
             
             logger.info(f"创建了样本数据: {len(self.songs_df)}首歌曲, {len(self.interactions_df)}条交互记录")
             
@@ -171,10 +268,246 @@ class MusicRecommender:
             logger.error(f"创建样本数据时出错: {str(e)}")
             raise
     
+    def _build_interaction_indexes(self, rating_matrix=None, popularity=None):
+        """构建基于交互数据的索引
+        
+        按列将交互数据编码为CSR稀疏矩阵(编码沿用数据目录中共享的 user / song ID字典)，
+        user_ratings作为兼容旧接口的惰性视图；同时一次性统计热门歌曲排行榜
+        
+        Args:
+            rating_matrix: 已构建的评分矩阵，为None时从 interactions_df 构建
+            popularity: 已构建的热门排行榜，为None时从 interactions_df 统计
+        """
+        if rating_matrix is None:
+            rating_matrix = RatingMatrix.from_dataframe(
+                self.interactions_df,
+                user_ids=IdDictionary.load(self.data_dir, USER_DICTIONARY),
+                song_ids=IdDictionary.load(self.data_dir, SONG_DICTIONARY)
+            )
+        if popularity is None:
+            popularity = PopularityLeaderboard.from_interactions(
+                self.interactions_df,
+                half_life_days=self.popularity_half_life_days
+            )
+        self.rating_matrix = rating_matrix
+        self.user_ratings = self.rating_matrix.as_dict_view()
+        self.cf_engine = UserBasedCF(self.rating_matrix)
+        self.popularity = popularity
+    
+    def _load_item_neighbors(self):
+        """加载歌曲近邻索引
+        
+        索引由 backend/scripts/build_item_neighbors.py 离线生成，不存在时
+        get_similar_songs 退回到按艺术家和流派匹配
+        """
+        try:
+            self.item_neighbors = ItemNeighborIndex.load(self.data_dir)
+            if self.item_neighbors is None:
+                logger.info("未找到歌曲近邻索引，相似歌曲将按艺术家和流派匹配")
+        except Exception as e:
+            logger.error(f"加载歌曲近邻索引时出错: {str(e)}")
+            self.item_neighbors = None
+    
+    def _load_ann_index(self):
+        """加载歌曲向量索引
+        
+        索引由 backend/scripts/build_ann_index.py 离线生成，按内容模型、
+        SVD++/SVD、NCF、MLP的顺序使用第一个可用的索引
+        """
+        for name in EMBEDDING_SOURCES:
+            try:
+                self.ann_index = load_ann_index(self.data_dir, name)
+            except Exception as e:
+                logger.error(f"加载{name}向量索引时出错: {str(e)}")
+                self.ann_index = None
+            if self.ann_index is not None:
+                return
+    
+    def _load_factor_models(self):
+        """加载潜在因子模型
+        
+        依次尝试训练脚本保存的 svdpp_model.pkl、cf_model.pkl 和隐式ALS的
+        als_factors.npz，只在启动时提取一次因子矩阵；产物版本中收录了因子数组时
+        直接使用内存映射
+        """
+        for name in ('svdpp', 'cf', 'als'):
+            try:
+                factors = self._artifact_group(name)
+                if factors is not None:
+                    self.svdpp_scorer = FactorScorer(factors, name=name)
+                    logger.info(f"从产物版本映射了{name}因子模型: {self.svdpp_scorer.n_items}首歌曲")
+                else:
+                    self.svdpp_scorer = FactorScorer.load(self.data_dir, name)
+            except Exception as e:
+                logger.error(f"加载{name}因子模型时出错: {str(e)}")
+                self.svdpp_scorer = None
+            if self.svdpp_scorer is not None:
+                return
+        logger.info("未找到SVD++/SVD/ALS模型，SVD++推荐将使用协同过滤")
+    
+    def _build_fold_in(self):
+        """为因子模型构建新用户折叠打分器
+        
+        新用户的评分经 apply_ratings 写入评分矩阵后，用固定的歌曲因子求解用户向量；
+        向量按用户缓存，该用户再有新评分时由评分回调清除
+        """
+        if self.svdpp_scorer is None:
+            self.svdpp_fold_in = None
+            return
+        self.svdpp_fold_in = FoldInScorer(self.svdpp_scorer, lambda user_id: self.rating_matrix.get_user_ratings(user_id))
+        self.add_rating_listener(self.svdpp_fold_in.invalidate)
+    
+    def _load_neural_models(self):
+        """加载导出为npz的NCF/MLP模型权重，优先使用产物版本中的内存映射数组"""
+        for name in ('ncf', 'mlp'):
+            try:
+                weights = self._artifact_group(name)
+                if weights is not None:
+                    scorer = NeuralScorer(weights, name=name)
+                    logger.info(f"从产物版本映射了{name}模型权重: {scorer.n_items}首歌曲")
+                else:
+                    scorer = NeuralScorer.load(self.data_dir, name)
+            except Exception as e:
+                logger.error(f"加载{name}模型权重时出错: {str(e)}")
+                scorer = None
+            setattr(self, f'{name}_scorer', scorer)
+    
+    @property
+    def model_version(self):
+        """当前加载的产物版本，没有使用产物版本时为None"""
+        return self.artifact_store.version if self.artifact_store is not None else None
+    
+    def _artifact_group(self, name):
+        """读取产物版本中某个模型的数组组，没有时返回None"""
+        if self.artifact_store is None:
+            return None
+        return self.artifact_store.group(name)
+    
+    def _build_retriever(self, max_candidates=300):
+        """构建候选召回器
+        
+        召回来源按优先级为: 歌曲近邻、协同过滤邻居、喜欢的艺术家、热门歌曲；
+        统一排除用户已评分的歌曲和不在歌曲目录中的歌曲
+        
+        Args:
+            max_candidates: 每次请求的最大候选数
+        """
+        self.retriever = CandidateRetriever(
+            sources=[
+                ('neighbors', max_candidates // 2, self._get_content_candidates),
+                ('cf', max_candidates // 2, lambda user_id, n: self.cf_engine.recommend(user_id, n)),
+                ('artist', max_candidates // 6, self._get_artist_candidates),
+                ('popular', max_candidates // 6, self._get_popular_candidates),
+            ],
+            filters=[self._filter_rated_songs, self._filter_unknown_songs],
+            max_candidates=max_candidates
+        )
+    
+    def _build_song_results(self, scored_songs, explanation):
+        """为 [(song_id, score), ...] 批量添加歌曲元数据
+        
+        Args:
+            scored_songs: 歌曲ID和分数列表
+            explanation: 推荐理由
+            
+        Returns:
+            推荐歌曲列表，不在歌曲目录中的歌曲被跳过
+        """
+        result = []
+        song_records = self.catalog.lookup_many([song_id for song_id, _ in scored_songs])
+        for song_data, (_, score) in zip(song_records, scored_songs):
+            if song_data is not None:
+                song_data['score'] = score
+                song_data['explanation'] = explanation
+                result.append(song_data)
+        return result
+    
+    def add_rating_listener(self, callback):
+        """注册评分变化回调
+        
+        Args:
+            callback: 回调函数，参数为本批评分涉及的用户ID列表
+        """
+        self._rating_listeners.append(callback)
+    
+    def apply_ratings(self, ratings_df):
+        """增量写入一批新评分
+        
+        更新内存评分矩阵和热门排行榜，并通知按用户缓存结果的组件，
+        不需要重新加载交互数据
+        
+        Args:
+            ratings_df: 包含user_id、song_id、rating列(可选timestamp列)的DataFrame
+            
+        Returns:
+            实际写入的评分数量
+        """
+        if self.rating_matrix is None or ratings_df is None or ratings_df.empty:
+            return 0
+        
+        timestamps = ratings_df['timestamp'] if 'timestamp' in ratings_df.columns else None
+        
+        with self._update_lock:
+            # 评分矩阵以快照形式整体发布，协同过滤引擎每次计算时读取当前快照
+            updates, previous, previous_times = self.rating_matrix.upsert_many(
+                ratings_df['user_id'], ratings_df['song_id'], ratings_df['rating'], timestamps
+            )
+            # 旧评分按它自己的时间戳撤销衰减贡献，与写入时使用的衰减系数一致
+            self.popularity.update_many(
+                (song_id, rating, None if np.isnan(timestamp) else timestamp,
+                 None if np.isnan(previous_rating) else previous_rating,
+                 None if np.isnan(previous_time) else previous_time)
+                for song_id, rating, timestamp, previous_rating, previous_time
+                in zip(updates['song_id'], updates['rating'], updates['timestamp'], previous, previous_times)
+            )
+        
+        user_ids = updates['user_id'].unique().tolist()
+        self._notify_rating_listeners(user_ids)
+        
+        logger.info(f"增量写入 {len(updates)} 条评分，涉及 {len(user_ids)} 个用户")
+        return len(updates)
+    
+    def remove_ratings(self, ratings_df):
+        """删除一批评分(如用户被删除)
+        
+        从内存评分矩阵中去掉这些评分，并从热门排行榜中撤销它们的贡献
+        
+        Args:
+            ratings_df: 包含user_id、song_id列的DataFrame
+            
+        Returns:
+            实际删除的评分数量
+        """
+        if self.rating_matrix is None or ratings_df is None or ratings_df.empty:
+            return 0
+        
+        with self._update_lock:
+            removed = self.rating_matrix.remove_many(ratings_df['user_id'], ratings_df['song_id'])
+            self.popularity.remove_many(
+                (song_id, rating, None if np.isnan(timestamp) else timestamp)
+                for song_id, rating, timestamp in zip(removed['song_id'], removed['rating'], removed['timestamp'])
+            )
+        
+        user_ids = removed['user_id'].unique().tolist()
+        self._notify_rating_listeners(user_ids)
+        
+        logger.info(f"删除 {len(removed)} 条评分，涉及 {len(user_ids)} 个用户")
+        return len(removed)
+    
+    def _notify_rating_listeners(self, user_ids):
+        """通知评分变化回调"""
+        for callback in self._rating_listeners:
+            try:
+                callback(user_ids)
+            except Exception as e:
+                logger.error(f"评分更新回调出错: {str(e)}")
+    
     def get_recommendations(self, user_id, top_n=10):
-        """获取推荐
+        """获取基于用户的协同过滤推荐
         
-        简化版的推荐方法，未实现复杂算法
+        在稀疏评分矩阵上找相似用户并按其评分加权，不足时用热门歌曲补齐；
+        没有评分的用户直接返回热门歌曲。模型打分器不可用时的其它推荐方法也回退到这里，
+        完整的召回→排序推荐见 get_super_hybrid_recommendations
         
         Args:
             user_id: 用户ID
@@ -190,22 +523,8 @@ class MusicRecommender:
         # 使用基于用户的协同过滤
         recommended_songs = self._get_cf_recommendations(user_id, top_n)
         
-        # 添加歌曲元数据
-        result = []
-        for song_id, score in recommended_songs:
-            song_info = self.songs_df[self.songs_df['song_id'] == song_id]
-            if not song_info.empty:
-                song_data = song_info.iloc[0].to_dict()
-                song_data['score'] = score
-                song_data['explanation'] = f"根据您的音乐品味推荐"
-                
-                # 确保兼容前端展示所需的字段
-                if 'track_name' in song_data and 'title' not in song_data:
-                    song_data['title'] = song_data['track_name']
-                if 'artist_name' in song_data and 'artist' not in song_data:
-                    song_data['artist'] = song_data['artist_name']
-                
-                result.append(song_data)
+        # 批量添加歌曲元数据
+        result = self._build_song_results(recommended_songs, f"根据您的音乐品味推荐")
         
         # 如果推荐数量不足，添加热门歌曲
         if len(result) < top_n:
@@ -222,7 +541,7 @@ class MusicRecommender:
     def _get_cf_recommendations(self, user_id, top_n=10):
         """基于协同过滤的推荐
         
-        简化版的基于用户的协同过滤，计算用户相似度并推荐相似用户喜欢的歌曲
+        基于用户的协同过滤，在共同评分的歌曲上计算用户相似度并推荐相似用户喜欢的歌曲
         
         Args:
             user_id: 用户ID
@@ -231,65 +550,25 @@ class MusicRecommender:
         Returns:
             推荐歌曲ID和分数列表 [(song_id, score), ...]
         """
-        # 用户已评分的歌曲
-        user_songs = set(self.user_ratings[user_id].keys())
+        # 在稀疏评分矩阵上计算相似用户和候选歌曲分数
+        recommendations = self.cf_engine.recommend(user_id, top_n)
         
-        # 计算用户相似度
-        user_sim_scores = {}
-        for other_id, other_ratings in self.user_ratings.items():
-            if other_id == user_id:
-                continue
-            
-            # 共同评分的歌曲
-            common_songs = user_songs.intersection(other_ratings.keys())
-            if len(common_songs) < 3:  # 至少有3首共同评分的歌曲
-                continue
-        
-            # 计算余弦相似度
-            sum_xy = sum(self.user_ratings[user_id][song] * other_ratings[song] for song in common_songs)
-            sum_x2 = sum(self.user_ratings[user_id][song] ** 2 for song in common_songs)
-            sum_y2 = sum(other_ratings[song] ** 2 for song in common_songs)
-            
-            if sum_x2 == 0 or sum_y2 == 0:
-                continue
-            
-            sim = sum_xy / (np.sqrt(sum_x2) * np.sqrt(sum_y2))
-            user_sim_scores[other_id] = sim
+        # 没有相似用户时(如刚注册的新用户)，用因子模型折叠出的用户向量推荐
+        if not recommendations and self.svdpp_fold_in is not None:
+            recommendations = self.svdpp_fold_in.recommend(
+                user_id, top_n, exclude_ids=list(self.rating_matrix.get_user_ratings(user_id)))
         
-        # 如果没有相似用户，返回热门歌曲
-        if not user_sim_scores:
+        # 如果仍然没有推荐，返回热门歌曲
+        if not recommendations:
             logger.warning(f"用户 {user_id} 没有相似用户，返回热门歌曲")
             return [(song['song_id'], 0) for song in self.get_popular_songs(top_n)]
         
-        # 根据相似度排序
-        sorted_users = sorted(user_sim_scores.items(), key=lambda x: x[1], reverse=True)
-        
-        # 推荐相似用户喜欢但当前用户未评分的歌曲
-        song_scores = defaultdict(float)
-        sim_sums = defaultdict(float)
-        
-        for other_id, sim in sorted_users[:20]:  # 只考虑前20个最相似的用户
-            for song_id, rating in self.user_ratings[other_id].items():
-                if song_id in user_songs:
-                    continue  # 跳过用户已评分的歌曲
-                
-                song_scores[song_id] += sim * rating
-                sim_sums[song_id] += abs(sim)
-        
-        # 计算加权评分
-        recommendations = []
-        for song_id, score in song_scores.items():
-            if sim_sums[song_id] > 0:
-                recommendations.append((song_id, score / sim_sums[song_id]))
-        
-        # 排序并返回前N个推荐
-        recommendations.sort(key=lambda x: x[1], reverse=True)
-        return recommendations[:top_n]
+        return recommendations
     
     def get_popular_songs(self, top_n=10):
         """获取热门歌曲
         
-        根据评分次数和平均评分获取热门歌曲
+        根据评分次数和平均评分获取热门歌曲，结果来自加载时构建、随新评分增量更新的排行榜
         
         Args:
             top_n: 返回的歌曲数量
@@ -297,41 +576,20 @@ class MusicRecommender:
         Returns:
             热门歌曲列表
         """
-        if self.interactions_df is None or self.songs_df is None:
+        if self.popularity is None or self.songs_df is None:
             return self._get_default_sample_songs(top_n)
         
         try:
-            # 计算每首歌曲的评分次数和平均评分
-            song_stats = self.interactions_df.groupby('song_id').agg({
-                'rating': ['count', 'mean']
-            })
-            song_stats.columns = ['rating_count', 'avg_rating']
-            song_stats.reset_index(inplace=True)
+            # 从预排序的排行榜读取前N首歌曲 (热门度 = 评分数 * 平均评分，至少3次评分)
+            top_songs = self.popularity.top(top_n)
             
-            # 只考虑至少有3次评分的歌曲
-            song_stats = song_stats[song_stats['rating_count'] >= 3]
-            
-            # 计算热门度分数 (评分数 * 平均评分)
-            song_stats['popularity'] = song_stats['rating_count'] * song_stats['avg_rating']
-            
-            # 排序并获取前N首歌曲
-            top_songs = song_stats.sort_values('popularity', ascending=False).head(top_n)
-            
-            # 获取完整歌曲信息
+            # 批量获取完整歌曲信息
             result = []
-            for _, row in top_songs.iterrows():
-                song_info = self.songs_df[self.songs_df['song_id'] == row['song_id']]
-                if not song_info.empty:
-                    song_data = song_info.iloc[0].to_dict()
-                    song_data['score'] = row['popularity']
-                    song_data['explanation'] = f"热门歌曲，评分次数: {row['rating_count']:.0f}, 平均评分: {row['avg_rating']:.1f}"
-                    
-                    # 确保兼容前端展示所需的字段
-                    if 'track_name' in song_data and 'title' not in song_data:
-                        song_data['title'] = song_data['track_name']
-                    if 'artist_name' in song_data and 'artist' not in song_data:
-                        song_data['artist'] = song_data['artist_name']
-                    
+            song_records = self.catalog.lookup_many([song_id for song_id, _, _, _ in top_songs])
+            for song_data, (_, popularity, rating_count, avg_rating) in zip(song_records, top_songs):
+                if song_data is not None:
+                    song_data['score'] = popularity
+                    song_data['explanation'] = f"热门歌曲，评分次数: {rating_count:.0f}, 平均评分: {avg_rating:.1f}"
                     result.append(song_data)
             
             # 如果热门歌曲不足，返回样本歌曲补充
@@ -510,7 +768,7 @@ class MusicRecommender:
     def get_similar_songs(self, song_id, top_n=5):
         """获取相似歌曲
         
-        基于相同艺术家和流派的简单相似歌曲推荐
+        依次使用离线构建的歌曲近邻索引和歌曲向量索引，都不可用时基于相同艺术家和流派推荐
         
         Args:
             song_id: 歌曲ID
@@ -522,14 +780,26 @@ class MusicRecommender:
         if self.songs_df is None:
             return []
         
+        # 优先使用离线近邻索引
+        if self.item_neighbors is not None and song_id in self.item_neighbors:
+            similar_songs = self._get_indexed_similar_songs(song_id, top_n)
+            if similar_songs:
+                return similar_songs
+        
+        if self.ann_index is not None and song_id in self.ann_index:
+            try:
+                similar_songs = self._build_song_results(self.ann_index.similar(song_id, top_n), "与这首歌风格相近")
+                if similar_songs:
+                    return similar_songs
+            except Exception as e:
+                logger.error(f"查询向量索引时出错: {str(e)}")
+        
         try:
             # 获取目标歌曲信息
-            song_info = self.songs_df[self.songs_df['song_id'] == song_id]
-            if song_info.empty:
+            target_song = self.catalog.lookup(song_id)
+            if target_song is None:
                 return []
             
-            target_song = song_info.iloc[0]
-            
             # 根据相同艺术家和流派查找相似歌曲
             similar_by_artist = self.songs_df[
                 (self.songs_df['artist_name'] == target_song['artist_name']) & 
@@ -547,27 +817,17 @@ class MusicRecommender:
             
             # 添加同一艺术家的歌曲
             if len(similar_by_artist) > 0:
-                for _, song in similar_by_artist.sample(min(len(similar_by_artist), top_n)).iterrows():
-                    song_data = song.to_dict()
-                    song_data['explanation'] = f"来自相同艺术家: {song['artist_name']}"
-                    # 确保兼容前端展示所需的字段
-                    if 'track_name' in song_data and 'title' not in song_data:
-                        song_data['title'] = song_data['track_name']
-                    if 'artist_name' in song_data and 'artist' not in song_data:
-                        song_data['artist'] = song_data['artist_name']
+                selected = similar_by_artist.sample(min(len(similar_by_artist), top_n))
+                for song_data in self.catalog.lookup_many(selected['song_id']):
+                    song_data['explanation'] = f"来自相同艺术家: {song_data['artist_name']}"
                     similar_songs.append(song_data)
             
             # 如果相似歌曲不足，添加相同流派的歌曲
             if len(similar_songs) < top_n and len(similar_by_genre) > 0:
                 remaining = top_n - len(similar_songs)
-                for _, song in similar_by_genre.sample(min(len(similar_by_genre), remaining)).iterrows():
-                    song_data = song.to_dict()
-                    song_data['explanation'] = f"相同音乐风格: {song['genre']}"
-                    # 确保兼容前端展示所需的字段
-                    if 'track_name' in song_data and 'title' not in song_data:
-                        song_data['title'] = song_data['track_name']
-                    if 'artist_name' in song_data and 'artist' not in song_data:
-                        song_data['artist'] = song_data['artist_name']
+                selected = similar_by_genre.sample(min(len(similar_by_genre), remaining))
+                for song_data in self.catalog.lookup_many(selected['song_id']):
+                    song_data['explanation'] = f"相同音乐风格: {song_data['genre']}"
                     similar_songs.append(song_data)
             
             # 如果仍然不足，添加随机歌曲
@@ -578,14 +838,8 @@ class MusicRecommender:
                     (~self.songs_df['song_id'].isin([s['song_id'] for s in similar_songs]))
                 ].sample(min(len(self.songs_df), remaining))
                 
-                for _, song in random_songs.iterrows():
-                    song_data = song.to_dict()
+                for song_data in self.catalog.lookup_many(random_songs['song_id']):
                     song_data['explanation'] = "您可能也会喜欢这首歌"
-                    # 确保兼容前端展示所需的字段
-                    if 'track_name' in song_data and 'title' not in song_data:
-                        song_data['title'] = song_data['track_name']
-                    if 'artist_name' in song_data and 'artist' not in song_data:
-                        song_data['artist'] = song_data['artist_name']
                     similar_songs.append(song_data)
             
             return similar_songs
@@ -594,6 +848,32 @@ class MusicRecommender:
             logger.error(f"获取相似歌曲时出错: {str(e)}")
             return []
     
+    def _get_indexed_similar_songs(self, song_id, top_n=5):
+        """从近邻索引获取相似歌曲
+        
+        Args:
+            song_id: 歌曲ID
+            top_n: 返回的相似歌曲数量
+            
+        Returns:
+            相似歌曲列表，按相似度降序
+        """
+        neighbors = self.item_neighbors.lookup(song_id, top_n)
+        if not neighbors:
+            return []
+        
+        neighbor_ids, scores = zip(*neighbors)
+        
+        similar_songs = []
+        for song_data, score in zip(self.catalog.lookup_many(neighbor_ids), scores):
+            if song_data is None:
+                continue
+            song_data['score'] = score
+            song_data['explanation'] = "喜欢这首歌的用户也常听"
+            similar_songs.append(song_data)
+        
+        return similar_songs
+    
     def get_recommendations_by_emotion(self, emotion, top_n=5):
         """根据情绪推荐歌曲
         
@@ -635,14 +915,8 @@ class MusicRecommender:
             result = []
             selected_songs = matching_songs.sample(min(len(matching_songs), top_n))
             
-            for _, song in selected_songs.iterrows():
-                song_data = song.to_dict()
-                song_data['explanation'] = f"适合{emotion}情绪的{song['genre']}歌曲"
-                # 确保兼容前端展示所需的字段
-                if 'track_name' in song_data and 'title' not in song_data:
-                    song_data['title'] = song_data['track_name']
-                if 'artist_name' in song_data and 'artist' not in song_data:
-                    song_data['artist'] = song_data['artist_name']
+            for song_data in self.catalog.lookup_many(selected_songs['song_id']):
+                song_data['explanation'] = f"适合{emotion}情绪的{song_data['genre']}歌曲"
                 result.append(song_data)
             
             return result
@@ -654,9 +928,10 @@ class MusicRecommender:
     # 在这里添加必要的其他方法，以确保与原始API兼容
     
     def get_super_hybrid_recommendations(self, user_id, top_n=10):
-        """获取混合推荐 - 简化版
+        """获取超级混合推荐
         
-        仅使用基础协同过滤，没有实现复杂算法
+        在混合推荐的基础上加入SVD++、NCF、MLP模型，按各自权重混合，
+        不可用的模型自动跳过
         
         Args:
             user_id: 用户ID
@@ -665,13 +940,22 @@ class MusicRecommender:
         Returns:
             推荐歌曲列表
         """
-        # 直接调用普通推荐方法
-        return self.get_recommendations(user_id, top_n)
+        # SVD++可用时与基于用户的协同过滤平分协同过滤权重
+        cf_weight = self.cf_weight / 2 if self.svdpp_scorer is not None else self.cf_weight
+        weights = {
+            'cf': cf_weight,
+            'svdpp': cf_weight,
+            'content': self.content_weight,
+            'ncf': self.ncf_weight,
+            'mlp': self.mlp_weight,
+        }
+        return self._get_ranked_recommendations(user_id, top_n, weights)
     
     def get_svdpp_recommendations(self, user_id, top_n=10):
-        """获取SVD++推荐 - 简化版
+        """获取SVD++推荐
         
-        由于SVD++模型尚未实现，返回普通推荐
+        用启动时提取的因子矩阵对召回的候选打分排序。
+        模型不可用或用户不在模型中时返回普通推荐
         
         Args:
             user_id: 用户ID
@@ -680,13 +964,31 @@ class MusicRecommender:
         Returns:
             推荐歌曲列表
         """
-        # 直接调用普通推荐方法
-        return self.get_recommendations(user_id, top_n)
+        return self._get_model_recommendations('svdpp', self.svdpp_fold_in, user_id, top_n)
+    
+    def _get_model_recommendations(self, name, scorer, user_id, top_n=10):
+        """只用单个模型打分器对召回的候选排序
+        
+        Args:
+            name: 打分器名称
+            scorer: FoldInScorer或NeuralScorer，为None时返回普通推荐
+            user_id: 用户ID
+            top_n: 推荐数量
+            
+        Returns:
+            推荐歌曲列表
+        """
+        known = scorer is not None and (
+            scorer.has_user(user_id) if isinstance(scorer, FoldInScorer) else scorer.user_code(user_id) >= 0)
+        if not known:
+            return self.get_recommendations(user_id, top_n)
+        return self._get_ranked_recommendations(user_id, top_n, {name: 1.0})
     
     def get_ncf_recommendations(self, user_id, top_n=10):
-        """获取神经协同过滤推荐 - 简化版
+        """获取神经协同过滤推荐
         
-        由于NCF模型尚未实现，返回普通推荐
+        使用导出的NCF权重以NumPy前向计算对召回的候选打分排序，
+        权重不可用或用户不在模型中时返回普通推荐
         
         Args:
             user_id: 用户ID
@@ -695,13 +997,13 @@ class MusicRecommender:
         Returns:
             推荐歌曲列表
         """
-        # 直接调用普通推荐方法
-        return self.get_recommendations(user_id, top_n)
+        return self._get_model_recommendations('ncf', self.ncf_scorer, user_id, top_n)
     
     def get_mlp_recommendations(self, user_id, top_n=10):
-        """获取多层感知机推荐 - 简化版
+        """获取多层感知机推荐
         
-        由于MLP模型尚未实现，返回普通推荐
+        使用导出的MLP权重以NumPy前向计算对召回的候选打分排序，
+        权重不可用或用户不在模型中时返回普通推荐
         
         Args:
             user_id: 用户ID
@@ -710,8 +1012,7 @@ class MusicRecommender:
         Returns:
             推荐歌曲列表
         """
-        # 直接调用普通推荐方法
-        return self.get_recommendations(user_id, top_n)
+        return self._get_model_recommendations('mlp', self.mlp_scorer, user_id, top_n)
     
     def get_cf_recommendations(self, user_id, top_n=10):
         """获取协同过滤推荐
@@ -726,9 +1027,9 @@ class MusicRecommender:
         return self.get_recommendations(user_id, top_n)
     
     def get_content_recommendations(self, user_id, top_n=10):
-        """获取基于内容的推荐 - 简化版
+        """获取基于内容的推荐
         
-        由于内容模型尚未实现，返回普通推荐
+        聚合用户评过分的歌曲在近邻索引或向量索引中的相似歌曲，都不可用时返回普通推荐
         
         Args:
             user_id: 用户ID
@@ -737,13 +1038,169 @@ class MusicRecommender:
         Returns:
             推荐歌曲列表
         """
-        # 直接调用普通推荐方法
-        return self.get_recommendations(user_id, top_n)
+        scored_songs = self._get_content_candidates(user_id, top_n * 2)
+        if not scored_songs:
+            return self.get_recommendations(user_id, top_n)
+        
+        result = self._build_song_results(scored_songs, "与您喜欢的歌曲相似")[:top_n]
+        return result or self.get_recommendations(user_id, top_n)
+    
+    def _content_profile(self, user_id):
+        """用户的内容聚合结果
+        
+        近邻索引可用时聚合历史歌曲的近邻分数；近邻索引不可用或没有聚合出候选时，
+        计算评分加权的歌曲向量。结果按 (用户, 评分矩阵快照版本) 缓存，
+        同一请求的召回和排序只计算一次，用户有新评分时快照版本变化，自动重新计算。
+        
+        Returns:
+            (用户评分字典, 近邻聚合结果或None, 向量画像或None)
+        """
+        snapshot = self.rating_matrix.snapshot()
+        key = (user_id, snapshot.version)
+        with self._content_lock:
+            if key in self._content_profiles:
+                self._content_profiles.move_to_end(key)
+                return self._content_profiles[key]
+        
+        user_ratings = snapshot.get_user_ratings(user_id)
+        song_ids, ratings = list(user_ratings), list(user_ratings.values())
+        aggregate, profile = None, None
+        if user_ratings and self.item_neighbors is not None:
+            aggregate = self.item_neighbors.aggregate_history(song_ids, ratings)
+        if user_ratings and self.ann_index is not None and (aggregate is None or not len(aggregate[0])):
+            profile = self.ann_index.profile(song_ids, ratings)
+        
+        result = (user_ratings, aggregate, profile)
+        with self._content_lock:
+            self._content_profiles[key] = result
+            if len(self._content_profiles) > self.content_cache_size:
+                self._content_profiles.popitem(last=False)
+        return result
+    
+    def _get_content_candidates(self, user_id, n):
+        """内容候选
+        
+        优先聚合近邻索引中的相似歌曲，近邻索引不可用时用评分加权的
+        歌曲向量查询向量索引；都不可用时返回None
+        """
+        user_ratings, aggregate, profile = self._content_profile(user_id)
+        if not user_ratings:
+            return None
+        
+        if aggregate is not None:
+            candidates = self.item_neighbors.recommend_from_history(
+                list(user_ratings), list(user_ratings.values()), n, aggregate=aggregate)
+            if candidates:
+                return candidates
+        
+        if profile is not None:
+            return self.ann_index.query(profile, n, exclude_ids=list(user_ratings))
+        return None
+    
+    def _get_artist_candidates(self, user_id, n, max_artists=5):
+        """召回用户评分最高的几位艺术家的其他歌曲"""
+        user_ratings = self.rating_matrix.get_user_ratings(user_id)
+        if not user_ratings:
+            return None
+        
+        favorite_songs = sorted(user_ratings.items(), key=lambda x: x[1], reverse=True)
+        artists = []
+        for song_data in self.catalog.lookup_many(song_id for song_id, _ in favorite_songs):
+            artist = song_data.get('artist') if song_data is not None else None
+            if artist and artist not in artists:
+                artists.append(artist)
+                if len(artists) >= max_artists:
+                    break
+        
+        candidates = []
+        for rank, artist in enumerate(artists):
+            candidates.extend((song_id, float(max_artists - rank)) for song_id in self.catalog.artist_songs(artist))
+        return candidates[:n]
+    
+    def _get_popular_candidates(self, user_id, n):
+        """召回热门歌曲"""
+        return [(song_id, popularity) for song_id, popularity, _, _ in self.popularity.top(n)]
+    
+    def _filter_rated_songs(self, user_id, song_ids):
+        """过滤用户已评分的歌曲"""
+        return ~pd.Series(song_ids, dtype=object).isin(self.rating_matrix.get_user_ratings(user_id)).to_numpy()
+    
+    def _filter_unknown_songs(self, user_id, song_ids):
+        """过滤不在歌曲目录中的歌曲"""
+        return self.catalog.positions(song_ids) >= 0
+    
+    def _score_content(self, user_id, song_ids):
+        """排序阶段的内容打分，近邻索引和向量索引都不可用时返回None"""
+        user_ratings, aggregate, profile = self._content_profile(user_id)
+        if self.item_neighbors is not None:
+            if aggregate is None:
+                return np.full(len(song_ids), np.nan)
+            return self.item_neighbors.score_items(
+                list(user_ratings), list(user_ratings.values()), song_ids, aggregate=aggregate)
+        if self.ann_index is not None:
+            return self.ann_index.score_items(profile, song_ids)
+        return None
+    
+    def _get_rank_scorers(self, weights):
+        """排序阶段的打分器列表
+        
+        Args:
+            weights: {打分器名称: 权重}
+            
+        Returns:
+            [(名称, 权重, 打分函数), ...]，不可用的模型不在列表中
+        """
+        score_fns = {
+            'cf': lambda user_id, song_ids: self.cf_engine.score_items(user_id, song_ids),
+            'content': self._score_content,
+        }
+        # 因子模型使用折叠打分器，新用户也能得到分数
+        for name, scorer in (('svdpp', self.svdpp_fold_in), ('ncf', self.ncf_scorer), ('mlp', self.mlp_scorer)):
+            if scorer is not None:
+                score_fns[name] = scorer.score_items
+        return [(name, weight, score_fns[name]) for name, weight in weights.items() if name in score_fns]
+    
+    def _get_ranked_recommendations(self, user_id, top_n, weights):
+        """两阶段推荐: 召回候选后按打分器加权排序
+        
+        Args:
+            user_id: 用户ID
+            top_n: 推荐数量
+            weights: {打分器名称: 权重}
+            
+        Returns:
+            推荐歌曲列表
+        """
+        if user_id not in self.user_ratings:
+            return self.get_popular_songs(top_n)
+        
+        song_ids, retrieval_sources = self.retriever.retrieve(user_id)
+        ranked = self.hybrid_blender.blend(user_id, song_ids, self._get_rank_scorers(weights), top_n)
+        if not ranked:
+            # 没有打分器可用时按召回顺序返回
+            ranked = [(song_id, 0.0, []) for song_id in song_ids[:top_n]]
+        if not ranked:
+            return self.get_recommendations(user_id, top_n)
+        
+        source_of = dict(zip(song_ids, retrieval_sources))
+        result = []
+        song_records = self.catalog.lookup_many([song_id for song_id, _, _ in ranked])
+        for song_data, (song_id, score, scorers) in zip(song_records, ranked):
+            song_data['score'] = score
+            if len(scorers) == 1:
+                song_data['explanation'] = f"基于{SOURCE_LABELS[scorers[0]]}为您推荐"
+            elif scorers:
+                song_data['explanation'] = f"综合{'、'.join(SOURCE_LABELS[name] for name in scorers)}为您推荐"
+            else:
+                song_data['explanation'] = RETRIEVAL_EXPLANATIONS[source_of[song_id]]
+            result.append(song_data)
+        
+        return result
     
     def get_hybrid_recommendations(self, user_id, top_n=10):
-        """获取混合推荐 - 简化版
+        """获取混合推荐
         
-        混合了协同过滤和基于内容的推荐结果，由于高级模型尚未实现，返回普通推荐
+        按 cf_weight 和 content_weight 混合协同过滤与基于内容的推荐
         
         Args:
             user_id: 用户ID
@@ -752,9 +1209,7 @@ class MusicRecommender:
         Returns:
             推荐歌曲列表
         """
-        # 在完整实现中，这里应该是协同过滤和基于内容的推荐结果的加权混合
-        # 简化版中直接调用普通推荐方法
-        return self.get_recommendations(user_id, top_n)
+        return self._get_ranked_recommendations(user_id, top_n, {'cf': self.cf_weight, 'content': self.content_weight})
 
     def get_recommendations_by_artist(self, artist_name, top_n=5):
         """获取指定艺术家的歌曲推荐
@@ -781,14 +1236,8 @@ class MusicRecommender:
             result = []
             selected_songs = artist_songs.sample(min(len(artist_songs), top_n))
             
-            for _, song in selected_songs.iterrows():
-                song_data = song.to_dict()
+            for song_data in self.catalog.lookup_many(selected_songs['song_id']):
                 song_data['explanation'] = f"{artist_name}的歌曲"
-                # 确保兼容前端展示所需的字段
-                if 'track_name' in song_data and 'title' not in song_data:
-                    song_data['title'] = song_data['track_name']
-                if 'artist_name' in song_data and 'artist' not in song_data:
-                    song_data['artist'] = song_data['artist_name']
                 result.append(song_data)
             
             return result
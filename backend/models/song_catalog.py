@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+歌曲元数据目录
+
+以哈希索引将 song_id 映射到行号，并按列保存歌曲元数据，
+一次 lookup_many 调用即可批量生成前端展示所需的歌曲字典，
+代价只与查询的歌曲数量有关，不再对 songs_df 做整列比较。
+"""
+
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class SongCatalog:
+    """歌曲元数据目录
+
+    同一song_id出现多次时以第一行为准，与原先 iloc[0] 的取法一致。
+    """
+
+    def __init__(self, songs_df):
+        """初始化歌曲目录
+
+        Args:
+            songs_df: 歌曲元数据DataFrame，必须包含song_id列
+        """
+        songs_df = songs_df.drop_duplicates(subset='song_id', keep='first')
+        self.song_index = pd.Index(songs_df['song_id'])
+
+        # 按列保存为Python原生类型，生成的字典可直接序列化为JSON
+        self.columns = list(songs_df.columns)
+        self._values = {col: songs_df[col].tolist() for col in self.columns}
+
+        # 确保兼容前端展示所需的字段
+        if 'track_name' in self._values and 'title' not in self._values:
+            self.columns.append('title')
+            self._values['title'] = self._values['track_name']
+        if 'artist_name' in self._values and 'artist' not in self._values:
+            self.columns.append('artist')
+            self._values['artist'] = self._values['artist_name']
+
+        self._artist_positions = None  # 艺术家 -> 行号数组，首次查询时构建
+
+        logger.info(f"构建歌曲目录: {len(self.song_index)}首歌曲")
+
+    def __len__(self):
+        return len(self.song_index)
+
+    def __contains__(self, song_id):
+        return song_id in self.song_index
+
+    def positions(self, song_ids):
+        """批量获取歌曲所在行号
+
+        Args:
+            song_ids: 歌曲ID序列
+
+        Returns:
+            行号数组，不存在的歌曲为-1
+        """
+        return self.song_index.get_indexer(list(song_ids))
+
+    def record(self, position):
+        """按行号生成歌曲字典
+
+        Args:
+            position: 行号
+
+        Returns:
+            包含全部元数据列以及title/artist字段的字典
+        """
+        return {col: self._values[col][position] for col in self.columns}
+
+    def lookup(self, song_id):
+        """查询单首歌曲
+
+        Args:
+            song_id: 歌曲ID
+
+        Returns:
+            歌曲字典，不存在时返回None
+        """
+        return self.lookup_many([song_id])[0]
+
+    def lookup_many(self, song_ids):
+        """批量查询歌曲
+
+        Args:
+            song_ids: 歌曲ID序列
+
+        Returns:
+            与输入顺序一致的歌曲字典列表，不存在的歌曲对应None
+        """
+        return [self.record(pos) if pos >= 0 else None for pos in self.positions(song_ids)]
+
+    def artist_songs(self, artist_name):
+        """获取某位艺术家的全部歌曲ID
+
+        Args:
+            artist_name: 艺术家名称
+
+        Returns:
+            歌曲ID列表，按目录顺序，艺术家不存在时返回空列表
+        """
+        if 'artist' not in self._values:
+            return []
+        if self._artist_positions is None:
+            self._artist_positions = pd.Series(self._values['artist']).groupby(
+                self._values['artist'], sort=False).indices
+        positions = self._artist_positions.get(artist_name, [])
+        return self.song_index[positions].tolist()
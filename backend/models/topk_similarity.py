@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分块Top-K余弦相似度
+
+对稀疏(TF-IDF)或稠密(PCA)特征矩阵按行分块计算余弦相似度，每块只保留
+每首歌曲最相似的K首，结果为 (歌曲数, K) 的 int32 近邻位置与 float32 分数。
+内存占用由分块大小决定，不再生成 N×N 的稠密相似度矩阵；分块在进程池中并行计算。
+"""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+# 进程池中每个工作进程持有的特征矩阵
+_worker_features = None
+
+# 分块的最少行数，避免曲库很大时按64MB切出大量极小的分块
+MIN_BLOCK_ROWS = 256
+
+
+def normalize_rows(features):
+    """把特征矩阵按行归一化为单位长度，点积即余弦相似度
+
+    Args:
+        features: scipy稀疏矩阵或numpy数组
+
+    Returns:
+        float32的CSR矩阵或numpy数组
+    """
+    if sp.issparse(features):
+        features = sp.csr_matrix(features, dtype=np.float32)
+        norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.diags(1.0 / norms).dot(features).astype(np.float32).tocsr()
+
+    features = np.asarray(features, dtype=np.float32)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return features / norms
+
+
+def topk_from_block(block_scores, row_offset, k):
+    """对一个相似度分块取每行Top-K
+
+    Args:
+        block_scores: 稠密相似度分块，形状为 (分块行数, 歌曲数)
+        row_offset: 分块首行在全体歌曲中的位置，用于排除自身
+        k: 每行保留的近邻数
+
+    Returns:
+        (近邻位置 int32数组, 相似度 float32数组)，形状均为 (分块行数, k)，
+        不足K个正相似度的位置用-1填充
+    """
+    n_rows, n_cols = block_scores.shape
+    rows = np.arange(n_rows)
+    block_scores[rows, rows + row_offset] = 0
+
+    k_eff = min(k, n_cols)
+    top = np.argpartition(-block_scores, k_eff - 1, axis=1)[:, :k_eff]
+    top_scores = np.take_along_axis(block_scores, top, axis=1)
+
+    # 分数降序，同分按位置升序，保证结果确定
+    order = np.lexsort((top, -top_scores), axis=1)
+    top = np.take_along_axis(top, order, axis=1).astype(np.int32)
+    top_scores = np.take_along_axis(top_scores, order, axis=1).astype(np.float32)
+    top[top_scores <= 0] = -1
+    top_scores[top_scores <= 0] = 0
+
+    if k_eff < k:
+        top = np.pad(top, ((0, 0), (0, k - k_eff)), constant_values=-1)
+        top_scores = np.pad(top_scores, ((0, 0), (0, k - k_eff)))
+    return top, top_scores
+
+
+def _block_topk(features, start, end, k):
+    """计算一个行分块的Top-K"""
+    block = features[start:end] @ features.T
+    if sp.issparse(block):
+        block = block.toarray()
+    return topk_from_block(np.asarray(block, dtype=np.float32), start, k)
+
+
+def _init_worker(features):
+    """工作进程初始化，只传输一次特征矩阵"""
+    global _worker_features
+    _worker_features = features
+
+
+def _worker_block_topk(args):
+    """在工作进程中计算一个行分块"""
+    start, end, k = args
+    return start, _block_topk(_worker_features, start, end, k)
+
+
+def topk_similarity(features, k=50, block_size=None, n_jobs=None, normalize=True):
+    """计算每行与其它行的Top-K余弦相似度
+
+    Args:
+        features: 特征矩阵(scipy稀疏矩阵或numpy数组)，每行对应一首歌曲
+        k: 每首歌曲保留的近邻数
+        block_size: 每个分块的行数，默认使分块约占64MB，但不少于 MIN_BLOCK_ROWS 行
+        n_jobs: 并行进程数，默认为CPU核数，为1时在当前进程中计算
+        normalize: 是否先按行归一化，已归一化的特征可传入False
+
+    Returns:
+        (近邻位置 int32数组, 相似度 float32数组)，形状均为 (歌曲数, k)
+    """
+    if normalize:
+        features = normalize_rows(features)
+    elif sp.issparse(features):
+        features = sp.csr_matrix(features, dtype=np.float32)
+
+    n_rows = features.shape[0]
+    if block_size is None:
+        block_size = max(MIN_BLOCK_ROWS, (64 << 20) // (4 * max(n_rows, 1)))
+    blocks = [(start, min(start + block_size, n_rows), k) for start in range(0, n_rows, block_size)]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(blocks))
+
+    neighbors = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.zeros((n_rows, k), dtype=np.float32)
+
+    if n_jobs <= 1:
+        for start, end, _ in blocks:
+            neighbors[start:end], scores[start:end] = _block_topk(features, start, end, k)
+    else:
+        # 每个进程一次领取若干连续分块，减少任务调度和结果回传的次数
+        chunksize = max(1, len(blocks) // (4 * n_jobs))
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(features,)) as executor:
+            for start, (block_neighbors, block_scores) in executor.map(_worker_block_topk, blocks,
+                                                                        chunksize=chunksize):
+                neighbors[start:start + len(block_neighbors)] = block_neighbors
+                scores[start:start + len(block_scores)] = block_scores
+
+    logger.info(f"Top-K相似度计算完成: {n_rows}行, 每行{k}个近邻, {len(blocks)}个分块, {n_jobs}个进程")
+    return neighbors, scores
+
+
+def save_topk_similarity(output_dir, name, song_ids, neighbors, scores):
+    """保存Top-K相似度，可用 np.load(mmap_mode='r') 内存映射读取
+
+    Args:
+        output_dir: 输出目录
+        name: 文件名前缀，如 'song_similarity'
+        song_ids: 行位置对应的歌曲ID
+        neighbors: 近邻位置数组
+        scores: 相似度数组
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, f'{name}_song_ids.npy'), np.asarray(song_ids, dtype=str))
+    np.save(os.path.join(output_dir, f'{name}_neighbors.npy'), np.ascontiguousarray(neighbors, dtype=np.int32))
+    np.save(os.path.join(output_dir, f'{name}_scores.npy'), np.ascontiguousarray(scores, dtype=np.float32))
+    logger.info(f"Top-K相似度已保存至: {output_dir} ({name}_*.npy)")
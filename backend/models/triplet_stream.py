@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+MSD播放记录(train_triplets.txt)的流式解析
+
+按固定行数分块读取 "user_id\\tsong_id\\tplay_count" 文本，一次遍历完成
+用户采样、按元数据歌曲集合过滤和ID编码: 歌曲编码为元数据中的行号，
+用户编码按首次出现的顺序递增分配。每块只保留三列整数数组，可以直接
+写成列式分块文件，峰值内存由分块大小决定，不再构建嵌套字典和逐行记录。
+
+处理完整数据集时可按字节范围把文件切成若干分片，在进程池中并行解析，
+再合并各分片的用户字典和播放次数直方图，由合并后的直方图计算全局分位数阈值。
+"""
+
+import io
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .columnar_store import load_table, save_table
+
+logger = logging.getLogger(__name__)
+
+# 文件中的列
+TRIPLET_COLUMNS = ['user_id', 'song_id', 'play_count']
+
+
+class UserIdEncoder:
+    """按首次出现顺序分配用户编码
+
+    设置了 max_users 时只接纳前 max_users 个、且首次出现在前 admit_before 行
+    以内的用户，与旧实现"从前100万行中取前N个用户"的采样规则一致。
+    """
+
+    def __init__(self, max_users=None, admit_before=None):
+        """初始化编码器
+
+        Args:
+            max_users: 最多接纳的用户数，为None时接纳全部用户
+            admit_before: 只接纳首次出现在该行号之前的用户
+        """
+        self.max_users = max_users
+        self.admit_before = admit_before
+        self.user_ids = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def encode(self, uniques, first_lines):
+        """编码一个分块中出现的用户
+
+        Args:
+            uniques: 分块内按出现顺序去重的用户ID
+            first_lines: 每个用户在文件中首次出现的行号
+
+        Returns:
+            int32编码数组，未被采样接纳的用户为-1
+        """
+        codes = np.empty(len(uniques), dtype=np.int32)
+        for i, (user_id, line) in enumerate(zip(uniques, first_lines)):
+            code = self._codes.get(user_id)
+            if code is None:
+                if self.max_users is not None and (
+                        len(self.user_ids) >= self.max_users
+                        or (self.admit_before is not None and line >= self.admit_before)):
+                    code = -1
+                else:
+                    code = len(self.user_ids)
+                    self.user_ids.append(user_id)
+                self._codes[user_id] = code
+            codes[i] = code
+        return codes
+
+
+class TripletStreamParser:
+    """播放记录流式解析器"""
+
+    def __init__(self, song_ids, sample_size=None, sample_window=1000000, chunk_size=1000000):
+        """初始化解析器
+
+        Args:
+            song_ids: 元数据中的歌曲ID，不在其中的播放记录被过滤，歌曲编码为其位置
+            sample_size: 采样的用户数，为None时保留全部用户
+            sample_window: 采样用户只从文件的前若干行中选取
+            chunk_size: 每次读取的行数
+        """
+        self.song_index = pd.Index(pd.unique(np.asarray(song_ids, dtype=object)))
+        self.chunk_size = chunk_size
+        self.users = UserIdEncoder(max_users=sample_size, admit_before=sample_window if sample_size else None)
+        self.n_lines = 0
+        self.n_kept = 0
+
+    def chunks(self, source):
+        """逐块解析播放记录
+
+        Args:
+            source: 文件路径或已打开的文本/二进制文件对象
+
+        Yields:
+            (用户编码 int32数组, 歌曲编码 int32数组, 播放次数 int32数组)，只含保留的记录
+        """
+        reader = pd.read_csv(
+            source,
+            sep='\t',
+            header=None,
+            names=TRIPLET_COLUMNS,
+            dtype={'user_id': str, 'song_id': str, 'play_count': np.int32},
+            chunksize=self.chunk_size,
+        )
+        for chunk in reader:
+            start = self.n_lines
+            self.n_lines += len(chunk)
+
+            user_codes, uniques = pd.factorize(chunk['user_id'])
+            _, first_rows = np.unique(user_codes, return_index=True)
+            user_codes = self.users.encode(uniques, start + first_rows)[user_codes]
+            song_codes = self.song_index.get_indexer(chunk['song_id']).astype(np.int32)
+
+            keep = (user_codes >= 0) & (song_codes >= 0)
+            self.n_kept += int(keep.sum())
+            yield user_codes[keep], song_codes[keep], chunk['play_count'].to_numpy()[keep]
+
+            logger.info(f"已处理 {self.n_lines} 行，保留 {self.n_kept} 条记录，{len(self.users)} 个用户")
+
+    def to_frame(self, source):
+        """解析全部播放记录为DataFrame
+
+        同一用户对同一歌曲的重复记录以最后一条为准。
+
+        Args:
+            source: 文件路径或文件对象
+
+        Returns:
+            DataFrame，user_id/song_id为category类型，另有int32的play_count列
+        """
+        parts = list(self.chunks(source))
+        user_codes = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0, dtype=np.int32)
+        song_codes = np.concatenate([p[1] for p in parts]) if parts else np.zeros(0, dtype=np.int32)
+        play_counts = np.concatenate([p[2] for p in parts]) if parts else np.zeros(0, dtype=np.int32)
+        return codes_to_frame(user_codes, song_codes, play_counts, self.users.user_ids, self.song_index)
+
+    def write_chunks(self, source, output_dir, fmt='parquet'):
+        """解析播放记录并逐块写入列式文件
+
+        每块写为 output_dir/part-XXXXX，列为 user_code、song_code、play_count；
+        全部读完后写入 user_ids 与 song_ids 两张编码字典表。
+
+        Args:
+            source: 文件路径或文件对象
+            output_dir: 输出目录
+            fmt: 列式格式，'parquet' 或 'feather'
+
+        Returns:
+            写入的分块数
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        n_parts = 0
+        for user_codes, song_codes, play_counts in self.chunks(source):
+            part = pd.DataFrame({'user_code': user_codes, 'song_code': song_codes, 'play_count': play_counts})
+            save_table(part, output_dir, f'part-{n_parts:05d}', fmt=fmt)
+            n_parts += 1
+
+        save_table(pd.DataFrame({'user_id': self.users.user_ids}), output_dir, 'user_ids', fmt=fmt, compact=False)
+        save_table(pd.DataFrame({'song_id': self.song_index}), output_dir, 'song_ids', fmt=fmt, compact=False)
+        logger.info(f"播放记录已写入 {output_dir}: {n_parts}个分块, {self.n_kept}条记录")
+        return n_parts
+
+
+def codes_to_frame(user_codes, song_codes, play_counts, user_ids, song_ids):
+    """把编码数组还原为以category类型保存ID的DataFrame
+
+    Args:
+        user_codes: 用户编码数组
+        song_codes: 歌曲编码数组
+        play_counts: 播放次数数组
+        user_ids: 用户编码对应的ID
+        song_ids: 歌曲编码对应的ID
+
+    Returns:
+        包含 user_id、song_id、play_count 列的DataFrame，重复的用户-歌曲对只保留最后一条
+    """
+    df = pd.DataFrame({
+        'user_id': pd.Categorical.from_codes(user_codes, categories=pd.Index(user_ids)),
+        'song_id': pd.Categorical.from_codes(song_codes, categories=pd.Index(song_ids)),
+        'play_count': np.asarray(play_counts, dtype=np.int32),
+    })
+    pairs = np.asarray(user_codes, dtype=np.int64) * len(song_ids) + np.asarray(song_codes, dtype=np.int64)
+    duplicated = pd.Series(pairs).duplicated(keep='last').to_numpy()
+    if duplicated.any():
+        df = df[~duplicated].reset_index(drop=True)
+    return df
+
+
+def load_triplet_chunks(output_dir):
+    """读取 TripletStreamParser.write_chunks 写入的分块
+
+    Args:
+        output_dir: 分块目录
+
+    Returns:
+        与 TripletStreamParser.to_frame 格式相同的DataFrame，目录中没有分块时返回None
+    """
+    user_ids = load_table(output_dir, 'user_ids')
+    song_ids = load_table(output_dir, 'song_ids')
+    if user_ids is None or song_ids is None:
+        return None
+
+    parts = []
+    n_parts = 0
+    while True:
+        part = load_table(output_dir, f'part-{n_parts:05d}')
+        if part is None:
+            break
+        parts.append(part)
+        n_parts += 1
+    if not parts:
+        return None
+
+    data = pd.concat(parts, ignore_index=True)
+    return codes_to_frame(data['user_code'].to_numpy(), data['song_code'].to_numpy(),
+                          data['play_count'].to_numpy(), user_ids['user_id'], song_ids['song_id'])
+
+
+class _ByteRangeFile(io.RawIOBase):
+    """只读取文件中 [start, end) 字节范围的文件对象"""
+
+    def __init__(self, path, start, end):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def split_byte_ranges(path, n_shards):
+    """按字节把文件切成若干分片，分片边界对齐到行首
+
+    Args:
+        path: 文件路径
+        n_shards: 分片数
+
+    Returns:
+        [(起始字节, 结束字节), ...]
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, n_shards):
+            f.seek(max(size * i // n_shards, boundaries[-1]))
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+
+# 进程池中每个工作进程持有的歌曲ID
+_worker_song_ids = None
+
+
+def _init_shard_worker(song_ids):
+    """工作进程初始化，只传输一次歌曲ID"""
+    global _worker_song_ids
+    _worker_song_ids = song_ids
+
+
+def _parse_shard(args):
+    """解析一个字节范围分片
+
+    Returns:
+        (分片用户ID列表, 用户编码, 歌曲编码, 播放次数, 播放次数直方图, 行数)
+    """
+    path, start, end, chunk_size = args
+    parser = TripletStreamParser(_worker_song_ids, chunk_size=chunk_size)
+    with io.BufferedReader(_ByteRangeFile(path, start, end), buffer_size=1 << 20) as source:
+        parts = list(parser.chunks(source))
+
+    if parts:
+        user_codes, song_codes, play_counts = (np.concatenate(columns) for columns in zip(*parts))
+    else:
+        user_codes = song_codes = play_counts = np.zeros(0, dtype=np.int32)
+    histogram = np.bincount(play_counts) if len(play_counts) else np.zeros(1, dtype=np.int64)
+    return parser.users.user_ids, user_codes, song_codes, play_counts, histogram, parser.n_lines
+
+
+def merge_histograms(histograms):
+    """合并播放次数直方图(长度可以不同)"""
+    merged = np.zeros(max(len(h) for h in histograms), dtype=np.int64)
+    for histogram in histograms:
+        merged[:len(histogram)] += histogram
+    return merged
+
+
+def histogram_quantiles(histogram, quantiles):
+    """由直方图计算分位数，与 np.quantile 的线性插值结果一致
+
+    Args:
+        histogram: 直方图，下标为取值，值为出现次数
+        quantiles: 分位点序列，取值在[0, 1]
+
+    Returns:
+        float64分位数数组
+    """
+    counts = np.cumsum(histogram)
+    total = counts[-1]
+    positions = np.asarray(quantiles, dtype=np.float64) * (total - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, total - 1)
+    # 排序后第i个元素的取值为第一个累计次数大于i的下标
+    lower_values = np.searchsorted(counts, lower, side='right')
+    upper_values = np.searchsorted(counts, upper, side='right')
+    return lower_values + (upper_values - lower_values) * (positions - lower)
+
+
+def quantize_play_counts(play_counts, edges):
+    """按分位数阈值把播放次数映射为1..len(edges)-1的评分
+
+    与 pd.qcut 的区间一致(左开右闭，最低一档包含最小值)，阈值重复时对应的
+    空区间被跳过，不会像 pd.qcut 那样报错。
+
+    Args:
+        play_counts: 播放次数数组
+        edges: 分位数阈值，包含最小值和最大值
+
+    Returns:
+        int8评分数组
+    """
+    inner = np.asarray(edges, dtype=np.float64)[1:-1]
+    return (np.searchsorted(inner, play_counts, side='left') + 1).astype(np.int8)
+
+
+def parse_triplets_sharded(path, song_ids, n_workers=None, chunk_size=1000000):
+    """按字节范围分片并行解析完整的播放记录文件
+
+    用户编码按全文件首次出现的顺序分配，与单进程的 TripletStreamParser 结果一致。
+
+    Args:
+        path: 播放记录文件路径
+        song_ids: 元数据中的歌曲ID
+        n_workers: 并行进程数，默认为CPU核数，为1时在当前进程中解析
+        chunk_size: 每个分片内每次读取的行数
+
+    Returns:
+        (用户ID列表, 用户编码, 歌曲编码, 播放次数, 合并后的播放次数直方图, 歌曲索引)
+    """
+    song_index = pd.Index(pd.unique(np.asarray(song_ids, dtype=object)))
+    n_workers = n_workers or os.cpu_count() or 1
+    shards = [(path, start, end, chunk_size) for start, end in split_byte_ranges(path, n_workers)]
+
+    if len(shards) <= 1:
+        _init_shard_worker(song_index)
+        results = [_parse_shard(shard) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_shard_worker,
+                                 initargs=(song_index,)) as executor:
+            results = list(executor.map(_parse_shard, shards))
+
+    # 合并用户字典: 按分片顺序拼接后去重，跨分片边界的用户保留首次出现的编码
+    all_users = [user_id for result in results for user_id in result[0]]
+    user_index = pd.Index(pd.unique(np.asarray(all_users, dtype=object)))
+    user_codes = []
+    for users, codes, *_ in results:
+        remap = user_index.get_indexer(users).astype(np.int32)
+        user_codes.append(remap[codes] if len(users) else codes)
+
+    user_codes = np.concatenate(user_codes) if results else np.zeros(0, dtype=np.int32)
+    song_codes = np.concatenate([result[2] for result in results]) if results else np.zeros(0, dtype=np.int32)
+    play_counts = np.concatenate([result[3] for result in results]) if results else np.zeros(0, dtype=np.int32)
+    histogram = merge_histograms([result[4] for result in results]) if results else np.zeros(1, dtype=np.int64)
+
+    n_lines = sum(result[5] for result in results)
+    logger.info(f"分片解析完成: {len(shards)}个分片, {n_lines}行, 保留{len(play_counts)}条记录, "
+                f"{len(user_index)}个用户")
+    return list(user_index), user_codes, song_codes, play_counts, histogram, song_index
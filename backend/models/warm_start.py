@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量(热启动)训练
+
+每次训练结束时在产物根目录的 WATERMARK.json 中记录该模型训练到的交互数据水位线
+(最大时间戳和行数)。热启动时只取水位线之后新增的交互: 沿用上次的因子或权重，
+新用户/新歌曲追加随机初始化的向量(ID字典只追加，已有编码不变)，
+在新增交互上训练少量轮次，不必每晚在全量数据上从头训练。
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def new_interactions(interactions_df, watermark):
+    """取水位线之后新增的交互
+
+    Args:
+        interactions_df: 当前的全部交互数据
+        watermark: 上次训练记录的水位线，None表示没有记录
+
+    Returns:
+        新增交互的DataFrame；没有水位线时返回None，表示需要全量训练
+    """
+    if not watermark:
+        return None
+    return interactions_df[new_interactions_mask(interactions_df, watermark)]
+
+
+def new_interactions_mask(interactions_df, watermark, start=0):
+    """判断每条交互是否在水位线之后，可以对整张表逐块调用
+
+    Args:
+        interactions_df: 交互数据或整张交互表中的一块
+        watermark: 上次训练记录的水位线
+        start: 这一块在整张表中的起始行号
+
+    Returns:
+        布尔数组
+    """
+    if watermark.get('timestamp') is not None and 'timestamp' in interactions_df.columns:
+        timestamps = pd.to_numeric(interactions_df['timestamp'], errors='coerce')
+        return (timestamps > watermark['timestamp']).to_numpy()
+    # 没有时间戳时，交互表按追加顺序保存，取上次行数之后的部分
+    return np.arange(start, start + len(interactions_df)) >= int(watermark.get('rows', 0))
+
+
+def extend_rows(matrix, n_rows, init_std=0.1, rng=None):
+    """把矩阵扩展到 n_rows 行，新增行按正态分布随机初始化
+
+    Args:
+        matrix: 原矩阵(因子或嵌入)，一维数组(偏置)的新增项为0
+        n_rows: 扩展后的行数
+        init_std: 新增行的标准差
+        rng: numpy随机数生成器
+
+    Returns:
+        扩展后的float32数组
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n_new = n_rows - matrix.shape[0]
+    if n_new <= 0:
+        return np.array(matrix)
+    if matrix.ndim == 1:
+        extra = np.zeros(n_new, dtype=np.float32)
+    else:
+        rng = rng or np.random.default_rng()
+        extra = (rng.standard_normal((n_new,) + matrix.shape[1:]) * init_std).astype(np.float32)
+    return np.concatenate([matrix, extra])
+
+
+def warm_start_factors(factors, interactions_df, n_epochs=3, lr=0.005, reg=0.02,
+                       batch_size=1024, init_std=0.1, seed=42):
+    """在新增交互上继续训练潜在因子模型
+
+    沿用 FactorScorer 因子字典(SVD的 pu/qi/bu/bi，SVD++已折叠隐式项的用户向量)，
+    新用户和新歌曲追加到末尾，按小批量SGD更新与训练时相同的带偏置目标
+    (r - mu - bu - bi - pu·qi)^2 + reg * (|pu|^2 + |qi|^2 + bu^2 + bi^2)。
+
+    Args:
+        factors: 上次训练的因子字典
+        interactions_df: 新增交互，包含user_id、song_id、rating列
+        n_epochs: 训练轮数
+        lr: 学习率
+        reg: 正则化系数
+        batch_size: 每个小批量的交互数
+        init_std: 新用户/新歌曲向量的初始化标准差
+        seed: 随机种子
+
+    Returns:
+        更新后的因子字典
+    """
+    rng = np.random.default_rng(seed)
+    user_index = pd.Index(np.asarray(factors['user_ids'], dtype=str))
+    item_index = pd.Index(np.asarray(factors['item_ids'], dtype=str))
+
+    users = interactions_df['user_id'].astype(str).to_numpy(dtype=object)
+    items = interactions_df['song_id'].astype(str).to_numpy(dtype=object)
+    new_users = pd.unique(users[~pd.Index(users).isin(user_index)])
+    new_items = pd.unique(items[~pd.Index(items).isin(item_index)])
+    user_index = user_index.append(pd.Index(new_users))
+    item_index = item_index.append(pd.Index(new_items))
+
+    user_factors = extend_rows(factors['user_factors'], len(user_index), init_std, rng)
+    item_factors = extend_rows(factors['item_factors'], len(item_index), init_std, rng)
+    user_bias = extend_rows(factors['user_bias'], len(user_index))
+    item_bias = extend_rows(factors['item_bias'], len(item_index))
+    global_mean = float(factors['global_mean'])
+
+    user_codes = user_index.get_indexer(users)
+    item_codes = item_index.get_indexer(items)
+    ratings = interactions_df['rating'].to_numpy(dtype=np.float32)
+    biased = bool(np.any(user_bias) or np.any(item_bias) or global_mean)
+
+    for epoch in range(n_epochs):
+        order = rng.permutation(len(ratings))
+        squared_error = 0.0
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            u, i = user_codes[batch], item_codes[batch]
+            pu, qi = user_factors[u], item_factors[i]
+            err = ratings[batch] - (global_mean + user_bias[u] + item_bias[i] + np.einsum('ij,ij->i', pu, qi))
+            squared_error += float(np.dot(err, err))
+
+            # 同一批中重复出现的用户/歌曲，梯度用 np.add.at 累加
+            if biased:
+                np.add.at(user_bias, u, lr * (err - reg * user_bias[u]))
+                np.add.at(item_bias, i, lr * (err - reg * item_bias[i]))
+            np.add.at(user_factors, u, lr * (err[:, None] * qi - reg * pu))
+            np.add.at(item_factors, i, lr * (err[:, None] * pu - reg * qi))
+        logger.info(f"热启动第{epoch + 1}/{n_epochs}轮, 训练RMSE: {np.sqrt(squared_error / max(len(ratings), 1)):.4f}")
+
+    logger.info(f"热启动完成: {len(ratings)}条新增交互, 新用户{len(new_users)}个, 新歌曲{len(new_items)}首")
+    return {
+        'user_factors': user_factors,
+        'item_factors': item_factors,
+        'user_bias': user_bias,
+        'item_bias': item_bias,
+        'global_mean': np.float32(global_mean),
+        'user_ids': np.asarray(user_index, dtype=str),
+        'item_ids': np.asarray(item_index, dtype=str),
+    }
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线构建歌曲向量的近似最近邻索引
+
+从内容模型或SVD/NCF/MLP的歌曲嵌入构建索引，保存在模型目录中，
+并以精确搜索为基准报告Recall@K。
+
+用法：
+python build_ann_index.py --model_dir processed_data --source content --backend ivf --nprobe 8
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+# 添加父级目录到路径，以便导入项目模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.ann_index import EMBEDDING_SOURCES, build_ann_index, load_item_embeddings, recall_at_k
+
+# 配置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='构建歌曲向量索引')
+    parser.add_argument('--model_dir', type=str, default='processed_data', help='模型目录')
+    parser.add_argument('--output_dir', type=str, default=None, help='索引输出目录，默认与模型目录相同')
+    parser.add_argument('--source', type=str, default='content', choices=EMBEDDING_SOURCES, help='向量来源')
+    parser.add_argument('--backend', type=str, default='ivf', choices=['ivf', 'faiss', 'brute'], help='索引后端')
+    parser.add_argument('--n_lists', type=int, default=None, help='IVF簇数，默认约为sqrt(歌曲数)')
+    parser.add_argument('--nprobe', type=int, default=8, help='IVF每次查询扫描的簇数')
+    parser.add_argument('--recall_k', type=int, default=10, help='评估Recall@K的K')
+    parser.add_argument('--recall_queries', type=int, default=1000, help='评估使用的查询数')
+    args = parser.parse_args()
+
+    embeddings = load_item_embeddings(args.model_dir, args.source)
+    if embeddings is None:
+        logger.error(f"在 {args.model_dir} 中找不到{args.source}向量")
+        return False
+    song_ids, vectors = embeddings
+
+    start_time = time.time()
+    kwargs = {'n_lists': args.n_lists, 'nprobe': args.nprobe} if args.backend == 'ivf' else {}
+    index = build_ann_index(song_ids, vectors, backend=args.backend, **kwargs)
+    logger.info(f"索引构建完成，用时: {time.time() - start_time:.2f}秒")
+
+    start_time = time.time()
+    recall = recall_at_k(index, k=args.recall_k, n_queries=args.recall_queries)
+    logger.info(f"Recall@{args.recall_k}: {recall:.4f} (评估用时: {time.time() - start_time:.2f}秒)")
+    index.meta[f'recall@{args.recall_k}'] = recall
+
+    index.save(args.output_dir or args.model_dir, args.source)
+    return True
+
+if __name__ == "__main__":
+    main()
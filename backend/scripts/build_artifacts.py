@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线生成推荐服务的产物版本
+
+读取数据目录中的 songs 与 user_song_interactions 数据表，连同已有的
+SVD++/SVD因子和NCF/MLP导出权重，写成 data_dir/artifacts 下的一个新版本。
+推荐引擎启动时以内存映射方式打开 CURRENT 指向的版本。
+
+指定 --db_path 时同时收录SQLite中用户的评分，并记录已包含的变更日志位置，
+推荐服务启动后的评分同步从该位置继续，不必重放整张评分表。
+
+用法：
+python build_artifacts.py --data_dir processed_data --keep 3 --db_path ../music_recommender.db
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import pandas as pd
+
+# 添加父级目录到路径，以便导入项目模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.artifact_store import write_recommender_artifacts
+from models.columnar_store import load_table
+from models.factor_scorer import FactorScorer
+from models.rating_ingestor import ARTIFACT_WATERMARK_KEY, load_sqlite_ratings
+
+# 配置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='生成推荐服务产物版本')
+    parser.add_argument('--data_dir', type=str, default='processed_data', help='数据目录')
+    parser.add_argument('--version', type=str, default=None, help='版本名，默认使用当前时间')
+    parser.add_argument('--keep', type=int, default=3, help='保留的历史版本数')
+    parser.add_argument('--db_path', type=str, default=None, help='SQLite数据库路径，指定时收录用户评分')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    songs_df = load_table(args.data_dir, 'songs')
+    interactions_df = load_table(args.data_dir, 'user_song_interactions')
+    if songs_df is None or interactions_df is None:
+        logger.error(f"在 {args.data_dir} 中找不到 songs 或 user_song_interactions 数据表")
+        return False
+
+    logger.info(f"加载了 {len(songs_df)} 首歌曲和 {len(interactions_df)} 条交互记录")
+
+    metadata = {}
+    if args.db_path:
+        ratings_df, change_id = load_sqlite_ratings(args.db_path)
+        interactions_df = pd.concat([interactions_df, ratings_df], ignore_index=True)
+        metadata[ARTIFACT_WATERMARK_KEY] = change_id
+        logger.info(f"收录了 {len(ratings_df)} 条SQLite评分，变更日志位置: {change_id}")
+
+    # 从Surprise模型提取因子并写入 *_factors.npz 缓存，以便收录进产物
+    for name in ('svdpp', 'cf'):
+        try:
+            FactorScorer.load(args.data_dir, name)
+        except Exception as e:
+            logger.error(f"提取{name}因子时出错: {str(e)}")
+
+    version_dir = write_recommender_artifacts(args.data_dir, songs_df, interactions_df,
+                                              version=args.version, keep=args.keep, metadata=metadata)
+    logger.info(f"产物生成完成: {version_dir}，用时: {time.time() - start_time:.2f}秒")
+    return True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线构建歌曲近邻索引
+
+根据 songs 与 user_song_interactions 数据表计算每首歌曲的Top-K相似歌曲，
+结果保存在数据目录中，推荐引擎启动时以内存映射方式加载。
+
+用法：
+python build_item_neighbors.py --data_dir processed_data --k 50 --content_weight 0.2
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+# 添加父级目录到路径，以便导入项目模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.item_neighbors import build_item_neighbors, save_item_neighbors
+from models.columnar_store import load_table
+
+# 配置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='构建歌曲近邻索引')
+    parser.add_argument('--data_dir', type=str, default='processed_data', help='数据目录')
+    parser.add_argument('--output_dir', type=str, default=None, help='索引输出目录，默认与数据目录相同')
+    parser.add_argument('--k', type=int, default=50, help='每首歌曲保留的近邻数')
+    parser.add_argument('--content_weight', type=float, default=0.2, help='TF-IDF文本相似度权重(0-1)')
+    parser.add_argument('--n_jobs', type=int, default=None, help='并行进程数，默认为CPU核数')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    songs_df = load_table(args.data_dir, 'songs')
+    if songs_df is None:
+        logger.error(f"歌曲元数据文件不存在: {args.data_dir}")
+        return False
+
+    interactions_df = load_table(args.data_dir, 'user_song_interactions', columns=['user_id', 'song_id'])
+    if interactions_df is None:
+        logger.warning(f"交互数据文件不存在，只使用文本特征: {args.data_dir}")
+
+    song_ids, neighbors, scores = build_item_neighbors(
+        songs_df,
+        interactions_df,
+        k=args.k,
+        content_weight=args.content_weight,
+        n_jobs=args.n_jobs
+    )
+    save_item_neighbors(args.output_dir or args.data_dir, song_ids, neighbors, scores)
+
+    logger.info(f"近邻索引构建完成，用时: {time.time() - start_time:.2f}秒")
+    return True
+
+if __name__ == "__main__":
+    main()
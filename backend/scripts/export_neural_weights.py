@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+导出NCF/MLP模型权重
+
+读取训练脚本保存的 {model}_model.h5 与 {model}_model_config.json，
+导出为推荐引擎可直接加载的 {model}_weights.npz。只有本脚本需要TensorFlow，
+在线服务只依赖NumPy。
+
+用法：
+python export_neural_weights.py --model_dir processed_data --model ncf mlp
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+# 添加父级目录到路径，以便导入项目模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.neural_scorer import export_keras_model
+
+# 配置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='导出NCF/MLP模型权重')
+    parser.add_argument('--model_dir', type=str, default='processed_data', help='模型目录')
+    parser.add_argument('--output_dir', type=str, default=None, help='输出目录，默认与模型目录相同')
+    parser.add_argument('--data_dir', type=str, default=None, help='共享ID字典所在的数据目录，默认与模型目录相同')
+    parser.add_argument('--model', type=str, nargs='+', default=['ncf', 'mlp'], help='要导出的模型')
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+
+    output_dir = args.output_dir or args.model_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    success = True
+    for name in args.model:
+        model_path = os.path.join(args.model_dir, f'{name}_model.h5')
+        config_path = os.path.join(args.model_dir, f'{name}_model_config.json')
+        if not os.path.exists(model_path) or not os.path.exists(config_path):
+            logger.error(f"找不到{name}模型或配置文件: {model_path}")
+            success = False
+            continue
+
+        with open(config_path, 'r') as f:
+            model_config = json.load(f)
+        model = load_model(model_path, compile=False)
+        export_keras_model(model, model_config, os.path.join(output_dir, f'{name}_weights.npz'),
+                           model_dir=args.data_dir or args.model_dir)
+
+    return success
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+以播放次数训练隐式反馈ALS模型
+
+读取数据目录中的 user_song_plays 播放记录表(plays 或 play_count 列)，
+训练置信度加权的ALS模型，因子以 als_factors.npz 保存在数据目录中，
+推荐引擎和 build_artifacts.py 按与SVD++因子相同的格式加载。
+
+用法：
+python train_implicit_als.py --data_dir processed_data --factors 64 --iterations 15 --workers 8
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+# 添加父级目录到路径，以便导入项目模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.implicit_als import ImplicitALS, plays_matrix
+from models.columnar_store import load_table
+
+# 配置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 播放次数可能使用的列名(data_processing.py 为 plays，msd_processing.py 为 play_count)
+PLAYS_COLUMNS = ('plays', 'play_count')
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='训练隐式反馈ALS模型')
+    parser.add_argument('--data_dir', type=str, default='processed_data', help='数据目录')
+    parser.add_argument('--table', type=str, default='user_song_plays', help='播放记录表名')
+    parser.add_argument('--name', type=str, default='als', help='模型名称，输出 {name}_factors.npz')
+    parser.add_argument('--factors', type=int, default=64, help='潜在因子数')
+    parser.add_argument('--regularization', type=float, default=0.01, help='L2正则化系数')
+    parser.add_argument('--alpha', type=float, default=40.0, help='置信度系数')
+    parser.add_argument('--epsilon', type=float, default=None, help='设置时置信度使用对数缩放')
+    parser.add_argument('--iterations', type=int, default=15, help='交替迭代轮数')
+    parser.add_argument('--cg_steps', type=int, default=3, help='每轮共轭梯度步数')
+    parser.add_argument('--workers', type=int, default=None, help='线程数，默认为CPU核数')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    plays_df = load_table(args.data_dir, args.table)
+    if plays_df is None:
+        logger.error(f"在 {args.data_dir} 中找不到 {args.table} 数据表")
+        return False
+
+    plays_col = next((col for col in PLAYS_COLUMNS if col in plays_df.columns), None)
+    if plays_col is None:
+        logger.error(f"{args.table} 表中没有播放次数列: {PLAYS_COLUMNS}")
+        return False
+
+    plays, user_ids, song_ids = plays_matrix(plays_df, plays_col=plays_col)
+    del plays_df
+
+    model = ImplicitALS(
+        n_factors=args.factors,
+        regularization=args.regularization,
+        alpha=args.alpha,
+        epsilon=args.epsilon,
+        iterations=args.iterations,
+        cg_steps=args.cg_steps,
+        n_workers=args.workers
+    ).fit(plays)
+    model.save(os.path.join(args.data_dir, f'{args.name}_factors.npz'), user_ids, song_ids)
+
+    logger.info(f"ALS模型训练完成，用时: {time.time() - start_time:.2f}秒")
+    return True
+
+if __name__ == "__main__":
+    main()
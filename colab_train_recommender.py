@@ -16,6 +16,7 @@ import os
 import sys
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import pickle
 import logging
 import tensorflow as tf
@@ -30,6 +31,66 @@ from surprise.model_selection import cross_validate
 import matplotlib.pyplot as plt
 from datetime import datetime
 
+try:
+    from backend.models.id_dictionary import IdDictionary, USER_DICTIONARY, SONG_DICTIONARY
+except ImportError:
+    # 单独在Colab中运行时没有项目代码，使用同样文件格式的精简实现
+    USER_DICTIONARY = 'user'
+    SONG_DICTIONARY = 'song'
+
+    class IdDictionary:
+        """追加式的ID字典，与 backend/models/id_dictionary.py 保存相同的 {name}_ids.npy / {name}_order.npy"""
+
+        def __init__(self, ids=None, order=None):
+            self.ids = np.asarray(ids if ids is not None else np.array([], dtype='U1')).astype(str)
+            self._order = np.asarray(np.argsort(self.ids, kind='stable') if order is None else order, dtype=np.int64)
+
+        @classmethod
+        def from_ids(cls, values):
+            return cls(pd.unique(np.asarray(values).astype(str)))
+
+        @classmethod
+        def load_and_extend(cls, directory, name, values):
+            dictionary = cls.load(directory, name)
+            if dictionary is None:
+                dictionary = cls.from_ids(values)
+            else:
+                dictionary.add(values)
+            dictionary.save(directory, name)
+            return dictionary
+
+        def __len__(self):
+            return len(self.ids)
+
+        def encode(self, values):
+            values = np.asarray(values).astype(str)
+            if len(self) == 0:
+                return np.full(len(values), -1, dtype=np.int64)
+            positions = np.searchsorted(self.ids, values, sorter=self._order)
+            codes = self._order[np.minimum(positions, len(self) - 1)]
+            return np.where(self.ids[codes] == values, codes, -1)
+
+        def add(self, values):
+            values = np.asarray(values).astype(str)
+            new_ids = pd.unique(values[self.encode(values) < 0])
+            if len(new_ids):
+                self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=str)])
+                self._order = np.argsort(self.ids, kind='stable')
+            return len(new_ids)
+
+        def save(self, directory, name):
+            os.makedirs(directory, exist_ok=True)
+            np.save(os.path.join(directory, f'{name}_ids.npy'), self.ids)
+            np.save(os.path.join(directory, f'{name}_order.npy'), self._order)
+
+        @classmethod
+        def load(cls, directory, name):
+            ids_path = os.path.join(directory, f'{name}_ids.npy')
+            order_path = os.path.join(directory, f'{name}_order.npy')
+            if not (os.path.exists(ids_path) and os.path.exists(order_path)):
+                return None
+            return cls(np.load(ids_path), np.load(order_path))
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -100,11 +161,11 @@ class MusicRecommenderTrainer:
         self.ncf_model = None
         self.mlp_model = None
         
-        # 模型映射
-        self.user_mapping = {}
-        self.item_mapping = {}
-        self.reverse_user_mapping = {}
-        self.reverse_item_mapping = {}
+        # 用户/歌曲ID字典
+        self.user_ids = IdDictionary()
+        self.item_ids = IdDictionary()
+        self.user_codes = None  # 评分数据每行的用户编码
+        self.item_codes = None  # 评分数据每行的歌曲编码
         
         logger.info("初始化音乐推荐系统训练器")
         logger.info(f"混合策略权重: 内容({content_weight}) CF({cf_weight}) NCF({ncf_weight}) MLP({mlp_weight})")
@@ -250,30 +311,40 @@ class MusicRecommenderTrainer:
         logger.info(f"创建了示例数据: {n_users}个用户, {n_songs}首歌曲, {n_ratings}条评分")
     
     def _create_mappings(self):
-        """创建用户和歌曲ID的映射"""
-        unique_users = self.ratings_df["user_id"].unique()
-        unique_items = self.ratings_df["song_id"].unique()
+        """加载数据目录中共享的用户/歌曲ID字典并追加新ID，然后编码评分数据
         
-        self.user_mapping = {user: i for i, user in enumerate(unique_users)}
-        self.item_mapping = {item: i for i, item in enumerate(unique_items)}
-        self.reverse_user_mapping = {i: user for user, i in self.user_mapping.items()}
-        self.reverse_item_mapping = {i: item for item, i in self.item_mapping.items()}
+        字典与项目的数据处理、训练脚本和在线服务使用同样的名称和文件格式，已有编码不变
+        """
+        self.user_ids = IdDictionary.load_and_extend(self.data_path, USER_DICTIONARY, self.ratings_df["user_id"])
+        self.item_ids = IdDictionary.load_and_extend(self.data_path, SONG_DICTIONARY, self.ratings_df["song_id"])
+        self.user_codes = self.user_ids.encode(self.ratings_df["user_id"])
+        self.item_codes = self.item_ids.encode(self.ratings_df["song_id"])
         
-        logger.info(f"创建了映射: {len(self.user_mapping)}个用户, {len(self.item_mapping)}首歌曲")
+        logger.info(f"创建了映射: {len(self.user_ids)}个用户, {len(self.item_ids)}首歌曲")
     
     def _create_user_item_matrix(self):
-        """创建用户-物品交互矩阵"""
-        n_users = len(self.user_mapping)
-        n_items = len(self.item_mapping)
+        """创建用户-物品交互矩阵
         
-        self.user_item_matrix = np.zeros((n_users, n_items))
-        
-        for _, row in self.ratings_df.iterrows():
-            user_idx = self.user_mapping[row["user_id"]]
-            item_idx = self.item_mapping[row["song_id"]]
-            self.user_item_matrix[user_idx, item_idx] = row["rating"]
+        以CSR稀疏矩阵保存，内存只与评分数量成正比。同一用户对同一歌曲的
+        重复评分以最后一条为准。
+        """
+        n_users = len(self.user_ids)
+        n_items = len(self.item_ids)
+        
+        codes = pd.DataFrame({
+            "user": self.user_codes,
+            "item": self.item_codes,
+            "rating": self.ratings_df["rating"].to_numpy(dtype=np.float32)
+        }).drop_duplicates(subset=["user", "item"], keep="last")
+        
+        self.user_item_matrix = sp.csr_matrix(
+            (codes["rating"].values, (codes["user"].values, codes["item"].values)),
+            shape=(n_users, n_items),
+            dtype=np.float32
+        )
+        self.user_item_matrix.sort_indices()
         
-        logger.info(f"创建了用户-物品矩阵: 形状{self.user_item_matrix.shape}")
+        logger.info(f"创建了用户-物品矩阵: 形状{self.user_item_matrix.shape}, 非零评分{self.user_item_matrix.nnz}")
     
     def train_svdpp_model(self, n_factors=100, n_epochs=20, lr_all=0.005, reg_all=0.02):
         """训练SVD++模型
@@ -321,14 +392,14 @@ class MusicRecommenderTrainer:
         
         # 准备训练数据
         X_train = pd.DataFrame({
-            "user": self.ratings_df["user_id"].map(self.user_mapping),
-            "item": self.ratings_df["song_id"].map(self.item_mapping),
+            "user": self.user_codes,
+            "item": self.item_codes,
         })
         y_train = self.ratings_df["rating"].values
         
         # 构建NCF模型
-        n_users = len(self.user_mapping)
-        n_items = len(self.item_mapping)
+        n_users = len(self.user_ids)
+        n_items = len(self.item_ids)
         
         # 用户嵌入
         user_input = Input(shape=(1,), name="user_input")
@@ -375,15 +446,6 @@ class MusicRecommenderTrainer:
         # 保存模型
         self.ncf_model.save(f"{self.model_path}ncf_model.h5")
         
-        # 保存映射
-        with open(f"{self.model_path}user_item_mappings.pkl", 'wb') as f:
-            pickle.dump({
-                "user_mapping": self.user_mapping,
-                "item_mapping": self.item_mapping,
-                "reverse_user_mapping": self.reverse_user_mapping,
-                "reverse_item_mapping": self.reverse_item_mapping
-            }, f)
-        
         logger.info(f"NCF模型已保存至 {self.model_path}ncf_model.h5")
         
         # 绘制损失曲线
@@ -410,14 +472,14 @@ class MusicRecommenderTrainer:
         
         # 准备训练数据
         X_train = pd.DataFrame({
-            "user": self.ratings_df["user_id"].map(self.user_mapping),
-            "item": self.ratings_df["song_id"].map(self.item_mapping),
+            "user": self.user_codes,
+            "item": self.item_codes,
         })
         y_train = self.ratings_df["rating"].values
         
         # 构建MLP模型
-        n_users = len(self.user_mapping)
-        n_items = len(self.item_mapping)
+        n_users = len(self.user_ids)
+        n_items = len(self.item_ids)
         
         # 用户嵌入
         user_input = Input(shape=(1,), name="user_input")
@@ -486,19 +548,33 @@ class MusicRecommenderTrainer:
         with open(f"{self.model_path}user_item_matrix.pkl", 'wb') as f:
             pickle.dump({
                 "matrix": self.user_item_matrix,
-                "user_mapping": self.user_mapping,
-                "item_mapping": self.item_mapping,
-                "reverse_user_mapping": self.reverse_user_mapping,
-                "reverse_item_mapping": self.reverse_item_mapping,
+                "user_ids": self.user_ids.ids,
+                "item_ids": self.item_ids.ids,
                 "algorithm": algorithm
             }, f)
         
         logger.info(f"协同过滤模型已保存至 {self.model_path}user_item_matrix.pkl")
     
-    def visualize_user_item_matrix(self):
-        """可视化用户-物品矩阵"""
+    def visualize_user_item_matrix(self, max_bins=500):
+        """可视化用户-物品矩阵
+        
+        矩阵按 max_bins × max_bins 的网格分块，每格显示块内非零评分的平均值，
+        不需要把稀疏矩阵展开为稠密矩阵
+        
+        Args:
+            max_bins: 每个方向的最大格数，矩阵较小时每格对应一个元素
+        """
+        coo = self.user_item_matrix.tocoo()
+        n_users, n_items = coo.shape
+        bins = [min(n_users, max_bins), min(n_items, max_bins)]
+        value_range = [[0, n_users], [0, n_items]]
+        
+        rating_sums, _, _ = np.histogram2d(coo.row, coo.col, bins=bins, range=value_range, weights=coo.data)
+        counts, _, _ = np.histogram2d(coo.row, coo.col, bins=bins, range=value_range)
+        mean_ratings = np.divide(rating_sums, counts, out=np.zeros_like(rating_sums), where=counts > 0)
+        
         plt.figure(figsize=(12, 10))
-        plt.imshow(self.user_item_matrix, cmap='viridis')
+        plt.imshow(mean_ratings, cmap='viridis', aspect='auto', extent=[0, n_items, n_users, 0])
         plt.colorbar(label='评分')
         plt.title('用户-歌曲交互矩阵')
         plt.xlabel('歌曲ID (索引)')
@@ -510,16 +586,17 @@ class MusicRecommenderTrainer:
     
     def analyze_data(self):
         """分析数据集特征"""
-        if self.ratings_df is None:
+        if self.user_item_matrix is None:
             logger.warning("无法分析数据：数据未加载")
             return
         
         logger.info("分析数据集...")
         
-        # 基本统计信息
-        n_users = len(self.ratings_df["user_id"].unique())
-        n_items = len(self.ratings_df["song_id"].unique())
-        n_ratings = len(self.ratings_df)
+        # 基本统计信息，直接从稀疏矩阵计算
+        matrix = self.user_item_matrix
+        n_users, n_items = matrix.shape
+        n_ratings = matrix.nnz
+        user_activity = np.diff(matrix.indptr)
         
         density = n_ratings / (n_users * n_items) * 100
         
@@ -532,7 +609,7 @@ class MusicRecommenderTrainer:
         plt.figure(figsize=(12, 6))
         
         plt.subplot(1, 2, 1)
-        self.ratings_df["rating"].hist(bins=20)
+        plt.hist(matrix.data, bins=20)
         plt.title('评分分布')
         plt.xlabel('评分')
         plt.ylabel('频率')
@@ -540,7 +617,7 @@ class MusicRecommenderTrainer:
         
         # 用户活跃度分布
         plt.subplot(1, 2, 2)
-        self.ratings_df["user_id"].value_counts().hist(bins=20)
+        plt.hist(user_activity, bins=20)
         plt.title('用户活跃度分布')
         plt.xlabel('评分数量')
         plt.ylabel('用户数')
@@ -558,8 +635,8 @@ class MusicRecommenderTrainer:
             "n_items": n_items,
             "n_ratings": n_ratings,
             "density": density,
-            "rating_mean": self.ratings_df["rating"].mean(),
-            "rating_std": self.ratings_df["rating"].std(),
+            "rating_mean": float(matrix.data.mean()) if n_ratings else 0.0,
+            "rating_std": float(matrix.data.std(ddof=1)) if n_ratings > 1 else 0.0,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
@@ -575,10 +652,13 @@ class MusicRecommenderTrainer:
             "cf_weight": self.cf_weight,
             "ncf_weight": self.ncf_weight,
             "mlp_weight": self.mlp_weight,
-            "n_users": len(self.user_mapping) if self.user_mapping else 0,
-            "n_items": len(self.item_mapping) if self.item_mapping else 0,
+            "n_users": len(self.user_ids),
+            "n_items": len(self.item_ids),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "mappings_path": f"{self.model_path}user_item_mappings.pkl",
+            "mappings": {
+                "user": f"{self.data_path}{USER_DICTIONARY}_ids.npy",
+                "song": f"{self.data_path}{SONG_DICTIONARY}_ids.npy"
+            },
             "models": {
                 "svdpp": f"{self.model_path}svdpp_model.pkl",
                 "ncf": f"{self.model_path}ncf_model.h5",
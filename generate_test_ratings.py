@@ -13,6 +13,8 @@ from datetime import datetime
 import argparse
 import logging
 
+from backend.models.columnar_store import find_table, read_table_file, save_table
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO, 
@@ -54,14 +56,14 @@ def create_test_users(db_path, num_users=5):
 
 def load_songs(processed_data_dir):
     """加载歌曲元数据"""
-    songs_metadata_path = os.path.join(processed_data_dir, 'songs_metadata.pkl')
+    songs_metadata_path = find_table(processed_data_dir, 'songs_metadata')
     
-    if not os.path.exists(songs_metadata_path):
-        logger.error(f"歌曲元数据文件不存在: {songs_metadata_path}")
+    if songs_metadata_path is None:
+        logger.error(f"歌曲元数据文件不存在: {processed_data_dir}")
         return None
     
     try:
-        songs_metadata = pd.read_pickle(songs_metadata_path)
+        songs_metadata = read_table_file(songs_metadata_path)
         logger.info(f"已加载 {len(songs_metadata)} 首歌曲")
         return songs_metadata
     except Exception as e:
@@ -137,8 +139,7 @@ def generate_ratings(db_path, user_ids, songs_metadata, ratings_per_user=20):
         user_song_plays['plays'] = user_song_plays['rating'] * 2
         
         # 保存到processed_data目录
-        output_path = os.path.join('processed_data', 'user_song_plays.pkl')
-        user_song_plays.to_pickle(output_path)
+        output_path = save_table(user_song_plays, 'processed_data', 'user_song_plays')
         logger.info(f"已将 {len(user_song_plays)} 条用户评分数据保存到 {output_path}")
     
     return True
@@ -17,6 +17,20 @@ import logging
 import argparse
 from collections import defaultdict
 
+# 项目模块位于本脚本同级的 backend/ 目录。在Colab等环境中从其它工作目录运行时
+# 先把脚本所在目录加入搜索路径；这些模块只依赖numpy/pandas/scipy，缺少时在启动阶段即报错
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPT_DIR not in sys.path:
+    sys.path.append(_SCRIPT_DIR)
+
+from backend.models.msd_metadata import read_msd_metadata
+from backend.models.triplet_stream import TripletStreamParser
+from backend.models.topk_similarity import topk_similarity, save_topk_similarity
+from backend.models.param_search import search_svd_params, save_leaderboard
+from backend.models.columnar_store import save_table
+from backend.models.artifact_store import write_recommender_artifacts
+from backend.models.factor_scorer import extract_surprise_factors, save_factors
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -65,44 +79,23 @@ def download_data(from_drive=True, drive_msd_path=None, drive_triplets_path=None
     return msd_path, triplets_path
 
 def process_msd_metadata(h5_path, sample_size=None):
-    """处理MSD元数据"""
+    """处理MSD元数据
+    
+    只读取需要的字段，按行分块切片并整体解码字节串
+    """
     logger.info(f"从文件加载元数据: {h5_path}")
     
-    import h5py
     import numpy as np
-    import pandas as pd
     
-    with h5py.File(h5_path, 'r') as h5:
-        # 提取元数据字段
-        song_ids = h5['songs']['song_id'][:]
-        track_ids = h5['songs']['track_id'][:]
-        artist_ids = h5['songs']['artist_id'][:]
-        artist_names = h5['songs']['artist_name'][:]
-        titles = h5['songs']['title'][:]
-        
-        # 尝试获取更多元数据（如果存在）
-        release_years = h5['songs']['year'][:] if 'year' in h5['songs'] else np.zeros_like(song_ids)
-        artist_familiarity = h5['songs']['artist_familiarity'][:] if 'artist_familiarity' in h5['songs'] else np.zeros_like(song_ids)
-        artist_hotttnesss = h5['songs']['artist_hotttnesss'][:] if 'artist_hotttnesss' in h5['songs'] else np.zeros_like(song_ids)
-        
-    # 转换为字符串
-    song_ids = [s.decode('utf-8') for s in song_ids]
-    track_ids = [t.decode('utf-8') for t in track_ids]
-    artist_ids = [a.decode('utf-8') for a in artist_ids]
-    artist_names = [a.decode('utf-8') for a in artist_names]
-    titles = [t.decode('utf-8') for t in titles]
-    
-    # 创建DataFrame
-    metadata = pd.DataFrame({
-        'song_id': song_ids,
-        'track_id': track_ids,
-        'artist_id': artist_ids,
-        'artist_name': artist_names,
-        'track_name': titles,
-        'year': release_years,
-        'artist_familiarity': artist_familiarity,
-        'artist_hotttnesss': artist_hotttnesss
-    })
+    fields = ['song_id', 'track_id', 'artist_id', 'artist_name', 'title',
+              'year', 'artist_familiarity', 'artist_hotttnesss']
+    metadata = read_msd_metadata(h5_path, fields=fields)
+    metadata = metadata.rename(columns={'title': 'track_name'})
+    
+    # 文件中没有的数值字段填0
+    for column in ('year', 'artist_familiarity', 'artist_hotttnesss'):
+        if column not in metadata.columns:
+            metadata[column] = np.zeros(len(metadata))
     
     # 采样（如果指定）
     if sample_size and len(metadata) > sample_size:
@@ -112,73 +105,36 @@ def process_msd_metadata(h5_path, sample_size=None):
     logger.info(f"元数据处理完成，共 {len(metadata)} 首歌曲")
     return metadata
 
-def process_msd_triplets(triplets_path, metadata_df, sample_size=None):
-    """处理用户播放记录数据"""
+def process_msd_triplets(triplets_path, metadata_df, sample_size=None, chunk_size=1000000):
+    """处理用户播放记录数据
+    
+    分块流式读取播放记录，一次遍历完成用户采样、歌曲过滤和ID编码，
+    峰值内存由分块大小决定
+    """
     logger.info(f"从文件加载用户播放记录: {triplets_path}")
     
-    import pandas as pd
-    from collections import defaultdict
-    
-    # 仅保留元数据中的歌曲ID，用于过滤播放记录
-    valid_song_ids = set(metadata_df['song_id'])
-    
-    # 读取播放记录（可能很大，使用分块处理）
-    user_plays = defaultdict(dict)  # {user_id: {song_id: play_count}}
-    
-    # 随机采样的用户ID集合
-    if sample_size:
-        sample_users = set()
-    
-    with open(triplets_path, 'r') as f:
-        # 首先统计用户和歌曲数量，用于决定采样策略
-        line_count = 0
-        for i, line in enumerate(f):
-            if i % 1000000 == 0:
-                logger.info(f"已处理 {i} 行...")
-            line_count += 1
-            
-            if sample_size and i < 1000000 and len(sample_users) < sample_size:
-                user_id = line.strip().split('\t')[0]
-                sample_users.add(user_id)
-    
-    logger.info(f"总行数: {line_count}")
-    
-    # 重新打开文件，提取播放记录
-    with open(triplets_path, 'r') as f:
-        for i, line in enumerate(f):
-            if i % 1000000 == 0:
-                logger.info(f"处理记录 {i}/{line_count}...")
-                
-            user_id, song_id, play_count = line.strip().split('\t')
-            play_count = int(play_count)
-            
-            # 如果采样，仅保留采样用户
-            if sample_size and user_id not in sample_users:
-                continue
-                
-            # 仅保留元数据中的歌曲
-            if song_id in valid_song_ids:
-                user_plays[user_id][song_id] = play_count
-    
-    # 转换为DataFrame格式
-    records = []
-    for user_id, songs in user_plays.items():
-        for song_id, play_count in songs.items():
-            # 根据播放次数计算评分(1-5)
-            rating = min(5, 1 + int(play_count / 5))
-            records.append({'user_id': user_id, 'song_id': song_id, 'play_count': play_count, 'rating': rating})
-    
-    triplets_df = pd.DataFrame(records)
+    import numpy as np
+    
+    # 仅保留元数据中的歌曲；采样时只取前100万行中出现的前sample_size个用户
+    parser = TripletStreamParser(metadata_df['song_id'], sample_size=sample_size, chunk_size=chunk_size)
+    triplets_df = parser.to_frame(triplets_path)
+    logger.info(f"总行数: {parser.n_lines}")
+    
+    # 根据播放次数计算评分(1-5)
+    triplets_df['rating'] = np.minimum(5, 1 + triplets_df['play_count'] // 5).astype(np.int8)
+    
     logger.info(f"处理了 {len(triplets_df)} 条用户-歌曲交互记录")
     
     return triplets_df
 
-def compute_song_similarity(metadata_df):
-    """计算歌曲内容相似度矩阵"""
+def compute_song_similarity(metadata_df, k=50, n_jobs=None):
+    """计算每首歌曲的Top-K内容相似歌曲
+    
+    按行分块计算TF-IDF余弦相似度，每首歌曲只保留K个近邻，不生成N×N矩阵
+    """
     logger.info("计算歌曲内容相似度...")
     
     from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
     import pandas as pd
     
     # 创建特征文本：艺术家名称 + 歌曲名称
@@ -188,43 +144,50 @@ def compute_song_similarity(metadata_df):
     vectorizer = TfidfVectorizer(min_df=2, max_df=0.8, stop_words='english')
     tfidf_matrix = vectorizer.fit_transform(metadata_df['features'])
     
-    # 计算相似度矩阵
-    similarity_matrix = cosine_similarity(tfidf_matrix)
+    # 分块计算Top-K相似度
+    neighbors, scores = topk_similarity(tfidf_matrix, k=k, n_jobs=n_jobs)
     
     # 创建歌曲ID映射
     song_indices = pd.Series(metadata_df.index, index=metadata_df['song_id'])
     
-    logger.info(f"相似度矩阵大小: {similarity_matrix.shape}")
-    return similarity_matrix, song_indices
+    logger.info(f"Top-K相似度大小: {neighbors.shape}")
+    return (neighbors, scores), song_indices
 
-def train_cf_model(triplets_df):
-    """训练协同过滤模型并寻找最佳参数"""
+def train_cf_model(triplets_df, n_workers=None, halving=True):
+    """训练协同过滤模型并寻找最佳参数
+    
+    参数组合×交叉验证折在进程池中并行评估，按折逐轮淘汰较差的参数组合
+    (successive halving)，然后用最佳参数在全部数据上训练
+    
+    Returns:
+        (模型, 最佳参数, 搜索排行榜)
+    """
     logger.info("训练协同过滤模型并寻找最佳参数...")
     
+    import numpy as np
+    import pandas as pd
     from surprise import Dataset, Reader, SVD
-    from surprise.model_selection import GridSearchCV
     
     # 准备数据
     reader = Reader(rating_scale=(1, 5))
-    if 'rating' in triplets_df.columns:
-        data = Dataset.load_from_df(triplets_df[['user_id', 'song_id', 'rating']], reader)
-    else:
-        # 如果没有rating列，使用play_count
-        data = Dataset.load_from_df(triplets_df[['user_id', 'song_id', 'play_count']], reader)
-    
-    # 定义参数网格
-    param_grid = {
-        'n_epochs': [20, 30],
-        'lr_all': [0.002, 0.005],
-        'reg_all': [0.02, 0.05, 0.1]
-    }
-    
-    # 使用SVD算法
-    gs = GridSearchCV(SVD, param_grid, measures=['rmse', 'mae'], cv=3)
-    gs.fit(data)
+    # 如果没有rating列，使用play_count
+    rating_col = 'rating' if 'rating' in triplets_df.columns else 'play_count'
+    data = Dataset.load_from_df(triplets_df[['user_id', 'song_id', rating_col]], reader)
+    
+    # 并行搜索参数网格(与原GridSearchCV相同)
+    user_codes, _ = pd.factorize(triplets_df['user_id'])
+    song_codes, _ = pd.factorize(triplets_df['song_id'])
+    leaderboard = search_svd_params(
+        user_codes,
+        song_codes,
+        triplets_df[rating_col].to_numpy(dtype=np.float32),
+        n_folds=3,
+        halving=halving,
+        n_workers=n_workers
+    )
     
     # 获取最佳参数
-    best_params = gs.best_params['rmse']
+    best_params = leaderboard[0]['params']
     logger.info(f"最佳参数: {best_params}")
     
     # 使用最佳参数训练完整模型
@@ -238,7 +201,7 @@ def train_cf_model(triplets_df):
     model.fit(trainset)
     
     logger.info("协同过滤模型训练完成")
-    return model, best_params
+    return model, best_params, leaderboard
 
 def extract_popular_songs(triplets_df, metadata_df, top_n=100):
     """提取热门歌曲"""
@@ -257,26 +220,22 @@ def extract_popular_songs(triplets_df, metadata_df, top_n=100):
     logger.info(f"已提取 {len(popular_with_metadata)} 首热门歌曲")
     return popular_with_metadata
 
-def save_processed_data(metadata_df, triplets_df, similarity_matrix, song_indices, cf_model, best_params, popular_songs, output_dir):
+def save_processed_data(metadata_df, triplets_df, similarity, song_indices, cf_model, best_params, popular_songs, output_dir,
+                        leaderboard=None):
     """保存处理好的数据和模型"""
     os.makedirs(output_dir, exist_ok=True)
     logger.info(f"保存结果到目录: {output_dir}")
     
-    # 保存元数据
-    metadata_file = os.path.join(output_dir, 'songs_metadata.pkl')
-    metadata_df.to_pickle(metadata_file)
+    # 以列式格式保存元数据和用户-歌曲交互数据(未安装pyarrow时为CSV)
+    metadata_file = save_table(metadata_df, output_dir, 'songs_metadata')
     logger.info(f"已保存元数据: {metadata_file}")
     
-    # 保存用户-歌曲交互数据
-    triplets_file = os.path.join(output_dir, 'user_song_plays.pkl')
-    triplets_df.to_pickle(triplets_file)
+    triplets_file = save_table(triplets_df, output_dir, 'user_song_plays')
     logger.info(f"已保存用户-歌曲交互数据: {triplets_file}")
     
-    # 保存相似度矩阵和索引
-    similarity_file = os.path.join(output_dir, 'song_similarity.pkl')
-    with open(similarity_file, 'wb') as f:
-        pickle.dump((similarity_matrix, song_indices), f)
-    logger.info(f"已保存相似度矩阵: {similarity_file}")
+    # 保存Top-K相似度(按metadata_df的行顺序)
+    neighbors, scores = similarity
+    save_topk_similarity(output_dir, 'song_similarity', song_indices.index, neighbors, scores)
     
     # 保存协同过滤模型
     model_file = os.path.join(output_dir, 'cf_model.pkl')
@@ -290,18 +249,25 @@ def save_processed_data(metadata_df, triplets_df, similarity_matrix, song_indice
         json.dump(best_params, f, indent=4)
     logger.info(f"已保存最佳参数: {params_file}")
     
+    # 保存超参数搜索排行榜
+    if leaderboard is not None:
+        save_leaderboard(os.path.join(output_dir, 'cf_search_leaderboard.json'), leaderboard)
+    
     # 保存热门歌曲
-    popular_file = os.path.join(output_dir, 'popular_songs.pkl')
-    popular_songs.to_pickle(popular_file)
+    popular_file = save_table(popular_songs, output_dir, 'popular_songs')
     logger.info(f"已保存热门歌曲: {popular_file}")
     
+    # 写入推荐服务以内存映射方式加载的产物版本(含协同过滤模型的因子数组)
+    save_factors(os.path.join(output_dir, 'cf_factors.npz'), extract_surprise_factors(cf_model))
+    write_recommender_artifacts(output_dir, metadata_df, triplets_df)
+    
     # 创建README记录处理信息
     readme_file = os.path.join(output_dir, 'README.txt')
     with open(readme_file, 'w') as f:
         f.write(f"处理时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"元数据数量: {len(metadata_df)}\n")
         f.write(f"用户-歌曲交互记录数量: {len(triplets_df)}\n")
-        f.write(f"相似度矩阵大小: {similarity_matrix.shape}\n")
+        f.write(f"Top-K相似度大小: {similarity[0].shape}\n")
         f.write(f"协同过滤最佳参数: {best_params}\n")
         f.write(f"热门歌曲数量: {len(popular_songs)}\n")
     logger.info(f"已创建处理信息记录: {readme_file}")
@@ -344,6 +310,8 @@ def main():
     parser.add_argument('--triplets-path', type=str,
                         default='/content/drive/MyDrive/train_triplets.txt',
                         help='用户播放记录文件路径')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='超参数搜索的并行进程数，默认为CPU核数')
     
     args = parser.parse_args()
     
@@ -377,10 +345,10 @@ def main():
     triplets_df = process_msd_triplets(triplets_path, metadata_df, sample_size=sample_size)
     
     # 7. 计算歌曲内容相似度
-    similarity_matrix, song_indices = compute_song_similarity(metadata_df)
+    similarity, song_indices = compute_song_similarity(metadata_df)
     
     # 8. 训练协同过滤模型
-    cf_model, best_params = train_cf_model(triplets_df)
+    cf_model, best_params, leaderboard = train_cf_model(triplets_df, n_workers=args.workers)
     
     # 9. 提取热门歌曲
     popular_songs = extract_popular_songs(triplets_df, metadata_df)
@@ -389,12 +357,13 @@ def main():
     save_processed_data(
         metadata_df=metadata_df,
         triplets_df=triplets_df,
-        similarity_matrix=similarity_matrix,
+        similarity=similarity,
         song_indices=song_indices,
         cf_model=cf_model,
         best_params=best_params,
         popular_songs=popular_songs,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        leaderboard=leaderboard
     )
     
     # 11. 压缩并下载结果
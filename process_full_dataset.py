@@ -10,6 +10,7 @@ import sys
 import logging
 import argparse
 from backend.data.data_processing import process_data
+from backend.models.columnar_store import find_table, read_table_file
 
 # 配置日志
 logging.basicConfig(
@@ -28,6 +29,8 @@ def main():
                        help='输出目录，处理后的数据将保存在这里')
     parser.add_argument('--force', action='store_true',
                        help='强制重新处理，即使输出文件已存在')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                       help='处理全部数据时按字节范围分片的并行进程数')
     
     args = parser.parse_args()
     
@@ -46,11 +49,10 @@ def main():
     # 检查输出目录
     if os.path.exists(args.output_dir) and not args.force:
         # 检查是否已经处理过数据
-        songs_metadata_file = os.path.join(args.output_dir, 'songs_metadata.pkl')
-        if os.path.exists(songs_metadata_file):
-            import pandas as pd
+        songs_metadata_file = find_table(args.output_dir, 'songs_metadata')
+        if songs_metadata_file is not None:
             try:
-                songs_metadata = pd.read_pickle(songs_metadata_file)
+                songs_metadata = read_table_file(songs_metadata_file, columns=['song_id'])
                 logger.info(f"已存在处理好的数据，包含 {len(songs_metadata)} 首歌曲")
                 logger.info("如果要重新处理，请使用 --force 参数")
                 return True
@@ -61,12 +63,14 @@ def main():
     os.environ['SAMPLE_SIZE'] = str(args.sample_size)
     
     # 处理数据
-    logger.info(f"开始处理数据，采样大小: {args.sample_size if args.sample_size > 0 else '全部数据'}")
+    logger.info(f"开始处理数据，采样大小: {args.sample_size if args.sample_size > 0 else '全部数据'}，"
+                f"并行进程数: {args.workers}")
     success = process_data(
         data_dir=args.data_dir,
         output_dir=args.output_dir,
         use_msd=True,
-        sample_size=args.sample_size if args.sample_size > 0 else None
+        sample_size=args.sample_size if args.sample_size > 0 else None,
+        workers=args.workers
     )
     
     if success:
@@ -22,6 +22,7 @@ import logging
 import pickle
 import json
 import time
+import argparse
 import random
 from datetime import datetime
 from tqdm.notebook import tqdm
@@ -53,8 +54,7 @@ if IN_COLAB:
 try:
     from surprise import SVD, SVDpp, Dataset, Reader
     from surprise.model_selection import cross_validate, train_test_split
-    from sklearn.metrics.pairwise import cosine_similarity
-    from sklearn.preprocessing import StandardScaler, LabelEncoder
+    from sklearn.preprocessing import StandardScaler
     from sklearn.decomposition import PCA
     import tensorflow as tf
     from tensorflow.keras.models import Model, Sequential, load_model, save_model
@@ -92,6 +92,7 @@ class MusicRecommenderTrainer:
         self.user_ratings = None  # 用户评分数据
         self.songs_df = None      # 歌曲元数据
         self.interactions_df = None  # 用户-歌曲交互
+        self.interactions_file = None  # 交互表文件，NCF/MLP训练时按块读取
         
         # 模型存储
         self.svdpp_model = None   # SVD++模型
@@ -99,9 +100,9 @@ class MusicRecommenderTrainer:
         self.mlp_model = None     # 多层感知机模型
         self.content_model = None # 内容特征模型
         
-        # 编码器
-        self.user_encoder = LabelEncoder()
-        self.item_encoder = LabelEncoder()
+        # 用户/歌曲ID字典(backend/models/id_dictionary.py)
+        self.user_ids = None
+        self.item_ids = None
         
         # 配置GPU
         if self.use_gpu:
@@ -133,33 +134,42 @@ class MusicRecommenderTrainer:
             interactions_file: 用户-歌曲交互文件路径
             create_sample: 是否创建样本数据
         """
-        # 设置默认文件路径
+        from backend.models.columnar_store import find_table, read_table_file
+        
+        # 设置默认文件路径: 优先使用Parquet/Feather，其次是旧的CSV
         if songs_file is None:
-            songs_file = os.path.join(self.data_dir, 'songs.csv')
+            songs_file = find_table(self.data_dir, 'songs')
         if interactions_file is None:
-            interactions_file = os.path.join(self.data_dir, 'user_song_interactions.csv')
+            interactions_file = find_table(self.data_dir, 'user_song_interactions')
         
         # 检查是否存在文件
-        if not os.path.exists(songs_file) or not os.path.exists(interactions_file):
+        if songs_file is None or interactions_file is None or \
+                not os.path.exists(songs_file) or not os.path.exists(interactions_file):
             if create_sample:
                 logger.info("数据文件不存在，创建样本数据...")
-                self._create_sample_data(songs_file, interactions_file)
+                self._create_sample_data()
+                songs_file = find_table(self.data_dir, 'songs')
+                interactions_file = find_table(self.data_dir, 'user_song_interactions')
             else:
                 logger.error("数据文件不存在且不创建样本数据")
                 return False
         
         try:
+            self.interactions_file = interactions_file
+            
             # 加载歌曲数据
-            self.songs_df = pd.read_csv(songs_file)
+            self.songs_df = read_table_file(songs_file)
             logger.info(f"加载了 {len(self.songs_df)} 首歌曲的元数据")
             
-            # 加载交互数据
-            self.interactions_df = pd.read_csv(interactions_file)
+            # 加载交互数据，只读取训练需要的列(时间戳用于记录增量训练的水位线，可以没有)
+            try:
+                self.interactions_df = read_table_file(interactions_file, columns=['user_id', 'song_id', 'rating', 'timestamp'])
+            except (KeyError, ValueError):
+                self.interactions_df = read_table_file(interactions_file, columns=['user_id', 'song_id', 'rating'])
             logger.info(f"加载了 {len(self.interactions_df)} 条用户-歌曲交互记录")
             
             # 编码用户和物品ID
-            self.user_encoder.fit(self.interactions_df['user_id'].unique())
-            self.item_encoder.fit(self.interactions_df['song_id'].unique())
+            self._build_id_dictionaries()
             
             # 构建用户评分字典
             self.user_ratings = defaultdict(dict)
@@ -173,13 +183,20 @@ class MusicRecommenderTrainer:
             logger.error(f"加载数据时出错: {str(e)}")
             return False
     
-    def _create_sample_data(self, songs_file, interactions_file):
-        """创建样本数据
+    def _build_id_dictionaries(self):
+        """加载数据目录中共享的用户/歌曲ID字典，追加交互数据中的新ID后写回
         
-        Args:
-            songs_file: 歌曲元数据输出文件路径
-            interactions_file: 用户-歌曲交互输出文件路径
+        字典与数据处理脚本、产物写入和在线服务共用，已有用户和歌曲的编码不变，
+        热启动训练可以直接沿用上次的嵌入行
         """
+        from backend.models.id_dictionary import IdDictionary, USER_DICTIONARY, SONG_DICTIONARY
+        
+        self.user_ids = IdDictionary.load_and_extend(self.data_dir, USER_DICTIONARY, self.interactions_df['user_id'])
+        self.item_ids = IdDictionary.load_and_extend(self.data_dir, SONG_DICTIONARY, self.interactions_df['song_id'])
+        logger.info(f"ID字典: {len(self.user_ids)} 个用户, {len(self.item_ids)} 首歌曲")
+    
+    def _create_sample_data(self):
+        """创建样本数据，以列式格式保存在数据目录中"""
         try:
             # 样本歌曲数据
             sample_songs = []
@@ -231,14 +248,14 @@ class MusicRecommenderTrainer:
                 self.user_ratings[row['user_id']][row['song_id']] = row['rating']
             
             # 保存样本数据
-            self.songs_df.to_csv(songs_file, index=False)
-            self.interactions_df.to_csv(interactions_file, index=False)
+            from backend.models.columnar_store import save_table
+            save_table(self.songs_df, self.data_dir, 'songs')
+            save_table(self.interactions_df, self.data_dir, 'user_song_interactions')
             
             logger.info(f"创建了样本数据: {len(self.songs_df)}首歌曲, {len(self.interactions_df)}条交互记录")
             
             # 编码用户和物品ID
-            self.user_encoder.fit(self.interactions_df['user_id'].unique())
-            self.item_encoder.fit(self.interactions_df['song_id'].unique())
+            self._build_id_dictionaries()
             
             return True
             
@@ -265,10 +282,7 @@ class MusicRecommenderTrainer:
                 self.songs_df[feature_columns] = scaler.fit_transform(self.songs_df[feature_columns])
                 logger.info(f"标准化了歌曲特征: {feature_columns}")
             
-            # 为NCF和MLP准备数据
-            # 编码用户ID和歌曲ID为整数
-            self.interactions_df['user_idx'] = self.user_encoder.transform(self.interactions_df['user_id'])
-            self.interactions_df['song_idx'] = self.item_encoder.transform(self.interactions_df['song_id'])
+            # NCF和MLP训练时按块读取交互表，用ID字典编码，这里不再为整张表生成编码列
             
             logger.info("数据预处理完成")
             return True
@@ -337,7 +351,30 @@ class MusicRecommenderTrainer:
             logger.error(f"训练SVD++模型时出错: {str(e)}")
             return None
     
-    def train_ncf(self, embedding_dim=100, layers=[256, 128, 64], lr=0.001, epochs=20, batch_size=256):
+    def _training_batches(self, batch_size, negatives, where=None, holdout=0.0):
+        """构建NCF/MLP训练用的小批量生成器
+        
+        按块读取交互表并用ID字典编码，不把整张表的编码数组放进内存。
+        负样本的目标值为0，正样本为缩放到0-1的评分；负样本排除整张交互表中用户听过的歌曲
+        
+        Args:
+            batch_size: 每批的正样本数
+            negatives: 每个正样本配的负样本数
+            where: 只在部分交互上训练时的筛选函数 fn(块DataFrame, 块起始行号) -> 布尔数组
+            holdout: 随机划为测试集的交互比例
+            
+        Returns:
+            InteractionBatches实例，测试集在其 holdout 属性中
+        """
+        from backend.models.interaction_batches import InteractionBatches
+        
+        batches = InteractionBatches.from_table(self.interactions_file, self.user_ids, self.item_ids,
+                                                where=where, holdout=holdout,
+                                                batch_size=batch_size, negatives=negatives)
+        logger.info(f"训练数据: 每个epoch {len(batches)} 批, 每批最多 {batches.samples_per_batch} 个样本")
+        return batches
+    
+    def train_ncf(self, embedding_dim=100, layers=[256, 128, 64], lr=0.001, epochs=20, batch_size=256, negatives=4):
         """训练神经协同过滤模型
         
         Args:
@@ -345,7 +382,8 @@ class MusicRecommenderTrainer:
             layers: 神经网络层结构
             lr: 学习率
             epochs: 训练轮数
-            batch_size: 批次大小
+            batch_size: 批次大小(每批的正样本数)
+            negatives: 每个正样本配的负样本数
             
         Returns:
             训练好的NCF模型
@@ -358,29 +396,13 @@ class MusicRecommenderTrainer:
             logger.info(f"开始训练NCF模型: embedding_dim={embedding_dim}, layers={layers}")
             start_time = time.time()
             
-            # 准备数据
-            user_input = self.interactions_df['user_idx'].values
-            item_input = self.interactions_df['song_idx'].values
-            ratings = self.interactions_df['rating'].values / 5.0  # 缩放到0-1
-            
             # 用户和物品的数量
-            num_users = len(self.user_encoder.classes_)
-            num_items = len(self.item_encoder.classes_)
-            
-            # 划分训练集和测试集
-            indices = np.arange(len(self.interactions_df))
-            np.random.shuffle(indices)
-            
-            train_indices = indices[:int(0.8 * len(indices))]
-            test_indices = indices[int(0.8 * len(indices)):]
+            num_users = len(self.user_ids)
+            num_items = len(self.item_ids)
             
-            user_input_train = user_input[train_indices]
-            item_input_train = item_input[train_indices]
-            ratings_train = ratings[train_indices]
-            
-            user_input_test = user_input[test_indices]
-            item_input_test = item_input[test_indices]
-            ratings_test = ratings[test_indices]
+            # 按块读取交互表，随机划出20%作为测试集
+            train_batches = self._training_batches(batch_size, negatives, holdout=0.2)
+            test_batches = train_batches.holdout
             
             # 构建NCF模型
             # 用户嵌入
@@ -419,19 +441,19 @@ class MusicRecommenderTrainer:
                 )
             ]
             
-            # 训练模型
+            # 训练模型: 后台线程读取分片、打乱并生成负样本，与训练过程重叠
             history = self.ncf_model.fit(
-                [user_input_train, item_input_train],
-                ratings_train,
-                batch_size=batch_size,
+                train_batches.to_tf_dataset(),
+                steps_per_epoch=len(train_batches),
                 epochs=epochs,
-                validation_data=([user_input_test, item_input_test], ratings_test),
+                validation_data=test_batches.to_tf_dataset(),
+                validation_steps=len(test_batches),
                 callbacks=callbacks,
                 verbose=1
             )
             
             # 评估模型
-            loss, mae = self.ncf_model.evaluate([user_input_test, item_input_test], ratings_test, verbose=0)
+            loss, mae = self.ncf_model.evaluate(test_batches.to_tf_dataset(), steps=len(test_batches), verbose=0)
             rmse = np.sqrt(loss) * 5  # 转换回原始评分范围
             
             # 保存模型
@@ -444,13 +466,18 @@ class MusicRecommenderTrainer:
                 'layers': layers,
                 'num_users': num_users,
                 'num_items': num_items,
-                'user_encoder': self.user_encoder.classes_.tolist(),
-                'item_encoder': self.item_encoder.classes_.tolist()
+                'user_dictionary': 'user',
+                'item_dictionary': 'song'
             }
             
             with open(os.path.join(self.output_dir, 'ncf_model_config.json'), 'w') as f:
                 json.dump(model_config, f)
             
+            # 导出NumPy权重，在线服务无需加载TensorFlow
+            from backend.models.neural_scorer import export_keras_model
+            export_keras_model(self.ncf_model, model_config, os.path.join(self.output_dir, 'ncf_weights.npz'),
+                               model_dir=self.data_dir)
+            
             end_time = time.time()
             logger.info(f"NCF模型训练完成，用时: {end_time - start_time:.2f}秒")
             logger.info(f"测试集RMSE: {rmse:.4f}, MAE: {mae*5:.4f}")
@@ -484,7 +511,7 @@ class MusicRecommenderTrainer:
             logger.error(f"训练NCF模型时出错: {str(e)}")
             return None
     
-    def train_mlp(self, embedding_dim=64, layers=[128, 64, 32], lr=0.001, epochs=20, batch_size=256):
+    def train_mlp(self, embedding_dim=64, layers=[128, 64, 32], lr=0.001, epochs=20, batch_size=256, negatives=4):
         """训练多层感知机模型
         
         Args:
@@ -492,7 +519,8 @@ class MusicRecommenderTrainer:
             layers: 神经网络层结构
             lr: 学习率
             epochs: 训练轮数
-            batch_size: 批次大小
+            batch_size: 批次大小(每批的正样本数)
+            negatives: 每个正样本配的负样本数
             
         Returns:
             训练好的MLP模型
@@ -505,29 +533,13 @@ class MusicRecommenderTrainer:
             logger.info(f"开始训练MLP模型: embedding_dim={embedding_dim}, layers={layers}")
             start_time = time.time()
             
-            # 准备数据
-            user_input = self.interactions_df['user_idx'].values
-            item_input = self.interactions_df['song_idx'].values
-            ratings = self.interactions_df['rating'].values / 5.0  # 缩放到0-1
-            
             # 用户和物品的数量
-            num_users = len(self.user_encoder.classes_)
-            num_items = len(self.item_encoder.classes_)
-            
-            # 划分训练集和测试集
-            indices = np.arange(len(self.interactions_df))
-            np.random.shuffle(indices)
+            num_users = len(self.user_ids)
+            num_items = len(self.item_ids)
             
-            train_indices = indices[:int(0.8 * len(indices))]
-            test_indices = indices[int(0.8 * len(indices)):]
-            
-            user_input_train = user_input[train_indices]
-            item_input_train = item_input[train_indices]
-            ratings_train = ratings[train_indices]
-            
-            user_input_test = user_input[test_indices]
-            item_input_test = item_input[test_indices]
-            ratings_test = ratings[test_indices]
+            # 按块读取交互表，随机划出20%作为测试集
+            train_batches = self._training_batches(batch_size, negatives, holdout=0.2)
+            test_batches = train_batches.holdout
             
             # 构建MLP模型
             # 用户输入和嵌入
@@ -566,19 +578,19 @@ class MusicRecommenderTrainer:
                 )
             ]
             
-            # 训练模型
+            # 训练模型: 后台线程读取分片、打乱并生成负样本，与训练过程重叠
             history = self.mlp_model.fit(
-                [user_input_train, item_input_train],
-                ratings_train,
-                batch_size=batch_size,
+                train_batches.to_tf_dataset(),
+                steps_per_epoch=len(train_batches),
                 epochs=epochs,
-                validation_data=([user_input_test, item_input_test], ratings_test),
+                validation_data=test_batches.to_tf_dataset(),
+                validation_steps=len(test_batches),
                 callbacks=callbacks,
                 verbose=1
             )
             
             # 评估模型
-            loss, mae = self.mlp_model.evaluate([user_input_test, item_input_test], ratings_test, verbose=0)
+            loss, mae = self.mlp_model.evaluate(test_batches.to_tf_dataset(), steps=len(test_batches), verbose=0)
             rmse = np.sqrt(loss) * 5  # 转换回原始评分范围
             
             # 保存模型
@@ -591,13 +603,18 @@ class MusicRecommenderTrainer:
                 'layers': layers,
                 'num_users': num_users,
                 'num_items': num_items,
-                'user_encoder': self.user_encoder.classes_.tolist(),
-                'item_encoder': self.item_encoder.classes_.tolist()
+                'user_dictionary': 'user',
+                'item_dictionary': 'song'
             }
             
             with open(os.path.join(self.output_dir, 'mlp_model_config.json'), 'w') as f:
                 json.dump(model_config, f)
             
+            # 导出NumPy权重，在线服务无需加载TensorFlow
+            from backend.models.neural_scorer import export_keras_model
+            export_keras_model(self.mlp_model, model_config, os.path.join(self.output_dir, 'mlp_weights.npz'),
+                               model_dir=self.data_dir)
+            
             end_time = time.time()
             logger.info(f"MLP模型训练完成，用时: {end_time - start_time:.2f}秒")
             logger.info(f"测试集RMSE: {rmse:.4f}, MAE: {mae*5:.4f}")
@@ -684,12 +701,10 @@ class MusicRecommenderTrainer:
                     'feature_columns': feature_columns
                 }, f)
             
-            # 计算歌曲相似度矩阵
-            similarity_matrix = cosine_similarity(song_features)
-            
-            # 保存相似度矩阵
-            similarity_path = os.path.join(self.output_dir, 'song_similarity_matrix.npy')
-            np.save(similarity_path, similarity_matrix)
+            # 分块计算每首歌曲的Top-K相似歌曲，不生成N×N矩阵
+            from backend.models.topk_similarity import topk_similarity, save_topk_similarity
+            neighbors, scores = topk_similarity(song_features, k=50)
+            save_topk_similarity(self.output_dir, 'song_similarity', self.songs_df['song_id'], neighbors, scores)
             
             # 保存歌曲ID映射
             song_id_map = {i: song_id for i, song_id in enumerate(self.songs_df['song_id'])}
@@ -716,6 +731,161 @@ class MusicRecommenderTrainer:
             logger.error(f"训练内容特征模型时出错: {str(e)}")
             return None
     
+    def _watermark_root(self):
+        """记录训练水位线的产物根目录"""
+        return os.path.join(self.output_dir, 'artifacts')
+    
+    def _record_watermark(self, name):
+        """记录模型训练到的交互数据水位线"""
+        from backend.models.artifact_store import interactions_watermark, write_watermark
+        
+        try:
+            write_watermark(self._watermark_root(), name, interactions_watermark(self.interactions_df))
+        except Exception as e:
+            logger.error(f"记录{name}模型的水位线时出错: {str(e)}")
+    
+    def _new_interactions(self, name):
+        """取某个模型上次训练之后新增的交互
+        
+        Returns:
+            新增交互的DataFrame，没有水位线记录时返回None
+        """
+        from backend.models.artifact_store import read_watermark
+        from backend.models.warm_start import new_interactions
+        
+        return new_interactions(self.interactions_df, read_watermark(self._watermark_root(), name))
+    
+    def warm_start_svdpp(self, new_df, epochs=2, lr=0.005, reg=0.02):
+        """在新增交互上继续训练SVD++因子
+        
+        从 svdpp_factors.npz(或 svdpp_model.pkl)读取上次的因子，新用户和新歌曲追加随机向量，
+        只在新增交互上做少量轮次的SGD，结果写回 svdpp_factors.npz 供推荐引擎加载；
+        svdpp_model.pkl 保持上次全量训练的结果。
+        
+        Args:
+            new_df: 水位线之后新增的交互
+            epochs: 训练轮数
+            lr: 学习率
+            reg: 正则化系数
+            
+        Returns:
+            更新后的因子字典，没有上次的模型时返回None
+        """
+        from backend.models.factor_scorer import FactorScorer, save_factors
+        from backend.models.warm_start import warm_start_factors
+        
+        try:
+            scorer = FactorScorer.load(self.output_dir, 'svdpp')
+            if scorer is None:
+                return None
+            
+            logger.info(f"开始热启动SVD++模型: {len(new_df)}条新增交互, {epochs}轮")
+            start_time = time.time()
+            factors = {
+                'user_factors': scorer.user_factors,
+                'item_factors': scorer.item_factors,
+                'user_bias': scorer.user_bias,
+                'item_bias': scorer.item_bias,
+                'global_mean': scorer.global_mean,
+                'user_ids': np.asarray(scorer.user_index, dtype=str),
+                'item_ids': np.asarray(scorer.item_index, dtype=str),
+            }
+            factors = warm_start_factors(factors, new_df, n_epochs=epochs, lr=lr, reg=reg)
+            save_factors(os.path.join(self.output_dir, 'svdpp_factors.npz'), factors)
+            
+            logger.info(f"SVD++模型热启动完成，用时: {time.time() - start_time:.2f}秒")
+            return factors
+            
+        except Exception as e:
+            logger.error(f"热启动SVD++模型时出错: {str(e)}")
+            return None
+    
+    def warm_start_neural(self, name, new_df, epochs=2, lr=0.0005, batch_size=256, negatives=4):
+        """在新增交互上继续训练NCF/MLP模型
+        
+        加载上次保存的模型，ID字典有新用户/新歌曲时按新的数量重建模型，
+        嵌入层保留已有的行、新增行随机初始化，其余层的权重原样复制。
+        
+        Args:
+            name: 模型名称，'ncf' 或 'mlp'
+            new_df: 水位线之后新增的交互
+            epochs: 训练轮数
+            lr: 学习率，比全量训练小，避免冲掉已学到的权重
+            batch_size: 批次大小(每批的正样本数)
+            negatives: 每个正样本配的负样本数
+            
+        Returns:
+            更新后的模型，没有上次的模型时返回None
+        """
+        from backend.models.artifact_store import read_watermark
+        from backend.models.warm_start import extend_rows, new_interactions_mask
+        
+        model_path = os.path.join(self.output_dir, f'{name}_model.h5')
+        config_path = os.path.join(self.output_dir, f'{name}_model_config.json')
+        if not (os.path.exists(model_path) and os.path.exists(config_path)):
+            return None
+        
+        try:
+            logger.info(f"开始热启动{name.upper()}模型: {len(new_df)}条新增交互, {epochs}轮")
+            start_time = time.time()
+            
+            old_model = load_model(model_path)
+            with open(config_path, 'r') as f:
+                model_config = json.load(f)
+            
+            num_users = len(self.user_ids)
+            num_items = len(self.item_ids)
+            
+            # 按新的用户/歌曲数量重建模型结构，嵌入层的新增行随机初始化
+            sizes = {'user_embedding': num_users, 'item_embedding': num_items}
+            architecture = old_model.get_config()
+            for layer in architecture['layers']:
+                if layer['config']['name'] in sizes:
+                    layer['config']['input_dim'] = sizes[layer['config']['name']]
+            model = Model.from_config(architecture)
+            rng = np.random.default_rng()
+            for layer in model.layers:
+                weights = old_model.get_layer(layer.name).get_weights()
+                if layer.name in sizes:
+                    weights = [extend_rows(weights[0], sizes[layer.name], init_std=0.05, rng=rng)]
+                layer.set_weights(weights)
+            model.compile(optimizer=Adam(lr=lr), loss='mse', metrics=['mae'])
+            
+            # 只在水位线之后新增的交互上训练，负样本仍排除用户全部历史中听过的歌曲
+            watermark = read_watermark(self._watermark_root(), name)
+            train_batches = self._training_batches(
+                batch_size, negatives, where=lambda chunk, start: new_interactions_mask(chunk, watermark, start))
+            model.fit(
+                train_batches.to_tf_dataset(),
+                steps_per_epoch=len(train_batches),
+                epochs=epochs,
+                verbose=1
+            )
+            
+            # 保存模型和配置
+            model.save(model_path)
+            model_config.update({
+                'num_users': num_users,
+                'num_items': num_items,
+                'user_dictionary': 'user',
+                'item_dictionary': 'song'
+            })
+            with open(config_path, 'w') as f:
+                json.dump(model_config, f)
+            
+            # 导出NumPy权重，在线服务无需加载TensorFlow
+            from backend.models.neural_scorer import export_keras_model
+            export_keras_model(model, model_config, os.path.join(self.output_dir, f'{name}_weights.npz'),
+                               model_dir=self.data_dir)
+            setattr(self, f'{name}_model', model)
+            
+            logger.info(f"{name.upper()}模型热启动完成，用时: {time.time() - start_time:.2f}秒")
+            return model
+            
+        except Exception as e:
+            logger.error(f"热启动{name.upper()}模型时出错: {str(e)}")
+            return None
+    
     def load_models(self):
         """加载训练好的模型"""
         try:
@@ -754,25 +924,40 @@ class MusicRecommenderTrainer:
             logger.error(f"加载模型时出错: {str(e)}")
             return False
     
-    def train_all_models(self):
-        """训练所有模型"""
+    def train_all_models(self, warm_start=False, warm_epochs=2):
+        """训练所有模型
+        
+        Args:
+            warm_start: 是否热启动: 沿用上次的模型，只在水位线之后新增的交互上训练
+                warm_epochs 轮；没有上次的模型或水位线时仍全量训练
+            warm_epochs: 热启动训练轮数
+        """
         # 预处理数据
         logger.info("开始数据预处理...")
         self.preprocess_data()
         
-        # 训练SVD++模型
-        logger.info("开始训练SVD++模型...")
-        self.train_svdpp()
-        
-        # 训练NCF模型
-        logger.info("开始训练NCF模型...")
-        self.train_ncf()
+        trainers = [
+            ('svdpp', 'SVD++', self.train_svdpp, lambda new_df: self.warm_start_svdpp(new_df, warm_epochs)),
+            ('ncf', 'NCF', self.train_ncf, lambda new_df: self.warm_start_neural('ncf', new_df, warm_epochs)),
+            ('mlp', 'MLP', self.train_mlp, lambda new_df: self.warm_start_neural('mlp', new_df, warm_epochs)),
+        ]
+        for name, label, train, warm_train in trainers:
+            new_df = self._new_interactions(name) if warm_start else None
+            if new_df is not None and len(new_df) == 0:
+                logger.info(f"{label}模型没有新增交互，跳过训练")
+                continue
+            if new_df is not None:
+                logger.info(f"开始热启动{label}模型...")
+                if warm_train(new_df) is not None:
+                    self._record_watermark(name)
+                    continue
+                logger.info(f"没有可热启动的{label}模型，改为全量训练")
+            
+            logger.info(f"开始训练{label}模型...")
+            if train() is not None:
+                self._record_watermark(name)
         
-        # 训练MLP模型
-        logger.info("开始训练MLP模型...")
-        self.train_mlp()
-        
-        # 训练内容特征模型
+        # 训练内容特征模型(只依赖歌曲元数据，每次全量计算)
         logger.info("开始训练内容特征模型...")
         self.train_content_model()
         
@@ -802,6 +987,13 @@ def download_models_to_local(models_dir, local_dir='../backend/models/trained_mo
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='训练音乐推荐模型')
+    parser.add_argument('--warm_start', action='store_true',
+                        help='热启动: 沿用上次的模型，只在新增交互上训练')
+    parser.add_argument('--warm_epochs', type=int, default=2, help='热启动训练轮数')
+    # Colab/Jupyter内核会传入额外的命令行参数
+    args, _ = parser.parse_known_args()
+    
     # 设置随机种子
     np.random.seed(42)
     tf.random.set_seed(42)
@@ -820,7 +1012,7 @@ def main():
         return
     
     # 训练所有模型
-    trainer.train_all_models()
+    trainer.train_all_models(warm_start=args.warm_start, warm_epochs=args.warm_epochs)
     
     # 准备下载模型
     download_models_to_local('./models')